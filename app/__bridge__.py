@@ -1,14 +1,33 @@
 import os
 from flask import Flask
-from dotenv import load_dotenv
 from app.routes.routes import routes  # ✅ Corrected import
 from datetime import timedelta
 from app.extensions.mail import mail
+from app.extensions.mail_queue import mail_queue
+from app.extensions.hashing import hasher
+from app.extensions.chat import chat
+from app.extensions.event_bus import event_bus
+from app.extensions.notifications import notifications
+from app.extensions import migrations
+from app.extensions.profile_cache import profile_cache
+from app.extensions.oauth import oauth_registry
+from app.extensions.provisioning import provisioner
+from app.extensions.analytics import analytics
+from app.extensions.presence import presence
+from app.extensions.read_state import read_state
+from app.extensions.search import search
+from app.extensions.sessions import server_sessions
+from app.extensions.tokens import tokens
+from app.extensions.metrics import metrics
+from app.extensions.assets import assets
+from app.extensions.templating import templating
+from app.extensions.avatars import avatars
+from app.extensions.throttle import throttle
+from app.routes.postgresql import init_db_pool
 
 #───────────────────────────────────────────────────────────────────────────────────────────────────────────────────
-# Load environment variables from .env
-#───────────────────────────────────────────────────────────────────────────────────────────────────────────────────
-load_dotenv()
+# .env is loaded once per process by the entry point (run.py / gunicorn.conf.py), before this import.
+# Provider SDKs (google-auth, flask_dance, requests) are imported on first use by their routes.
 #───────────────────────────────────────────────────────────────────────────────────────────────────────────────────
 def create_app():
     app = Flask(__name__)
@@ -37,19 +56,150 @@ def create_app():
     # Set session expiration time (ensure it's in the create_app function)
     app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(minutes=30)
             # Flask-Mail config using environment variables
-    app.config['MAIL_SERVER'] = 'smtp.gmail.com'
-    app.config['MAIL_PORT'] = 587
-    app.config['MAIL_USE_TLS'] = True
+    app.config['MAIL_SERVER'] = os.getenv('MAIL_SERVER', 'smtp.gmail.com')
+    app.config['MAIL_PORT'] = int(os.getenv('MAIL_PORT', 587))
+    app.config['MAIL_USE_TLS'] = os.getenv('MAIL_USE_TLS', 'true').lower() == 'true'
     app.config['MAIL_USERNAME'] = os.getenv('MAIL_USERNAME')
     app.config['MAIL_PASSWORD'] = os.getenv('MAIL_PASSWORD')
     app.config['MAIL_DEFAULT_SENDER'] = os.getenv('MAIL_USERNAME')
 
-    app.config['UPLOAD_FOLDER'] = 'static/background/'
+    # Avatar uploads live outside static/ (instance/avatars by default) and are capped while streaming
+    app.config['UPLOAD_FOLDER'] = os.getenv('UPLOAD_FOLDER', os.path.join(app.instance_path, 'avatars'))
     app.config['ALLOWED_EXTENSIONS'] = {'png', 'jpg', 'jpeg', 'gif'}
+    app.config['AVATAR_MAX_BYTES'] = int(os.getenv('AVATAR_MAX_BYTES', 5 * 1024 * 1024))
+    app.config['MAX_CONTENT_LENGTH'] = app.config['AVATAR_MAX_BYTES'] + 64 * 1024  # room for multipart framing
     
   
         # Initialize Flask-Mail
     mail.init_app(app)
+    # Emails are queued on disk and sent by a background thread (MAIL_QUEUE_ASYNC=false sends inline)
+    app.config['MAIL_QUEUE_ASYNC'] = os.getenv('MAIL_QUEUE_ASYNC', 'true').lower() == 'true'
+    app.config['MAIL_QUEUE_AUTOSTART'] = os.getenv('MAIL_QUEUE_AUTOSTART', 'true').lower() == 'true'
+    if os.getenv('MAIL_QUEUE_PATH'):
+        app.config['MAIL_QUEUE_PATH'] = os.getenv('MAIL_QUEUE_PATH')
+    mail_queue.init_app(app)
+
+    # bcrypt runs in a process pool; the cost is calibrated to BCRYPT_TARGET_MS unless BCRYPT_ROUNDS is set
+    if os.getenv('BCRYPT_ROUNDS'):
+        app.config['BCRYPT_ROUNDS'] = int(os.getenv('BCRYPT_ROUNDS'))
+    app.config['BCRYPT_TARGET_MS'] = int(os.getenv('BCRYPT_TARGET_MS', 250))
+    hasher.init_app(app)
+
+    # Login/signup/forgot-password throttling, checked before any bcrypt or SMTP work
+    app.config['RATELIMIT_STORAGE_URI'] = os.getenv('RATELIMIT_STORAGE_URI', 'memory://')
+    app.config['THROTTLE_PROXY_HOPS'] = int(os.getenv('THROTTLE_PROXY_HOPS', 0 if os.getenv('RENDER') is None else 1))
+    throttle.init_app(app)
+
+    # Profile pictures: thumbnails rendered in a process pool, content-addressed under UPLOAD_FOLDER
+    app.config['AVATAR_WORKERS'] = int(os.getenv('AVATAR_WORKERS', 2))
+    avatars.init_app(app)
+
+    # PostgreSQL connection pool (shared by every route). Before anything that starts a
+    # thread using it: the chat gateway builds its writer on the pool as soon as it starts
+    app.config['DB_POOL_MIN'] = int(os.getenv('DB_POOL_MIN', 1))
+    app.config['DB_POOL_MAX'] = int(os.getenv('DB_POOL_MAX', 10))
+    app.config['DB_POOL_TIMEOUT'] = float(os.getenv('DB_POOL_TIMEOUT', 10))
+    app.config['DB_POOL_MAX_AGE'] = int(os.getenv('DB_POOL_MAX_AGE', 1800))
+    app.config['DB_POOL_MAX_USES'] = int(os.getenv('DB_POOL_MAX_USES', 1000))
+    init_db_pool(app)
+    # app/migrations/*.sql are applied here (MIGRATE_ON_START=false leaves it to `flask migrate`)
+    app.config['MIGRATE_ON_START'] = os.getenv('MIGRATE_ON_START', 'true').lower() == 'true'
+    migrations.init_app(app)
+
+    # Cross-process events over PostgreSQL LISTEN/NOTIFY (one connection per process): chat messages
+    # and notifications written by one worker or instance reach the clients held by all the others
+    app.config['EVENT_BUS_ENABLED'] = os.getenv('EVENT_BUS_ENABLED', 'true').lower() == 'true'
+    event_bus.init_app(app)
+
+    # Live notifications (SSE): per-user coalescing buffers, served at /notifications/stream and by an
+    # asyncio listener on NOTIFY_SSE_PORT for many idle streams. Before chat, which publishes to it.
+    # The pages stream from NOTIFY_STREAM_URL when it is set, and otherwise poll /chat/unread.
+    app.config['NOTIFY_SSE_ENABLED'] = os.getenv('NOTIFY_SSE_ENABLED', 'true').lower() == 'true'
+    app.config['NOTIFY_SSE_PORT'] = int(os.getenv('NOTIFY_SSE_PORT', 8766))
+    app.config['NOTIFY_SSE_AUTOSTART'] = os.getenv('NOTIFY_SSE_AUTOSTART', 'true').lower() == 'true'
+    if os.getenv('NOTIFY_STREAM_URL'):
+        app.config['NOTIFY_STREAM_URL'] = os.getenv('NOTIFY_STREAM_URL')
+    app.config['NOTIFY_POLL_INTERVAL'] = int(os.getenv('NOTIFY_POLL_INTERVAL', 30))
+    app.config['NOTIFY_FLASK_MAX_STREAMS'] = int(os.getenv('NOTIFY_FLASK_MAX_STREAMS', 2))
+    if os.getenv('NOTIFY_CORS_ORIGINS'):
+        app.config['NOTIFY_CORS_ORIGINS'] = tuple(os.getenv('NOTIFY_CORS_ORIGINS').split(','))
+    notifications.init_app(app)
+
+    # Real-time chat: asyncio WebSocket gateway on its own port, sharing the DB pool
+    app.config['CHAT_ENABLED'] = os.getenv('CHAT_ENABLED', 'true').lower() == 'true'
+    app.config['CHAT_WS_PORT'] = int(os.getenv('CHAT_WS_PORT', 8765))
+    app.config['CHAT_AUTOSTART'] = os.getenv('CHAT_AUTOSTART', 'true').lower() == 'true'
+    if os.getenv('CHAT_ALLOWED_ORIGINS'):  # page origins on other hosts; the app's own host is always allowed
+        app.config['CHAT_ALLOWED_ORIGINS'] = tuple(os.getenv('CHAT_ALLOWED_ORIGINS').split(','))
+    chat.init_app(app)
+
+    # Server-side sessions: the cookie holds only an id; data lives in 'postgres', 'redis' or 'memory'
+    # behind a per-worker LRU, and is written only when it changes ('cookie' keeps signed-cookie sessions)
+    app.config['SESSION_BACKEND'] = os.getenv('SESSION_BACKEND', 'postgres')
+    app.config['SESSION_REDIS_URL'] = os.getenv('SESSION_REDIS_URL', 'redis://localhost:6379/0')
+    server_sessions.init_app(app)
+
+    # Dashboard user-profile cache: shared in Redis when PROFILE_CACHE_URL is set, otherwise a
+    # short-lived per-worker cache (see app/extensions/profile_cache.py)
+    app.config['PROFILE_CACHE_BACKEND'] = os.getenv('PROFILE_CACHE_BACKEND',
+                                                    'redis' if os.getenv('PROFILE_CACHE_URL') else 'memory')
+    app.config['PROFILE_CACHE_URL'] = os.getenv('PROFILE_CACHE_URL', 'redis://localhost:6379/0')
+    if os.getenv('PROFILE_CACHE_TTL'):
+        app.config['PROFILE_CACHE_TTL'] = int(os.getenv('PROFILE_CACHE_TTL'))
+    profile_cache.init_app(app)
+
+    # Google OAuth clients (secrets parsed once, pooled HTTP, cached signing certs)
+    if os.getenv('OAUTH_CLIENT_SECRETS_DIR'):
+        app.config['OAUTH_CLIENT_SECRETS_DIR'] = os.getenv('OAUTH_CLIENT_SECRETS_DIR')
+    if os.getenv('GOOGLE_CERTS_URL'):
+        app.config['GOOGLE_CERTS_URL'] = os.getenv('GOOGLE_CERTS_URL')
+    oauth_registry.init_app(app)
+
+    # Google/Facebook sign-ins create or refresh their users row with a single upsert
+    provisioner.init_app(app)
+
+    # Admin chart data from the user_daily_stats rollup; logins are counted in memory and flushed in batches
+    app.config['ANALYTICS_FLUSH_INTERVAL'] = float(os.getenv('ANALYTICS_FLUSH_INTERVAL', 10))
+    analytics.init_app(app)
+
+    # Online/away/offline from dashboard heartbeats; last_seen is flushed to user_presence in batches
+    app.config['PRESENCE_FLUSH_INTERVAL'] = float(os.getenv('PRESENCE_FLUSH_INTERVAL', 15))
+    presence.init_app(app)
+
+    # Unread counters on conversation_members (raised per chat write batch); read receipts are debounced in memory
+    app.config['READ_STATE_FLUSH_INTERVAL'] = float(os.getenv('READ_STATE_FLUSH_INTERVAL', 2))
+    read_state.init_app(app)
+
+    # Message full-text and username autocomplete (migration 0007); hot autocomplete prefixes are cached per worker
+    app.config['SEARCH_PREFIX_CACHE_TTL'] = int(os.getenv('SEARCH_PREFIX_CACHE_TTL', 60))
+    search.init_app(app)
+
+    # Signed verify/reset tokens (serializers built once) with a used-token replay cache
+    tokens.init_app(app)
+
+    # Request tracing: per-endpoint latency and DB time for a sampled fraction of requests, at /metrics
+    # (scraped with "Authorization: Bearer $METRICS_TOKEN"; unset, /metrics is a 404)
+    app.config['METRICS_SAMPLE_RATE'] = float(os.getenv('METRICS_SAMPLE_RATE', 0.1))
+    app.config['METRICS_TOKEN'] = os.getenv('METRICS_TOKEN')
+    metrics.init_app(app)
+    metrics.add_collector(lambda: {f"db_pool_{k}": v for k, v in app.extensions['db_pool'].metrics().items()})
+    metrics.add_collector(lambda: {f"profile_cache_{k}": v for k, v in profile_cache.stats().items()})
+    metrics.add_collector(lambda: {f"session_{k}": v for k, v in server_sessions.stats().items()})
+    metrics.add_collector(lambda: {f"presence_{k}": v for k, v in presence.stats().items()})
+    metrics.add_collector(lambda: {f"notify_{k}": v for k, v in notifications.stats().items()})
+    metrics.add_collector(lambda: {f"read_state_{k}": v for k, v in read_state.stats().items()})
+    metrics.add_collector(lambda: {f"search_{k}": v for k, v in search.stats().items()})
+    metrics.add_collector(lambda: {f"event_bus_{k}": v for k, v in event_bus.stats().items()})
+
+    # Static assets: fingerprinted, precompressed and served immutable. Built by `flask assets-build`
+    # in the deploy's build step; ASSETS_AUTO_BUILD=true builds on start instead (development)
+    app.config['ASSETS_AUTO_BUILD'] = os.getenv('ASSETS_AUTO_BUILD', 'false').lower() == 'true'
+    assets.init_app(app)
+
+    # Templates: bytecode-cached and compiled before fork, {% cache %} fragments, compressed HTML/JSON responses
+    app.config['TEMPLATE_COMPRESS'] = os.getenv('TEMPLATE_COMPRESS', 'true').lower() == 'true'
+    templating.init_app(app)
+    metrics.add_collector(lambda: {f"templates_{k}": v for k, v in templating.stats().items()})
     #───────────────────────────────────────────────────────────────────────────────────────────────────────────────────
 
     return app
@@ -0,0 +1,143 @@
+import os
+import atexit
+import threading
+from datetime import datetime, timedelta, timezone
+from collections import Counter
+from psycopg2.extras import execute_values
+from app.extensions.profile_cache import MemoryBackend
+
+#───────────────────────────────────────────────────────────────────────────────────────────────────────────────────
+# Admin analytics from the user_daily_stats rollup (migration 0005).
+#
+# Signups and verifications are maintained by triggers on users. Logins write nothing else, so they
+# are counted in memory per (day, method) and added by a background thread every
+# ANALYTICS_FLUSH_INTERVAL seconds, as one multi-row upsert. report() reads O(days x methods) rows
+# and is cached for ANALYTICS_CACHE_TTL seconds, so a busy admin page costs one query a minute.
+#───────────────────────────────────────────────────────────────────────────────────────────────────────────────────
+METHODS = ('password', 'google', 'facebook')
+
+
+class Analytics:
+    def __init__(self, app=None):
+        self.app = None
+        self._logins = Counter()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._wakeup = threading.Event()
+        self._cache = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('ANALYTICS_FLUSH_INTERVAL', 10.0)
+        app.config.setdefault('ANALYTICS_CACHE_TTL', 60)
+        app.config.setdefault('ANALYTICS_MAX_DAYS', 365)
+        self.app = app
+        self._cache = MemoryBackend(64, ttl=app.config['ANALYTICS_CACHE_TTL'])
+        atexit.register(self.flush)
+        app.extensions['analytics'] = self
+
+    #─── login events ───────────────────────────────────────────────────────────────────────────────────────────
+    def record_login(self, method):
+        day = datetime.now(timezone.utc).date()
+        with self._lock:
+            self._logins[(day, method)] += 1
+        self._ensure_worker()
+
+    def flush(self):
+        """Adds the logins counted so far to the rollup. Counts are put back if the write fails."""
+        with self._lock:
+            pending, self._logins = self._logins, Counter()
+        if not pending or self.app is None:
+            return 0
+        pool = self.app.extensions['db_pool']
+        try:
+            conn = pool.getconn()
+            try:
+                with conn.cursor() as cur:
+                    execute_values(cur, """
+                        INSERT INTO user_daily_stats AS s (day, method, logins) VALUES %s
+                        ON CONFLICT (day, method) DO UPDATE SET logins = s.logins + EXCLUDED.logins
+                    """, [(day, method, n) for (day, method), n in pending.items()])
+                conn.commit()
+            finally:
+                pool.putconn(conn)
+        except Exception as e:
+            print(f"[!] Could not flush login counts: {e}")
+            with self._lock:
+                self._logins.update(pending)
+            return 0
+        return sum(pending.values())
+
+    def _ensure_worker(self):
+        # Started lazily so each forked worker flushes its own counts
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='analytics-flush', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        interval = self.app.config['ANALYTICS_FLUSH_INTERVAL']
+        while True:
+            self._wakeup.wait(interval)
+            self.flush()
+
+    #─── reporting ──────────────────────────────────────────────────────────────────────────────────────────────
+    def report(self, days):
+        """Per-day series for the last ``days`` days plus all-time totals, from the rollup only."""
+        days = max(1, min(int(days), self.app.config['ANALYTICS_MAX_DAYS']))
+        cached = self._cache.get(days)
+        if cached is not None:
+            return cached
+
+        today = datetime.now(timezone.utc).date()
+        start = today - timedelta(days=days - 1)
+        pool = self.app.extensions['db_pool']
+        conn = pool.getconn()
+        try:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    SELECT day, method, signups, verifications, logins FROM user_daily_stats
+                    WHERE day >= %s ORDER BY day
+                """, (start,))
+                rows = cur.fetchall()
+                cur.execute("""
+                    SELECT method, SUM(users_delta) AS users, SUM(verified_delta) AS verified
+                    FROM user_daily_stats GROUP BY method
+                """)
+                totals = {row['method']: row for row in cur.fetchall()}
+        finally:
+            pool.putconn(conn)
+
+        labels = [(start + timedelta(days=i)).isoformat() for i in range(days)]
+        index = {label: i for i, label in enumerate(labels)}
+        series = {name: {method: [0] * days for method in METHODS} for name in ('signups', 'verifications', 'logins')}
+        for row in rows:
+            i = index.get(row['day'].isoformat())
+            if i is None:  # dated after today by the database's clock
+                continue
+            for name in series:
+                series[name].setdefault(row['method'], [0] * days)[i] = row[name]
+
+        by_method = {method: {'users': int(totals[method]['users']) if method in totals else 0,
+                              'verified': int(totals[method]['verified']) if method in totals else 0}
+                     for method in sorted(set(METHODS) | set(totals))}
+        users = sum(m['users'] for m in by_method.values())
+        verified = sum(m['verified'] for m in by_method.values())
+        result = {
+            'days': labels,
+            **series,
+            'totals': {'users': users, 'verified': verified,
+                       'verified_ratio': round(verified / users, 4) if users else 0.0,
+                       'by_method': by_method},
+        }
+        self._cache.set(days, result)
+        return result
+
+
+analytics = Analytics()
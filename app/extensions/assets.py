@@ -0,0 +1,295 @@
+import os
+import re
+import gzip
+import json
+import hashlib
+import mimetypes
+from io import BytesIO
+from markupsafe import Markup
+from flask import current_app, request, send_from_directory, url_for
+
+#───────────────────────────────────────────────────────────────────────────────────────────────────────────────────
+# Static asset pipeline.
+#
+# `flask assets-build`, run as a build step, copies every file in app/static
+# to app/static/dist under a content-hashed name. It also writes .gz/.br siblings for text assets and
+# WebP/AVIF variants at several widths for the background images. A url_defaults hook rewrites
+# url_for('static', filename=...) to the hashed name. Those URLs never change content, so they are
+# served with a one-year immutable Cache-Control, the best encoding the browser accepts, and
+# ETag/304. Files missing from the manifest are served by Flask's static view as before.
+#
+# Pillow and brotli are optional: without them the build skips image variants or .br files.
+#
+# Building at startup (ASSETS_AUTO_BUILD) is off by default: the image conversion takes seconds,
+# and with preload_app it would run in the gunicorn master on every cold deploy. Without a current
+# build the app serves app/static as is.
+#───────────────────────────────────────────────────────────────────────────────────────────────────────────────────
+DIST = 'dist'
+MANIFEST = 'manifest.json'
+COMPRESSIBLE = {'.css', '.js', '.json', '.svg', '.ico', '.txt', '.map'}
+RASTER = {'.png', '.jpg', '.jpeg'}
+RESPONSIVE_DIRS = ('background/',)
+IMAGE_WIDTHS = (640, 1024, 1536, 1920)
+IMMUTABLE = 'public, max-age=31536000, immutable'
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+_CSS_URL = re.compile(r'''url\(\s*(['"]?)(?!data:|https?:|//)([^'")]+)\1\s*\)''')
+_CSS_BACKGROUND = re.compile(r'''background-image:\s*url\(\s*(['"]?)(?!data:|https?:|//)([^'")]+)\1\s*\)\s*;''')
+
+
+def _fingerprint(rel, data):
+    name, ext = os.path.splitext(rel)
+    return f"{DIST}/{name}.{hashlib.sha256(data).hexdigest()[:12]}{ext}"
+
+
+def _image_set(variants, fallback_url, width=None):
+    """CSS image-set() of the AVIF/WebP variants closest to width (the largest if None)."""
+    widths = sorted({v['width'] for v in variants})
+    if width is not None:
+        chosen = next((w for w in widths if w >= width), widths[-1])
+    else:
+        chosen = widths[-1]
+    options = [f'url("{v["url"]}") type("{v["type"]}")' for v in variants if v['width'] == chosen]
+    options.append(f'url("{fallback_url}") type("{mimetypes.guess_type(fallback_url)[0]}")')
+    return f"image-set({', '.join(options)})"
+
+
+class AssetPipeline:
+    def __init__(self, app=None):
+        self.files = {}     # logical path -> dist path
+        self.served = {}    # dist path -> {"mimetype", "encodings"}
+        self.images = {}    # logical path -> [{"path", "width", "type"}]
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('ASSETS_ENABLED', True)
+        app.config.setdefault('ASSETS_AUTO_BUILD', False)
+        app.config.setdefault('ASSETS_GZIP_LEVEL', 9)
+        app.config.setdefault('ASSETS_IMAGE_QUALITY', 70)
+        self.static_folder = app.static_folder
+        self.dist_folder = os.path.join(self.static_folder, DIST)
+        self.gzip_level = app.config['ASSETS_GZIP_LEVEL']
+        self.quality = app.config['ASSETS_IMAGE_QUALITY']
+
+        app.add_template_global(self.responsive_background)
+        app.cli.command('assets-build')(self._build_command)
+        app.extensions['assets'] = self
+        if not app.config['ASSETS_ENABLED']:
+            return
+
+        if not self.load():
+            if app.config['ASSETS_AUTO_BUILD']:
+                self.build()
+            else:
+                print("[~] Static assets are not built (or are stale); serving app/static unhashed. "
+                      "Run `flask assets-build`.")
+        app.url_defaults(self._url_defaults)
+        app.view_functions['static'] = self.send_static
+
+    #─── manifest ───────────────────────────────────────────────────────────────────────────────────────────────
+    def _sources(self):
+        for root, dirs, names in os.walk(self.static_folder):
+            if os.path.abspath(root) == os.path.abspath(self.static_folder):
+                dirs[:] = [d for d in dirs if d != DIST]
+            for name in sorted(names):
+                path = os.path.join(root, name)
+                yield os.path.relpath(path, self.static_folder).replace(os.sep, '/'), path
+
+    def _source_digest(self):
+        # stat() only, so checking for staleness at startup costs microseconds per file
+        h = hashlib.sha256()
+        for rel, path in sorted(self._sources()):
+            st = os.stat(path)
+            h.update(f"{rel}:{st.st_size}:{st.st_mtime_ns};".encode())
+        return h.hexdigest()
+
+    def load(self):
+        """Loads the manifest. Returns False if it is missing or app/static changed since the build."""
+        try:
+            with open(os.path.join(self.dist_folder, MANIFEST), encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if manifest.get('source') != self._source_digest():
+            return False
+        self.files = manifest['files']
+        self.served = manifest['served']
+        self.images = manifest['images']
+        return True
+
+    #─── build ──────────────────────────────────────────────────────────────────────────────────────────────────
+    def build(self):
+        try:
+            import brotli
+        except ImportError:
+            brotli = None
+            print("[~] brotli not installed; assets get .gz only")
+        try:
+            from PIL import Image, features
+        except ImportError:
+            Image = features = None
+            print("[~] Pillow not installed; background images get no WebP/AVIF variants")
+
+        files, served, images = {}, {}, {}
+        written = {}  # dist path -> bytes, kept so CSS can be rewritten after the images are known
+        stylesheets = []
+        for rel, path in self._sources():
+            with open(path, 'rb') as f:
+                data = f.read()
+            ext = os.path.splitext(rel)[1].lower()
+            if ext == '.css':
+                stylesheets.append((rel, data))
+                continue
+            files[rel] = _fingerprint(rel, data)
+            written[files[rel]] = data
+            if Image is not None and ext in RASTER and rel.startswith(RESPONSIVE_DIRS):
+                images[rel] = self._variants(Image, features, rel, data, written)
+
+        # Stylesheets last: their url() references are rewritten to the hashed names (and
+        # background images to an image-set of the variants), which changes their own hash.
+        for rel, data in stylesheets:
+            css = self._rewrite_css(rel, data.decode('utf-8'), files, images).encode('utf-8')
+            files[rel] = _fingerprint(rel, css)
+            written[files[rel]] = css
+
+        os.makedirs(self.dist_folder, exist_ok=True)
+        keep = {MANIFEST}
+        for out, data in written.items():
+            keep.update(self._write(out, data))
+            encodings = []
+            if os.path.splitext(out)[1].lower() in COMPRESSIBLE and len(data) > 256:
+                for encoding, suffix in ENCODINGS:
+                    if encoding == 'br':
+                        if brotli is None:
+                            continue
+                        packed = brotli.compress(data, quality=11)
+                    else:
+                        packed = gzip.compress(data, compresslevel=self.gzip_level, mtime=0)
+                    if len(packed) < len(data):
+                        keep.update(self._write(out + suffix, packed))
+                        encodings.append(encoding)
+            served[out] = {'mimetype': mimetypes.guess_type(out)[0] or 'application/octet-stream',
+                           'encodings': encodings}
+        self._prune(keep)
+
+        self.files, self.served, self.images = files, served, images
+        manifest = {'source': self._source_digest(), 'files': files, 'served': served, 'images': images}
+        tmp = os.path.join(self.dist_folder, MANIFEST + '.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=1, sort_keys=True)
+        os.replace(tmp, os.path.join(self.dist_folder, MANIFEST))
+        print(f"[✓] Built {len(files)} static assets ({sum(len(v) for v in images.values())} image variants)")
+
+    def _variants(self, Image, features, rel, data, written):
+        formats = [('avif', 'AVIF', 'image/avif')] if features.check('avif') else []
+        formats.append(('webp', 'WEBP', 'image/webp'))
+        with Image.open(BytesIO(data)) as im:
+            im = im.convert('RGBA' if 'A' in im.getbands() or im.mode == 'P' else 'RGB')
+            widths = [w for w in IMAGE_WIDTHS if w < im.width] + [im.width]
+            variants = []
+            for width in widths:
+                resized = im if width == im.width else im.resize(
+                    (width, round(im.height * width / im.width)), Image.LANCZOS)
+                for ext, fmt, mimetype in formats:
+                    buf = BytesIO()
+                    resized.save(buf, fmt, quality=self.quality)
+                    name = os.path.splitext(rel)[0]
+                    out = _fingerprint(f"{name}-{width}w.{ext}", buf.getvalue())
+                    written[out] = buf.getvalue()
+                    variants.append({'path': out, 'width': width, 'type': mimetype})
+        return variants
+
+    def _rewrite_css(self, rel, css, files, images):
+        base = os.path.dirname(rel)
+        css_dist_dir = os.path.dirname(f"{DIST}/{rel}")
+
+        def target(ref):
+            logical = os.path.normpath(os.path.join(base, ref.split('?')[0].split('#')[0])).replace(os.sep, '/')
+            return logical, files.get(logical)
+
+        def relative(dist_path):
+            return os.path.relpath(dist_path, css_dist_dir).replace(os.sep, '/')
+
+        def background(match):
+            logical, hashed = target(match.group(2))
+            if hashed is None:
+                return match.group(0)
+            fallback = relative(hashed)
+            declaration = f'background-image: url("{fallback}");'
+            if images.get(logical):
+                variants = [dict(v, url=relative(v['path'])) for v in images[logical]]
+                declaration += f" background-image: {_image_set(variants, fallback)};"
+            return declaration
+
+        def url(match):
+            hashed = target(match.group(2))[1]
+            return f'url("{relative(hashed)}")' if hashed else match.group(0)
+
+        return _CSS_URL.sub(url, _CSS_BACKGROUND.sub(background, css))
+
+    def _write(self, out, data):
+        path = os.path.join(self.static_folder, out)
+        if not os.path.exists(path):  # content-addressed: an existing file already has these bytes
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, path)
+        return {os.path.relpath(path, self.dist_folder).replace(os.sep, '/')}
+
+    def _prune(self, keep):
+        for root, _, names in os.walk(self.dist_folder):
+            for name in names:
+                path = os.path.join(root, name)
+                if os.path.relpath(path, self.dist_folder).replace(os.sep, '/') not in keep:
+                    os.remove(path)
+
+    def _build_command(self):
+        """Fingerprint, precompress and resize app/static into app/static/dist."""
+        self.build()
+
+    #─── serving ────────────────────────────────────────────────────────────────────────────────────────────────
+    def _url_defaults(self, endpoint, values):
+        if endpoint == 'static':
+            hashed = self.files.get(values.get('filename'))
+            if hashed is not None:
+                values['filename'] = hashed
+
+    def send_static(self, filename):
+        entry = self.served.get(filename)
+        if entry is None:
+            return current_app.send_static_file(filename)
+
+        accepted = request.accept_encodings
+        for encoding, suffix in ENCODINGS:
+            if encoding in entry['encodings'] and accepted[encoding]:
+                response = send_from_directory(self.static_folder, filename + suffix,
+                                               mimetype=entry['mimetype'], conditional=True)
+                response.headers['Content-Encoding'] = encoding
+                break
+        else:
+            response = send_from_directory(self.static_folder, filename,
+                                           mimetype=entry['mimetype'], conditional=True)
+        response.headers.pop('Content-Disposition', None)  # names the .br/.gz file otherwise
+        response.headers['Cache-Control'] = IMMUTABLE
+        if entry['encodings']:
+            response.vary.add('Accept-Encoding')
+        return response
+
+    def responsive_background(self, selector, filename):
+        """A <style>-ready rule giving selector a background that picks AVIF/WebP by viewport width."""
+        fallback = url_for('static', filename=filename)
+        rules = [f'{selector} {{ background-image: url("{fallback}"); }}']
+        variants = self.images.get(filename)
+        if variants:
+            variants = [dict(v, url=url_for('static', filename=v['path'])) for v in variants]
+            widths = sorted({v['width'] for v in variants})
+            rules.append(f'{selector} {{ background-image: {_image_set(variants, fallback)}; }}')
+            for width in reversed(widths[:-1]):
+                rules.append(f'@media (max-width: {width}px) {{ {selector} '
+                             f'{{ background-image: {_image_set(variants, fallback, width)}; }} }}')
+        return Markup('\n'.join(rules))
+
+
+assets = AssetPipeline()
@@ -0,0 +1,158 @@
+import os
+import re
+import hashlib
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from flask import send_from_directory, abort
+
+#───────────────────────────────────────────────────────────────────────────────────────────────────────────────────
+# Profile picture uploads.
+#
+# The upload is copied to a temp file in fixed-size chunks while it is hashed, so a request never
+# holds more than one chunk in memory. AVATAR_MAX_BYTES is enforced as bytes arrive, on top of
+# Flask's MAX_CONTENT_LENGTH. Thumbnails are rendered by a process pool, off the request thread, and
+# named after the SHA-256 of the original. Uploading the same image twice reuses the existing files,
+# and a name never changes content, so /avatars/ is served immutable.
+#───────────────────────────────────────────────────────────────────────────────────────────────────────────────────
+CHUNK_SIZE = 64 * 1024
+MAX_PIXELS = 40_000_000  # refuse decompression bombs before decoding
+IMMUTABLE = 'public, max-age=31536000, immutable'
+THUMBNAIL_NAME = re.compile(r'^[0-9a-f]{64}-[0-9]+\.webp$')
+SIGNATURES = (
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'\xff\xd8\xff', 'jpg'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+)
+
+
+class UploadRejected(ValueError):
+    """The upload is too large, empty, or not an accepted image type."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def _sniff(head):
+    for signature, ext in SIGNATURES:
+        if head.startswith(signature):
+            return ext
+    return None
+
+
+def _render_thumbnails(source, folder, digest, sizes, quality):
+    """Runs in a pool process. Writes <digest>-<size>.webp for each size and returns the names."""
+    from PIL import Image, ImageOps
+    names = []
+    with Image.open(source) as im:
+        if im.width * im.height > MAX_PIXELS:
+            raise ValueError(f"image is {im.width}x{im.height}, too large to process")
+        im.seek(0)  # first frame of an animated GIF
+        im = ImageOps.exif_transpose(im).convert('RGBA' if im.mode in ('RGBA', 'LA', 'P') else 'RGB')
+        for size in sizes:
+            name = f"{digest}-{size}.webp"
+            thumb = ImageOps.fit(im, (size, size), Image.LANCZOS)
+            tmp = os.path.join(folder, f".{name}.{os.getpid()}.tmp")
+            thumb.save(tmp, 'WEBP', quality=quality, method=6)
+            os.replace(tmp, os.path.join(folder, name))
+            names.append(name)
+    return names
+
+
+class AvatarStore:
+    def __init__(self, app=None):
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('UPLOAD_FOLDER', os.path.join(app.instance_path, 'avatars'))
+        app.config.setdefault('ALLOWED_EXTENSIONS', {'png', 'jpg', 'jpeg', 'gif'})
+        app.config.setdefault('AVATAR_MAX_BYTES', 5 * 1024 * 1024)
+        app.config.setdefault('AVATAR_SIZES', (256, 64))
+        app.config.setdefault('AVATAR_QUALITY', 82)
+        app.config.setdefault('AVATAR_WORKERS', 2)
+
+        self.folder = os.path.abspath(app.config['UPLOAD_FOLDER'])
+        self.allowed = {ext.lower() for ext in app.config['ALLOWED_EXTENSIONS']}
+        self.max_bytes = app.config['AVATAR_MAX_BYTES']
+        self.sizes = tuple(app.config['AVATAR_SIZES'])
+        self.quality = app.config['AVATAR_QUALITY']
+        self.workers = app.config['AVATAR_WORKERS']
+        os.makedirs(self.folder, exist_ok=True)
+        app.extensions['avatars'] = self
+
+    def url_for_digest(self, digest, size=None):
+        return f"/avatars/{digest}-{size or self.sizes[0]}.webp"
+
+    def receive(self, stream):
+        """Copies an upload stream to a temp file in chunks. Returns (temp path, sha256 hex digest)."""
+        h = hashlib.sha256()
+        received = 0
+        fd, path = tempfile.mkstemp(dir=self.folder, prefix='.upload-')
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                while True:
+                    chunk = stream.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    if received == 0:
+                        ext = _sniff(chunk)
+                        if ext is None or ext not in self.allowed:
+                            raise UploadRejected("Only PNG, JPEG and GIF images are accepted.", 415)
+                    received += len(chunk)
+                    if received > self.max_bytes:
+                        raise UploadRejected(f"Images must be under {self.max_bytes // (1024 * 1024)} MB.", 413)
+                    h.update(chunk)
+                    out.write(chunk)
+            if received == 0:
+                raise UploadRejected("The upload was empty.")
+        except BaseException:
+            os.remove(path)
+            raise
+        return path, h.hexdigest()
+
+    def exists(self, digest):
+        return all(os.path.exists(os.path.join(self.folder, f"{digest}-{size}.webp")) for size in self.sizes)
+
+    def process(self, path, digest, on_done):
+        """Renders thumbnails in the pool and calls on_done(error) from a pool callback thread.
+
+        An image whose thumbnails already exist is not decoded again; on_done runs immediately.
+        """
+        if self.exists(digest):
+            os.remove(path)
+            on_done(None)
+            return
+        future = self._pool().submit(_render_thumbnails, path, self.folder, digest, self.sizes, self.quality)
+
+        def finished(f):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            on_done(f.exception())
+        future.add_done_callback(finished)
+
+    def send(self, filename):
+        if not THUMBNAIL_NAME.match(filename):
+            abort(404)
+        response = send_from_directory(self.folder, filename, mimetype='image/webp', conditional=True)
+        response.headers['Cache-Control'] = IMMUTABLE
+        return response
+
+    def _pool(self):
+        # Created per process so forked gunicorn workers each get their own children.
+        if self._executor is None or self._pid != os.getpid():
+            with self._lock:
+                if self._executor is None or self._pid != os.getpid():
+                    self._executor = ProcessPoolExecutor(max_workers=self.workers)
+                    self._pid = os.getpid()
+        return self._executor
+
+
+avatars = AvatarStore()
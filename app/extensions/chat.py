@@ -0,0 +1,421 @@
+import os
+import json
+import time
+import socket
+import asyncio
+import threading
+from collections import defaultdict
+from datetime import datetime, timezone
+from http.cookies import SimpleCookie
+from urllib.parse import urlsplit
+import psycopg2.extras
+from websockets.asyncio.server import serve, broadcast
+from app.extensions.event_bus import event_bus
+from app.extensions.notifications import notifications
+from app.extensions.read_state import read_state
+
+#───────────────────────────────────────────────────────────────────────────────────────────────────────────────────
+# Real-time messaging.
+#
+# ChatGateway runs an asyncio WebSocket server on its own thread (CHAT_WS_PORT) next to the Flask
+# app. Clients connect with the same session cookie the dashboards use, so no separate login is
+# needed. Because a cookie rides along from any page, the handshake's Origin must be the app's own
+# host (any port) or be listed in CHAT_ALLOWED_ORIGINS; otherwise a third-party page could open a
+# socket as the logged-in user. Each process keeps an in-memory map of room -> open sockets and
+# fans messages out directly; an idle connection costs one socket and a few small objects, no thread.
+# Messages are persisted in batches by MessageWriter instead of one INSERT per message, and fanned
+# out only once their batch has committed (at most CHAT_WRITE_DELAY later). No client ever sees a
+# message that was not stored, and every frame carries the id a read receipt reports. If a batch
+# fails, its senders get an error frame with their client_id instead.
+#
+# Other processes (gunicorn workers, instances) hold other sockets. Each written batch is announced
+# on the event bus as "room:id" pairs, committed with the rows. A process with sockets in one of
+# those rooms fetches the rows it is missing in one query and fans them out to its own sockets.
+# The writer's process has already delivered them locally, after the commit.
+#
+# Client protocol (JSON text frames):
+#   -> {"type": "send", "room": 12, "body": "hi", "client_id": "abc"}
+#   -> {"type": "join", "room": 12}
+#   -> {"type": "read", "room": 12, "id": 3456}    (read receipt, see app/extensions/read_state.py)
+#   <- {"type": "message", "id": 3456, "room": 12, "sender": 3, "body": "hi", "ts": 1714000000.0, "client_id": "abc"}
+#        (client_id is null when the message was sent through another process)
+#   <- {"type": "error", "error": "...", "client_id": "abc"}  (client_id only when a send was not saved)
+#───────────────────────────────────────────────────────────────────────────────────────────────────────────────────
+MAX_BODY_LENGTH = 4000
+BUS_CHANNEL = 'chat_messages'
+
+
+class PubSub:
+    """In-process room fan-out: room id -> set of connected sockets."""
+
+    def __init__(self):
+        self._rooms = defaultdict(set)
+
+    def subscribe(self, room, ws):
+        self._rooms[room].add(ws)
+
+    def unsubscribe(self, room, ws):
+        members = self._rooms.get(room)
+        if members is not None:
+            members.discard(ws)
+            if not members:
+                del self._rooms[room]
+
+    def publish(self, room, payload):
+        """Sends an already-serialized payload to every socket in the room. Returns the fan-out size."""
+        members = self._rooms.get(room)
+        if not members:
+            return 0
+        # broadcast() writes without awaiting each peer; a slow client can't stall the room.
+        broadcast(members, payload)
+        return len(members)
+
+    def has_room(self, room):
+        return room in self._rooms
+
+    def room_count(self):
+        return len(self._rooms)
+
+
+class MessageWriter:
+    """Buffers chat messages and inserts them in one statement per batch."""
+
+    def __init__(self, pool, max_batch=200, max_delay=0.05, on_written=None, on_stored=None, on_failed=None):
+        self.pool = pool
+        self.on_written = on_written  # called with (cursor, rows, inserted) after each insert, before the commit
+        self.on_stored = on_stored    # called on the event loop with (rows, inserted, metas) after the commit
+        self.on_failed = on_failed    # called on the event loop with (rows, metas) when a batch is lost
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._buffer = []
+        self._metas = []              # whatever the caller passed to add(), in row order
+        self._flush_handle = None
+        self.written = 0
+
+    def add(self, conversation_id, sender_id, body, created_at, meta=None):
+        self._buffer.append((conversation_id, sender_id, body, created_at))
+        self._metas.append(meta)
+        loop = asyncio.get_running_loop()
+        if len(self._buffer) >= self.max_batch:
+            loop.create_task(self.flush())
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.max_delay, lambda: loop.create_task(self.flush()))
+
+    async def flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if not self._buffer:
+            return
+        batch, self._buffer = self._buffer, []
+        metas, self._metas = self._metas, []
+        try:
+            inserted = await asyncio.get_running_loop().run_in_executor(None, self._insert, batch)
+            self.written += len(batch)
+        except Exception as e:
+            print(f"[!] Failed to persist {len(batch)} chat message(s): {e}")
+            if self.on_failed is not None:
+                self.on_failed(batch, metas)
+            return
+        if self.on_stored is not None:
+            self.on_stored(batch, inserted, metas)
+
+    def _insert(self, rows):
+        conn = self.pool.getconn()
+        try:
+            with conn.cursor() as cur:
+                inserted = psycopg2.extras.execute_values(
+                    cur,
+                    "INSERT INTO messages (conversation_id, sender_id, body, created_at) VALUES %s "
+                    "RETURNING id, conversation_id, sender_id",
+                    rows,
+                    fetch=True,
+                )
+                if self.on_written is not None:
+                    # RETURNING yields the rows of a multi-row VALUES in input order, so inserted[i] is rows[i].
+                # A failure here must not abort the transaction and lose the messages
+                    cur.execute("SAVEPOINT on_written")
+                    try:
+                        self.on_written(cur, rows, inserted)
+                    except Exception as e:
+                        cur.execute("ROLLBACK TO SAVEPOINT on_written")
+                        print(f"[!] Could not announce {len(rows)} written message(s): {e}")
+            conn.commit()
+            return inserted
+        finally:
+            self.pool.putconn(conn)
+
+
+class ChatGateway:
+    def __init__(self, app=None):
+        self.app = None
+        self.pubsub = PubSub()
+        self.writer = None
+        self.loop = None
+        self.connections = 0
+        self.remote_delivered = 0
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('CHAT_ENABLED', True)
+        app.config.setdefault('CHAT_WS_HOST', '0.0.0.0')
+        app.config.setdefault('CHAT_WS_PORT', 8765)
+        app.config.setdefault('CHAT_WRITE_BATCH', 200)
+        app.config.setdefault('CHAT_WRITE_DELAY', 0.05)
+        app.config.setdefault('CHAT_ALLOWED_ORIGINS', app.config.get('NOTIFY_CORS_ORIGINS', ()))
+        app.config.setdefault('CHAT_AUTOSTART', True)  # False: the server starts it per worker (gunicorn post_fork)
+        self.app = app
+        app.extensions['chat'] = self
+        if app.config['CHAT_ENABLED'] and event_bus.enabled:
+            event_bus.subscribe(BUS_CHANNEL, self._on_bus)
+        if app.config['CHAT_ENABLED'] and app.config['CHAT_AUTOSTART']:
+            self.start()
+
+    def start(self):
+        """Starts the gateway thread for this process (safe to call again after fork)."""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self.pubsub = PubSub()
+            self._ready = threading.Event()
+            self._thread = threading.Thread(target=self._run, name='chat-gateway', daemon=True)
+            self._thread.start()
+        event_bus.start()
+        self._ready.wait(5)
+
+    def _run(self):
+        try:
+            asyncio.run(self._serve())
+        except Exception as e:
+            print(f"[!] Chat gateway stopped: {e}")
+            self._ready.set()
+
+    async def _serve(self):
+        self.loop = asyncio.get_running_loop()
+        self.writer = self.make_writer()
+        async with serve(
+            self._handler,
+            self.app.config['CHAT_WS_HOST'],
+            self.app.config['CHAT_WS_PORT'],
+            process_request=self._process_request,
+            reuse_port=hasattr(socket, 'SO_REUSEPORT'),  # one listener per worker
+            compression=None,      # permessage-deflate keeps ~64 KB of zlib state per socket
+            max_size=2 ** 16,
+            ping_interval=30,
+        ):
+            print(f"[✓] Chat gateway listening on ws://{self.app.config['CHAT_WS_HOST']}:{self.app.config['CHAT_WS_PORT']}")
+            self._ready.set()
+            await asyncio.Future()
+
+    def make_writer(self):
+        return MessageWriter(
+            self.app.extensions['db_pool'],
+            max_batch=self.app.config['CHAT_WRITE_BATCH'],
+            max_delay=self.app.config['CHAT_WRITE_DELAY'],
+            on_written=self._written,
+            on_stored=self._stored,
+            on_failed=self._failed,
+        )
+
+    def _stored(self, rows, inserted, metas):
+        # Local fan-out, now that the batch is committed; meta is (sender's socket, client_id)
+        for (room, sender, body, created_at), stored, (_, client_id) in zip(rows, inserted, metas):
+            self.pubsub.publish(room, json.dumps({
+                "type": "message",
+                "id": stored['id'],
+                "room": room,
+                "sender": sender,
+                "body": body,
+                "ts": created_at.replace(tzinfo=timezone.utc).timestamp(),
+                "client_id": client_id,
+            }))
+
+    def _failed(self, rows, metas):
+        for ws, client_id in metas:
+            broadcast([ws], json.dumps({"type": "error", "error": "Message could not be saved.", "client_id": client_id}))
+
+    #─── cross-process fan-out ──────────────────────────────────────────────────────────────────────────────────
+    def _written(self, cur, rows, inserted):
+        # Runs in the writer's transaction, so the counters and the announcement commit with the messages
+        if read_state.app is not None:
+            read_state.messages_written(cur, inserted)
+        if event_bus.enabled:
+            event_bus.notify_parts(cur, BUS_CHANNEL, (f"{row['conversation_id']}:{row['id']}" for row in inserted))
+        elif notifications.app is not None:
+            notifications.messages_written(cur, rows)
+
+    def _on_bus(self, messages):
+        """Event bus handler: delivers messages written by other processes to the sockets held here."""
+        remote, everything = [], []
+        for token, message in messages:
+            for part in message.split():
+                room, _, message_id = part.partition(':')
+                room, message_id = int(room), int(message_id)
+                everything.append(message_id)
+                if token != event_bus.token and self.loop is not None and self.pubsub.has_room(room):
+                    remote.append(message_id)
+        # Notifications need every row (a user's stream may be here while their chat socket is not)
+        wanted = everything if notifications.app is not None and notifications.has_buffers() else remote
+        if not wanted:
+            return
+        pool = self.app.extensions['db_pool']
+        conn = pool.getconn()
+        try:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    SELECT id, conversation_id, sender_id, body, created_at
+                    FROM messages WHERE id = ANY(%s) ORDER BY id
+                """, (wanted,))
+                fetched = cur.fetchall()
+                if wanted is everything:
+                    notifications.messages_written(
+                        cur, [(r['conversation_id'], r['sender_id'], r['body'], r['created_at']) for r in fetched],
+                        local_only=True,
+                    )
+            conn.commit()
+        finally:
+            pool.putconn(conn)
+        remote = set(remote)
+        for row in fetched:
+            if row['id'] in remote:
+                payload = json.dumps({
+                    "type": "message",
+                    "id": row['id'],
+                    "room": row['conversation_id'],
+                    "sender": row['sender_id'],
+                    "body": row['body'],
+                    "ts": row['created_at'].replace(tzinfo=timezone.utc).timestamp(),
+                    "client_id": None,
+                })
+                self.loop.call_soon_threadsafe(self.pubsub.publish, row['conversation_id'], payload)
+                self.remote_delivered += 1
+
+    #─── authentication ─────────────────────────────────────────────────────────────────────────────────────────
+    def load_session(self, cookie_header):
+        """Decodes the Flask session cookie sent with the WebSocket handshake."""
+        name = self.app.config.get('SESSION_COOKIE_NAME', 'session')
+        morsel = SimpleCookie(cookie_header or '').get(name)
+        if morsel is None:
+            return None
+        if hasattr(self.app.session_interface, 'load'):  # server-side sessions: the cookie is only an id
+            try:
+                return self.app.session_interface.load(morsel.value)
+            except Exception:
+                return None
+        serializer = self.app.session_interface.get_signing_serializer(self.app)
+        try:
+            return serializer.loads(morsel.value, max_age=int(self.app.permanent_session_lifetime.total_seconds()))
+        except Exception:
+            return None
+
+    def resolve_user_id(self, session_data):
+        if session_data.get('user_id'):
+            return session_data['user_id']
+        if session_data.get('google_id'):
+            conn = self.app.extensions['db_pool'].getconn()
+            try:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT id FROM users WHERE google_id = %s", (session_data['google_id'],))
+                    row = cur.fetchone()
+                return row['id'] if row else None
+            finally:
+                self.app.extensions['db_pool'].putconn(conn)
+        return None
+
+    def load_rooms(self, user_id):
+        conn = self.app.extensions['db_pool'].getconn()
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT conversation_id FROM conversation_members WHERE user_id = %s", (user_id,))
+                return {row['conversation_id'] for row in cur.fetchall()}
+        finally:
+            self.app.extensions['db_pool'].putconn(conn)
+
+    def is_member(self, room, user_id):
+        return room in self.load_rooms(user_id)
+
+    def origin_allowed(self, origin, host):
+        """Browsers always send Origin; only pages on this host or in CHAT_ALLOWED_ORIGINS may connect."""
+        if origin is None:
+            return True  # not a browser, so no ambient cookie to abuse
+        if origin in self.app.config['CHAT_ALLOWED_ORIGINS']:
+            return True
+        try:
+            origin_host, own_host = urlsplit(origin).hostname, urlsplit(f"//{host}").hostname
+        except ValueError:
+            return False
+        return own_host is not None and origin_host == own_host
+
+    async def _process_request(self, connection, request):
+        if not self.origin_allowed(request.headers.get('Origin'), request.headers.get('Host', '')):
+            return connection.respond(403, "Origin not allowed\n")
+        loop = asyncio.get_running_loop()
+        try:
+            # Both may query the session store or users; neither may block the loop every socket shares
+            session_data = await loop.run_in_executor(None, self.load_session, request.headers.get('Cookie'))
+            if not session_data:
+                return connection.respond(401, "Login required\n")
+            user_id = await loop.run_in_executor(None, self.resolve_user_id, session_data)
+        except Exception as e:
+            print(f"[!] Chat auth lookup failed: {e}")
+            return connection.respond(503, "Try again later\n")
+        if user_id is None:
+            return connection.respond(401, "Login required\n")
+        connection.user_id = user_id
+        return None
+
+    #─── connection handler ─────────────────────────────────────────────────────────────────────────────────────
+    async def _handler(self, ws):
+        user_id = ws.user_id
+        loop = asyncio.get_running_loop()
+        rooms = await loop.run_in_executor(None, self.load_rooms, user_id)
+        for room in rooms:
+            self.pubsub.subscribe(room, ws)
+        self.connections += 1
+        try:
+            async for raw in ws:
+                try:
+                    msg = json.loads(raw)
+                    if not isinstance(msg, dict):
+                        raise TypeError("frame is not an object")
+                    room = int(msg.get('room'))
+                except (ValueError, TypeError):
+                    await ws.send(json.dumps({"type": "error", "error": "Malformed message."}))
+                    continue
+
+                kind = msg.get('type')
+                if kind == 'read':
+                    if room in rooms:
+                        read_state.mark_read(user_id, room, msg.get('id'))  # ignores ids that are not valid
+                    continue
+                if kind == 'join':
+                    if room not in rooms and await loop.run_in_executor(None, self.is_member, room, user_id):
+                        rooms.add(room)
+                        self.pubsub.subscribe(room, ws)
+                    continue
+                if kind != 'send':
+                    continue
+                if room not in rooms:
+                    await ws.send(json.dumps({"type": "error", "error": "Not a member of this conversation."}))
+                    continue
+                body = str(msg.get('body', '')).strip()[:MAX_BODY_LENGTH]
+                if not body:
+                    continue
+
+                client_id = msg.get('client_id')
+                if not isinstance(client_id, (str, int, float)) or isinstance(client_id, bool):
+                    client_id = None
+                # Fanned out by _stored() once the batch commits
+                self.writer.add(room, user_id, body, datetime.utcfromtimestamp(time.time()), meta=(ws, client_id))
+        finally:
+            self.connections -= 1
+            for room in rooms:
+                self.pubsub.unsubscribe(room, ws)
+
+
+chat = ChatGateway()
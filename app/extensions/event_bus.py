@@ -0,0 +1,156 @@
+import os
+import select
+import secrets
+import threading
+import time
+from collections import defaultdict, deque
+from app.routes.postgresql import open_connection
+
+#───────────────────────────────────────────────────────────────────────────────────────────────────────────────────
+# Cross-process event bus on PostgreSQL LISTEN/NOTIFY.
+#
+# Every process (gunicorn worker, Render instance) holds one dedicated connection outside the pool.
+# It LISTENs on the subscribed channels from a background thread. Publishers call notify() with the
+# cursor of the transaction that wrote the data, so the notification goes out only when that
+# transaction commits and readers can already see the rows. Payloads stay small: they point at
+# rows (e.g. message ids) and never carry them. After a wake-up the listener waits
+# EVENT_BUS_BATCH_DELAY, then hands everything that has arrived to the channel's handlers as one
+# list. A handler can then fetch the rows it needs with a single query.
+#
+# Each payload starts with the sending process's token, so handlers can tell their own events
+# apart. Delivery is live only: notifications sent while the listener is reconnecting are lost.
+#───────────────────────────────────────────────────────────────────────────────────────────────────────────────────
+MAX_PAYLOAD = 7900  # PostgreSQL rejects NOTIFY payloads of 8000 bytes or more
+
+
+class EventBus:
+    def __init__(self, app=None):
+        self.app = None
+        self.enabled = False
+        self._handlers = defaultdict(list)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._listener_pid = None
+        self._pid = None
+        self._token = None
+        self.connected = False
+        self.sent = 0
+        self.received = 0
+        self.batches = 0
+        self.reconnects = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('EVENT_BUS_ENABLED', True)
+        app.config.setdefault('EVENT_BUS_BATCH_DELAY', 0.005)
+        app.config.setdefault('EVENT_BUS_KEEPALIVE', 30)
+        self.app = app
+        self.enabled = app.config['EVENT_BUS_ENABLED']
+        app.extensions['event_bus'] = self
+
+    @property
+    def token(self):
+        """Identifies this process in payloads; a forked worker gets its own."""
+        if self._pid != os.getpid():
+            self._token, self._pid = secrets.token_hex(4), os.getpid()
+        return self._token
+
+    def subscribe(self, channel, handler):
+        """handler(messages) gets a list of (sender token, message) per batch, on the listener thread."""
+        self._handlers[channel].append(handler)
+
+    #─── publishing ─────────────────────────────────────────────────────────────────────────────────────────────
+    def notify(self, cur, channel, message):
+        """Queues a notification on the caller's transaction; it is delivered when that commits."""
+        cur.execute("SELECT pg_notify(%s, %s)", (channel, f"{self.token} {message}"))
+        self.sent += 1
+
+    def notify_parts(self, cur, channel, parts, sep=' '):
+        """Sends the parts joined by sep, in as few notifications as the payload limit allows."""
+        chunk, size = [], len(self.token) + 1
+        for part in parts:
+            if chunk and size + len(part) + len(sep) > MAX_PAYLOAD:
+                self.notify(cur, channel, sep.join(chunk))
+                chunk, size = [], len(self.token) + 1
+            chunk.append(part)
+            size += len(part) + len(sep)
+        if chunk:
+            self.notify(cur, channel, sep.join(chunk))
+
+    #─── listening ──────────────────────────────────────────────────────────────────────────────────────────────
+    def start(self):
+        """Starts this process's listener thread (safe to call again, and after fork)."""
+        if not self.enabled or not self._handlers:
+            return
+        with self._lock:
+            if self._thread is not None and self._listener_pid == os.getpid():
+                return
+            self._listener_pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='event-bus', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        backoff = 1
+        while True:
+            conn = None
+            try:
+                conn = open_connection()
+                conn.autocommit = True
+                conn.notifies = deque()
+                with conn.cursor() as cur:
+                    for channel in self._handlers:
+                        cur.execute(f'LISTEN "{channel}"')  # channel names come from code, not input
+                self.connected = True
+                backoff = 1
+                self._listen(conn)
+            except Exception as e:
+                print(f"[!] Event bus connection lost: {e}")
+                self.reconnects += 1
+            finally:
+                self.connected = False
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+            time.sleep(backoff)
+            backoff = min(backoff * 2, 30)
+
+    def _listen(self, conn):
+        delay = self.app.config['EVENT_BUS_BATCH_DELAY']
+        keepalive = self.app.config['EVENT_BUS_KEEPALIVE']
+        while True:
+            if select.select([conn], [], [], keepalive) == ([], [], []):
+                with conn.cursor() as cur:
+                    cur.execute("SELECT 1")  # notices a dead connection while idle
+                continue
+            conn.poll()
+            if delay:
+                time.sleep(delay)  # commits arriving together are handled together
+                conn.poll()
+            batch = defaultdict(list)
+            while conn.notifies:
+                notify = conn.notifies.popleft()
+                token, _, message = notify.payload.partition(' ')
+                batch[notify.channel].append((token, message))
+            for channel, messages in batch.items():
+                self.received += len(messages)
+                self.batches += 1
+                for handler in self._handlers.get(channel, ()):
+                    try:
+                        handler(messages)
+                    except Exception as e:
+                        print(f"[!] Event bus handler for {channel} failed: {e}")
+
+    def stats(self):
+        return {
+            'connected': int(self.connected),
+            'sent': self.sent,
+            'received': self.received,
+            'batches': self.batches,
+            'reconnects': self.reconnects,
+        }
+
+
+event_bus = EventBus()
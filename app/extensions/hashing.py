@@ -0,0 +1,121 @@
+import os
+import time
+import threading
+from concurrent.futures import ProcessPoolExecutor
+import bcrypt
+from app.extensions.metrics import metrics
+
+#───────────────────────────────────────────────────────────────────────────────────────────────────────────────────
+# bcrypt off the request thread.
+#
+# Hashing and verification run in a small process pool so they neither hold the GIL nor pin a
+# request thread's CPU. A semaphore caps the number of in-flight jobs; when it is exhausted the
+# caller waits briefly and then gets HasherBusy instead of queueing without bound.
+#───────────────────────────────────────────────────────────────────────────────────────────────────────────────────
+class HasherBusy(Exception):
+    """Raised when the hashing pool is saturated and the request should back off."""
+
+
+def _hashpw(password, rounds):
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds)).decode('utf-8')
+
+
+def _checkpw(password, hashed):
+    try:
+        return bcrypt.checkpw(password, hashed)
+    except ValueError:
+        return False
+
+
+def calibrate_rounds(target_ms, min_rounds=10, max_rounds=15):
+    """Returns the highest bcrypt cost whose hash time stays within target_ms on this host."""
+    # One hash at the minimum cost is enough: each extra round doubles it, so the rest is arithmetic
+    # and startup doesn't pay for a hash at every candidate cost.
+    start = time.perf_counter()
+    bcrypt.hashpw(b'calibration', bcrypt.gensalt(min_rounds))
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    rounds = min_rounds
+    while rounds < max_rounds and elapsed_ms * 2 <= target_ms:
+        elapsed_ms *= 2
+        rounds += 1
+    return rounds
+
+
+def hash_rounds(hashed):
+    """Extracts the cost from a '$2b$12$...' hash, or None if it is not a bcrypt hash."""
+    if isinstance(hashed, bytes):
+        hashed = hashed.decode('utf-8', 'replace')
+    parts = hashed.split('$')
+    if len(parts) < 4 or not parts[2].isdigit():
+        return None
+    return int(parts[2])
+
+
+class PasswordHasher:
+    def __init__(self, app=None):
+        self.rounds = 12
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._slots = None
+        self.timeout = 2.0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        workers = app.config.setdefault('BCRYPT_WORKERS', os.cpu_count() or 1)
+        app.config.setdefault('BCRYPT_MAX_PENDING', workers * 4)
+        app.config.setdefault('BCRYPT_QUEUE_TIMEOUT', 2.0)
+        app.config.setdefault('BCRYPT_TARGET_MS', 250)
+        app.config.setdefault('BCRYPT_ROUNDS', None)
+
+        self.workers = workers
+        self.timeout = app.config['BCRYPT_QUEUE_TIMEOUT']
+        self._slots = threading.BoundedSemaphore(app.config['BCRYPT_MAX_PENDING'])
+        if app.config['BCRYPT_ROUNDS']:
+            self.rounds = int(app.config['BCRYPT_ROUNDS'])
+        else:
+            self.rounds = calibrate_rounds(app.config['BCRYPT_TARGET_MS'])
+            print(f"[✓] bcrypt cost calibrated to {self.rounds} rounds (target {app.config['BCRYPT_TARGET_MS']} ms)")
+        app.extensions['hasher'] = self
+
+    def hash(self, password):
+        """Hashes the password at the configured cost and returns it as a str."""
+        return self._run('hash', _hashpw, password.encode('utf-8'), self.rounds)
+
+    def verify(self, password, hashed):
+        """Checks the password against a stored bcrypt hash (str or bytes)."""
+        if isinstance(hashed, str):
+            hashed = hashed.encode('utf-8')
+        return self._run('verify', _checkpw, password.encode('utf-8'), hashed)
+
+    def needs_rehash(self, hashed):
+        """True when a stored hash was made with a lower cost than the current one.
+
+        Only upgrades: workers calibrate independently and may settle on different costs, and a
+        hash is never rewritten down to a cheaper one.
+        """
+        rounds = hash_rounds(hashed)
+        return rounds is not None and rounds < self.rounds
+
+    def _run(self, op, fn, *args):
+        start = time.perf_counter()
+        if not self._slots.acquire(timeout=self.timeout):
+            raise HasherBusy("Password hashing is saturated, try again shortly.")
+        try:
+            return self._pool().submit(fn, *args).result()
+        finally:
+            self._slots.release()
+            metrics.bcrypt.observe(time.perf_counter() - start, op)
+
+    def _pool(self):
+        # Created per process so forked gunicorn workers each get their own children.
+        if self._executor is None or self._pid != os.getpid():
+            with self._lock:
+                if self._executor is None or self._pid != os.getpid():
+                    self._executor = ProcessPoolExecutor(max_workers=self.workers)
+                    self._pid = os.getpid()
+        return self._executor
+
+
+hasher = PasswordHasher()
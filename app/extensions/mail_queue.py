@@ -0,0 +1,232 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from flask_mail import Message
+from app.extensions.mail import mail
+from app.extensions.metrics import metrics
+
+#───────────────────────────────────────────────────────────────────────────────────────────────────────────────────
+# Off-request email delivery.
+#
+# send_email() only writes the message into a local SQLite outbox and returns. A background
+# thread (one per worker process) claims messages in batches, sends each batch over a single
+# SMTP connection, and retries failures with exponential backoff. Because the outbox lives on
+# disk, messages queued just before a restart survive it: start() runs the worker as soon as the
+# next process comes up (from init_app, or per worker from gunicorn's post_fork) if any are pending.
+#───────────────────────────────────────────────────────────────────────────────────────────────────────────────────
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id              INTEGER PRIMARY KEY AUTOINCREMENT,
+    subject         TEXT NOT NULL,
+    body            TEXT NOT NULL,
+    recipients      TEXT NOT NULL,
+    dedup_key       TEXT,
+    status          TEXT NOT NULL DEFAULT 'pending',
+    attempts        INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    claimed_by      TEXT,
+    claimed_at      REAL,
+    created_at      REAL NOT NULL,
+    last_error      TEXT
+);
+CREATE INDEX IF NOT EXISTS outbox_due ON outbox (status, next_attempt_at);
+CREATE INDEX IF NOT EXISTS outbox_dedup ON outbox (dedup_key, created_at);
+"""
+
+
+class MailQueue:
+    def __init__(self, app=None):
+        self.app = None
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('MAIL_QUEUE_PATH', os.path.join(app.instance_path, 'mail_queue.sqlite3'))
+        app.config.setdefault('MAIL_QUEUE_BATCH_SIZE', 20)
+        app.config.setdefault('MAIL_QUEUE_POLL_INTERVAL', 2.0)
+        app.config.setdefault('MAIL_QUEUE_MAX_ATTEMPTS', 6)
+        app.config.setdefault('MAIL_QUEUE_RETRY_BASE', 5.0)
+        app.config.setdefault('MAIL_QUEUE_DEDUP_WINDOW', 60.0)
+        app.config.setdefault('MAIL_QUEUE_ASYNC', True)
+        app.config.setdefault('MAIL_QUEUE_AUTOSTART', True)  # False: the server starts it per worker (gunicorn post_fork)
+        self.app = app
+        self.path = app.config['MAIL_QUEUE_PATH']
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        with self._connect() as db:
+            db.executescript(_SCHEMA)
+        app.extensions['mail_queue'] = self
+        if app.config['MAIL_QUEUE_AUTOSTART']:
+            self.start()
+
+    def start(self):
+        """Starts the worker if the outbox still holds mail from an earlier process."""
+        if self.app is None or not self.app.config['MAIL_QUEUE_ASYNC']:
+            return
+        with self._connect() as db:
+            pending = db.execute("SELECT 1 FROM outbox WHERE status = 'pending' LIMIT 1").fetchone()
+        if pending:
+            self._ensure_worker()
+            self._wakeup.set()
+
+    #─── producer side ──────────────────────────────────────────────────────────────────────────────────────────
+    def enqueue(self, subject, body, recipient, dedup_key=None):
+        """Queues an email for delivery. Returns False if it was dropped as a duplicate."""
+        now = time.time()
+        window = self.app.config['MAIL_QUEUE_DEDUP_WINDOW']
+        with self._connect() as db:
+            if dedup_key:
+                dup = db.execute(
+                    "SELECT 1 FROM outbox WHERE dedup_key = ? AND created_at > ? AND status != 'failed' LIMIT 1",
+                    (dedup_key, now - window),
+                ).fetchone()
+                if dup:
+                    print(f"[~] Skipped duplicate email ({dedup_key}) to {recipient}")
+                    return False
+            db.execute(
+                "INSERT INTO outbox (subject, body, recipients, dedup_key, next_attempt_at, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (subject, body, json.dumps([recipient]), dedup_key, now, now),
+            )
+
+        if self.app.config['MAIL_QUEUE_ASYNC']:
+            self._ensure_worker()
+            self._wakeup.set()
+        else:
+            self.drain()
+        return True
+
+    #─── consumer side ──────────────────────────────────────────────────────────────────────────────────────────
+    def drain(self):
+        """Delivers every message that is currently due. Returns the number sent."""
+        sent = 0
+        while True:
+            batch = self._claim_batch()
+            if not batch:
+                return sent
+            sent += self._deliver(batch)
+
+    def _claim_batch(self):
+        now = time.time()
+        owner = f"{os.getpid()}:{threading.get_ident()}"
+        stale = now - 300  # a worker that died mid-batch releases its claim after 5 minutes
+        with self._connect() as db:
+            db.execute("BEGIN IMMEDIATE")
+            rows = db.execute(
+                "SELECT id, subject, body, recipients, attempts FROM outbox "
+                "WHERE status = 'pending' AND next_attempt_at <= ? "
+                "AND (claimed_by IS NULL OR claimed_at < ?) "
+                "ORDER BY id LIMIT ?",
+                (now, stale, self.app.config['MAIL_QUEUE_BATCH_SIZE']),
+            ).fetchall()
+            if rows:
+                db.executemany(
+                    "UPDATE outbox SET claimed_by = ?, claimed_at = ? WHERE id = ?",
+                    [(owner, now, row[0]) for row in rows],
+                )
+        return rows
+
+    def _deliver(self, batch):
+        sent = 0
+        results = []
+        with self.app.app_context():
+            try:
+                # One SMTP session (connect, STARTTLS, login) for the whole batch
+                start = time.perf_counter()
+                with mail.connect() as conn:
+                    for msg_id, subject, body, recipients, attempts in batch:
+                        try:
+                            msg = Message(subject=subject, recipients=json.loads(recipients), body=body)
+                            conn.send(msg)
+                            results.append((msg_id, attempts, None))
+                            sent += 1
+                        except Exception as e:
+                            results.append((msg_id, attempts, str(e)))
+                        now = time.perf_counter()
+                        metrics.smtp.observe(now - start)
+                        start = now
+            except Exception as e:
+                # Connection or login failed: every unsent message in the batch is retried
+                done = {r[0] for r in results}
+                results.extend((row[0], row[4], str(e)) for row in batch if row[0] not in done)
+        self._record(results)
+        if sent:
+            print(f"[✓] Delivered {sent} queued email(s)")
+        return sent
+
+    def _record(self, results):
+        now = time.time()
+        max_attempts = self.app.config['MAIL_QUEUE_MAX_ATTEMPTS']
+        base = self.app.config['MAIL_QUEUE_RETRY_BASE']
+        with self._connect() as db:
+            for msg_id, attempts, error in results:
+                if error is None:
+                    db.execute(
+                        "UPDATE outbox SET status = 'sent', claimed_by = NULL, last_error = NULL WHERE id = ?",
+                        (msg_id,),
+                    )
+                    continue
+                attempts += 1
+                status = 'failed' if attempts >= max_attempts else 'pending'
+                print(f"[!] Email {msg_id} attempt {attempts} failed: {error}")
+                db.execute(
+                    "UPDATE outbox SET status = ?, attempts = ?, next_attempt_at = ?, "
+                    "claimed_by = NULL, last_error = ? WHERE id = ?",
+                    (status, attempts, now + base * (2 ** (attempts - 1)), error, msg_id),
+                )
+            # Sent rows are only kept long enough to deduplicate repeated requests
+            db.execute(
+                "DELETE FROM outbox WHERE status = 'sent' AND created_at < ?",
+                (now - self.app.config['MAIL_QUEUE_DEDUP_WINDOW'],),
+            )
+
+    def _ensure_worker(self):
+        # The thread is started lazily so it is created in each forked worker, not the master.
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='mail-queue', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        interval = self.app.config['MAIL_QUEUE_POLL_INTERVAL']
+        while not self._stop.is_set():
+            self._wakeup.wait(interval)
+            self._wakeup.clear()
+            try:
+                self.drain()
+            except Exception as e:
+                print(f"[!] Mail queue worker error: {e}")
+
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        db.execute("PRAGMA journal_mode=WAL")
+        return _Autoclose(db)
+
+
+class _Autoclose:
+    """sqlite3 connections don't close on ``with``; this one does."""
+
+    def __init__(self, db):
+        self.db = db
+
+    def __enter__(self):
+        return self.db
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.db.in_transaction:
+            if exc_type is None:
+                self.db.commit()
+            else:
+                self.db.rollback()
+        self.db.close()
+
+
+mail_queue = MailQueue()
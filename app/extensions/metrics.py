@@ -0,0 +1,183 @@
+import hmac
+import time
+import random
+import threading
+from collections import defaultdict
+from flask import request, Response, abort
+
+#───────────────────────────────────────────────────────────────────────────────────────────────────────────────────
+# Request tracing and latency histograms, exported in Prometheus text format at /metrics.
+#
+# Every request is counted, but only a METRICS_SAMPLE_RATE fraction is timed. For sampled
+# requests we also count the queries run and the time spent in them, via the instrumented
+# cursors in app/routes/postgresql.py. SMTP sends and bcrypt jobs are rare and expensive, so
+# they are always timed.
+#
+# The sampling decision is made in a thin wrapper around app.wsgi_app and kept in a thread-local
+# rather than flask.g: each extra Flask hook and context-local lookup costs microseconds per request.
+#
+# /metrics exposes pool, session and chat internals, so it answers only with
+# "Authorization: Bearer <METRICS_TOKEN>". Without a token configured it is a 404.
+#───────────────────────────────────────────────────────────────────────────────────────────────────────────────────
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 50)
+
+
+def _labels(names, values, extra=None):
+    pairs = [f'{n}="{str(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Histogram:
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self._series = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = {k: list(v) for k, v in self._series.items()}
+        for labels, series in sorted(snapshot.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                le = _labels(self.labelnames, labels, 'le="%s"' % bound)
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            le = _labels(self.labelnames, labels, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{le} {series[-1]}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {series[-2]}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {series[-1]}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._values = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] += amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            snapshot = dict(self._values)
+        for labels, value in sorted(snapshot.items()):
+            lines.append(f"{self.name}{_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+class Metrics:
+    def __init__(self, app=None):
+        self.sample_rate = 1.0
+        self.requests = Counter('http_requests_total', 'Requests handled.', ('endpoint', 'method', 'status'))
+        self.latency = Histogram('http_request_duration_seconds', 'Request latency (sampled).', ('endpoint', 'method'))
+        self.db_queries = Histogram('db_queries_per_request', 'Queries run per request (sampled).',
+                                    ('endpoint',), buckets=COUNT_BUCKETS)
+        self.db_time = Histogram('db_time_per_request_seconds', 'Time spent in queries per request (sampled).', ('endpoint',))
+        self.db_query = Histogram('db_query_duration_seconds', 'Single query latency (sampled).')
+        self.smtp = Histogram('smtp_send_duration_seconds', 'Time to send one queued email, including connect for the first of a batch.')
+        self.bcrypt = Histogram('bcrypt_duration_seconds', 'bcrypt job latency including pool wait.', ('op',))
+        self._collectors = []
+        self._local = threading.local()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('METRICS_SAMPLE_RATE', 0.1)
+        app.config.setdefault('METRICS_TOKEN', None)
+        self.sample_rate = float(app.config['METRICS_SAMPLE_RATE'])
+        self.token = app.config['METRICS_TOKEN']
+        app.wsgi_app = self._wrap(app.wsgi_app)
+        app.after_request(self._after_request)
+        app.add_url_rule('/metrics', 'metrics', self._export)
+        app.extensions['metrics'] = self
+
+    def add_collector(self, fn):
+        """Registers fn() -> {name: value}, read at scrape time and exported as gauges."""
+        self._collectors.append(fn)
+
+    #─── hooks ──────────────────────────────────────────────────────────────────────────────────────────────────
+    def _wrap(self, wsgi_app):
+        local = self._local
+
+        def wsgi(environ, start_response):
+            # [start, query count, query time] when sampled, False when not; None outside requests
+            if random.random() < self.sample_rate:
+                local.stats = [time.perf_counter(), 0, 0.0]
+            else:
+                local.stats = False
+            try:
+                return wsgi_app(environ, start_response)
+            finally:
+                local.stats = None
+        return wsgi
+
+    def _after_request(self, response):
+        req = request._get_current_object()
+        endpoint = req.endpoint or 'unmatched'
+        self.requests.inc(endpoint, req.method, response.status_code)
+        stats = getattr(self._local, 'stats', None)
+        if stats:
+            self.latency.observe(time.perf_counter() - stats[0], endpoint, req.method)
+            self.db_queries.observe(stats[1], endpoint)
+            self.db_time.observe(stats[2], endpoint)
+        return response
+
+    def record_query(self, seconds):
+        stats = getattr(self._local, 'stats', None)
+        if stats:
+            stats[1] += 1
+            stats[2] += seconds
+        elif stats is False or random.random() >= self.sample_rate:
+            return
+        self.db_query.observe(seconds)
+
+    #─── export ─────────────────────────────────────────────────────────────────────────────────────────────────
+    def _export(self):
+        if not self.token:
+            abort(404)
+        if not hmac.compare_digest(request.headers.get('Authorization', '').encode(), f"Bearer {self.token}".encode()):
+            abort(401)
+        lines = [
+            "# HELP metrics_sample_rate Fraction of requests that are timed.",
+            "# TYPE metrics_sample_rate gauge",
+            f"metrics_sample_rate {self.sample_rate}",
+        ]
+        for metric in (self.requests, self.latency, self.db_queries, self.db_time, self.db_query, self.smtp, self.bcrypt):
+            lines.extend(metric.render())
+        for collect in self._collectors:
+            try:
+                values = collect()
+            except Exception as e:
+                print(f"[!] Metrics collector failed: {e}")
+                continue
+            for name, value in values.items():
+                lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name} {float(value)}")
+        return Response("\n".join(lines) + "\n", mimetype='text/plain; version=0.0.4')
+
+
+metrics = Metrics()
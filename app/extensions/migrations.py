@@ -0,0 +1,123 @@
+import os
+import re
+import click
+
+#───────────────────────────────────────────────────────────────────────────────────────────────────────────────────
+# Versioned SQL migrations.
+#
+# Each file in app/migrations/ named NNNN_description.sql is one version. Applied versions are
+# recorded in schema_migrations; `flask migrate` applies the rest in order, each in its own
+# transaction. An advisory lock keeps two workers from migrating at the same time.
+#
+# With MIGRATE_ON_START (the default) create_app() also applies them, so a deploy never serves
+# requests against tables it expects but lacks (the server-side session store, read state, ...).
+# It uses a connection of its own, not the pool, so a preloaded gunicorn master hands its workers
+# an untouched pool. Once up to date, this costs one query per start.
+#───────────────────────────────────────────────────────────────────────────────────────────────────────────────────
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'migrations')
+_LOCK_ID = 727_001  # arbitrary, shared by every process running migrations
+_FILENAME = re.compile(r'^(\d{4})_[\w-]+\.sql$')
+
+
+def available_migrations():
+    """Returns [(version, path)] for every migration file, oldest first."""
+    found = []
+    for name in sorted(os.listdir(MIGRATIONS_DIR)):
+        match = _FILENAME.match(name)
+        if match:
+            found.append((match.group(1), os.path.join(MIGRATIONS_DIR, name)))
+    return found
+
+
+def applied_versions(conn):
+    with conn.cursor() as cur:
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version    VARCHAR(16) PRIMARY KEY,
+                applied_at TIMESTAMP NOT NULL DEFAULT NOW()
+            )
+        """)
+        cur.execute("SELECT version FROM schema_migrations")
+        versions = {row[0] if isinstance(row, tuple) else row['version'] for row in cur.fetchall()}
+    conn.commit()
+    return versions
+
+
+def upgrade(conn, target=None):
+    """Applies pending migrations up to and including ``target``. Returns the versions applied."""
+    applied = []
+    with conn.cursor() as cur:
+        cur.execute("SELECT pg_advisory_lock(%s)", (_LOCK_ID,))
+    conn.commit()
+    try:
+        done = applied_versions(conn)
+        for version, path in available_migrations():
+            if version in done:
+                continue
+            if target is not None and version > target:
+                break
+            with open(path, encoding='utf-8') as f:
+                sql = f.read()
+            try:
+                with conn.cursor() as cur:
+                    cur.execute(sql)
+                    cur.execute("INSERT INTO schema_migrations (version) VALUES (%s)", (version,))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            print(f"[✓] Applied migration {os.path.basename(path)}")
+            applied.append(version)
+    finally:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_advisory_unlock(%s)", (_LOCK_ID,))
+        conn.commit()
+    return applied
+
+
+def migrate_on_start(app):
+    """Applies pending migrations for create_app(). A failure is reported, not raised: the app still starts."""
+    from app.routes.postgresql import open_connection
+    try:
+        conn = open_connection()
+    except Exception as e:
+        print(f"[!] Could not connect to apply migrations: {e}")
+        return
+    try:
+        applied = upgrade(conn)
+        if applied:
+            print(f"[✓] {len(applied)} migration(s) applied at startup")
+    except Exception as e:
+        print(f"[!] Migrations failed at startup, run `flask migrate`: {e}")
+    finally:
+        conn.close()
+
+
+def init_app(app):
+    app.config.setdefault('MIGRATE_ON_START', True)
+    if app.config['MIGRATE_ON_START']:
+        migrate_on_start(app)
+
+    @app.cli.command('migrate')
+    @click.option('--target', default=None, help='Stop after this version (e.g. 0002).')
+    def migrate_command(target):
+        """Apply pending database migrations."""
+        pool = app.extensions['db_pool']
+        conn = pool.getconn()
+        try:
+            applied = upgrade(conn, target)
+        finally:
+            pool.putconn(conn)
+        click.echo(f"{len(applied)} migration(s) applied." if applied else "Database is up to date.")
+
+    @app.cli.command('migrate-status')
+    def migrate_status_command():
+        """List migrations and whether they have been applied."""
+        pool = app.extensions['db_pool']
+        conn = pool.getconn()
+        try:
+            done = applied_versions(conn)
+        finally:
+            pool.putconn(conn)
+        for version, path in available_migrations():
+            click.echo(f"[{'x' if version in done else ' '}] {os.path.basename(path)}")
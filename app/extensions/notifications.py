@@ -0,0 +1,410 @@
+import os
+import json
+import time
+import socket
+import asyncio
+import secrets
+import threading
+from collections import Counter, OrderedDict
+from urllib.parse import urlsplit, parse_qs
+from flask import Response, stream_with_context
+from app.extensions.event_bus import event_bus
+
+#───────────────────────────────────────────────────────────────────────────────────────────────────────────────────
+# Live notifications over Server-Sent Events.
+#
+# Each user has a small in-memory buffer of recent events, one per coalescing key (e.g. a chat
+# room). Publishing to a key that is still in the buffer (younger than NOTIFY_COALESCE_WINDOW)
+# merges into it: the count goes up and the event gets a new id, so a burst arrives as a single
+# "5 new messages" event. Streams also wait NOTIFY_COALESCE_DELAY after a wake-up before writing.
+# Event ids are "<process token>-<sequence>". A reconnecting EventSource sends the last one back
+# (Last-Event-ID) and gets only what it missed. If the buffer has dropped events since, the stream
+# first gets a "reset" event and the page reloads its state.
+#
+# There are two transports over the same buffers:
+#   * GET /notifications/stream in the routes blueprint, a streaming Flask response. Under gthread
+#     each open stream holds one worker thread. A process serves at most NOTIFY_FLASK_MAX_STREAMS
+#     of them at once, and each is closed after NOTIFY_STREAM_MAX_AGE seconds (EventSource
+#     reconnects from Last-Event-ID). Even so, this route suits development and small deployments.
+#   * The SSE listener (NOTIFY_SSE_PORT), an asyncio server on its own thread like the chat
+#     gateway. An idle stream there is a socket, a task and an Event. One timer writes the
+#     keep-alive comment to every stream, so idle streams cost no CPU in between.
+# Both cap streams per user (NOTIFY_MAX_STREAMS_PER_USER). The listener drops a client that stops
+# reading once NOTIFY_MAX_PENDING_BYTES are queued for it; the client resumes from Last-Event-ID.
+#
+# The pages only open a stream when NOTIFY_STREAM_URL is set: the listener's public URL where its
+# port is reachable, or /notifications/stream. Otherwise (the default, e.g. on Render, which
+# exposes one port) they poll GET /chat/unread every NOTIFY_POLL_INTERVAL seconds, which reads
+# the denormalized counters and frees the thread at once.
+# With the event bus, chat messages written by any process reach the streams held by this one.
+#───────────────────────────────────────────────────────────────────────────────────────────────────────────────────
+SSE_HEADERS = {
+    'Cache-Control': 'no-store',
+    'X-Accel-Buffering': 'no',  # nginx and Render's proxy must not buffer the stream
+}
+
+
+class Event:
+    __slots__ = ('seq', 'kind', 'key', 'data', 'count', 'first_ts', 'ts')
+
+    def __init__(self, seq, kind, key, data, count, ts):
+        self.seq = seq
+        self.kind = kind
+        self.key = key
+        self.data = data
+        self.count = count
+        self.first_ts = ts
+        self.ts = ts
+
+
+class UserBuffer:
+    __slots__ = ('events', 'floor', 'wakers', 'touched')
+
+    def __init__(self):
+        self.events = OrderedDict()  # key -> Event, in seq order
+        self.floor = 0               # highest seq dropped from the buffer
+        self.wakers = []             # one callable per open stream
+        self.touched = time.monotonic()
+
+
+class NotificationHub:
+    def __init__(self, app=None):
+        self.app = None
+        self._buffers = {}
+        self._lock = threading.Lock()
+        self._pid = None
+        self._token = None
+        self._seq = 0
+        self._published = 0
+        self._thread = None
+        self._server_pid = None
+        self._writers = set()
+        self.loop = None
+        self.streams = 0
+        self.flask_streams = 0
+        self.sent = 0
+        self.coalesced = 0
+        self.rejected = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('NOTIFY_BUFFER_SIZE', 50)         # events kept per user
+        app.config.setdefault('NOTIFY_BUFFER_TTL', 600)         # idle buffers are dropped after this
+        app.config.setdefault('NOTIFY_COALESCE_WINDOW', 60)
+        app.config.setdefault('NOTIFY_COALESCE_DELAY', 0.5)
+        app.config.setdefault('NOTIFY_KEEPALIVE', 25)
+        app.config.setdefault('NOTIFY_MAX_STREAMS_PER_USER', 5)
+        app.config.setdefault('NOTIFY_MAX_PENDING_BYTES', 64 * 1024)
+        app.config.setdefault('NOTIFY_STREAM_URL', None)          # None: the pages poll /chat/unread instead
+        app.config.setdefault('NOTIFY_POLL_INTERVAL', 30)
+        app.config.setdefault('NOTIFY_FLASK_MAX_STREAMS', 2)      # per process, each holds a worker thread
+        app.config.setdefault('NOTIFY_STREAM_MAX_AGE', 300)       # seconds before a Flask stream is closed
+        app.config.setdefault('NOTIFY_SSE_ENABLED', True)
+        app.config.setdefault('NOTIFY_SSE_HOST', '0.0.0.0')
+        app.config.setdefault('NOTIFY_SSE_PORT', 8766)
+        app.config.setdefault('NOTIFY_SSE_AUTOSTART', True)  # False: the server starts it per worker (post_fork)
+        app.config.setdefault('NOTIFY_CORS_ORIGINS', ())     # page origins allowed to use the listener cross-port
+        self.app = app
+        self.buffer_size = app.config['NOTIFY_BUFFER_SIZE']
+        self.buffer_ttl = app.config['NOTIFY_BUFFER_TTL']
+        self.window = app.config['NOTIFY_COALESCE_WINDOW']
+        self.delay = app.config['NOTIFY_COALESCE_DELAY']
+        self.keepalive = app.config['NOTIFY_KEEPALIVE']
+        self.max_streams = app.config['NOTIFY_MAX_STREAMS_PER_USER']
+        self.max_pending = app.config['NOTIFY_MAX_PENDING_BYTES']
+        self.max_flask_streams = app.config['NOTIFY_FLASK_MAX_STREAMS']
+        self.stream_max_age = app.config['NOTIFY_STREAM_MAX_AGE']
+        app.extensions['notifications'] = self
+        if app.config['NOTIFY_SSE_ENABLED'] and app.config['NOTIFY_SSE_AUTOSTART']:
+            self.start()
+
+    #─── buffers ────────────────────────────────────────────────────────────────────────────────────────────────
+    def _check_fork(self):
+        # Buffers, ids and subscribers belong to one process; a forked worker starts clean
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._buffers = {}
+                    self._token = secrets.token_hex(4)
+                    self._seq = 0
+                    self._pid = os.getpid()
+
+    def publish(self, user_id, kind, key=None, data=None, count=1):
+        """Adds an event for user_id, merging it into a recent one with the same key, and wakes their streams."""
+        self._check_fork()
+        key = key if key is not None else kind
+        now = time.time()
+        with self._lock:
+            buffer = self._buffers.get(user_id)
+            if buffer is None:
+                buffer = self._buffers[user_id] = UserBuffer()
+            self._seq += 1
+            event = buffer.events.pop(key, None)
+            if event is not None and now - event.first_ts <= self.window:
+                event.seq, event.ts, event.count = self._seq, now, event.count + count
+                event.data = data if data is not None else event.data
+                self.coalesced += 1
+            else:
+                event = Event(self._seq, kind, key, data, count, now)
+            buffer.events[key] = event
+            while len(buffer.events) > self.buffer_size:
+                _, dropped = buffer.events.popitem(last=False)
+                buffer.floor = dropped.seq
+            buffer.touched = time.monotonic()
+            wakers = list(buffer.wakers)
+            self._published += 1
+            if self._published % 1024 == 0:
+                self._sweep()
+        for wake in wakers:
+            wake()
+        return event.seq
+
+    def _sweep(self):
+        """Drops buffers nobody is listening to that have seen no event for NOTIFY_BUFFER_TTL (lock held)."""
+        cutoff = time.monotonic() - self.buffer_ttl
+        for user_id in [u for u, b in self._buffers.items() if not b.wakers and b.touched < cutoff]:
+            del self._buffers[user_id]
+
+    def subscribe(self, user_id, wake):
+        self._check_fork()
+        with self._lock:
+            buffer = self._buffers.get(user_id)
+            if buffer is None:
+                buffer = self._buffers[user_id] = UserBuffer()
+            if len(buffer.wakers) >= self.max_streams:
+                self.rejected += 1
+                return False
+            buffer.wakers.append(wake)
+            self.streams += 1
+            return True
+
+    def unsubscribe(self, user_id, wake):
+        with self._lock:
+            buffer = self._buffers.get(user_id)
+            if buffer is not None and wake in buffer.wakers:
+                buffer.wakers.remove(wake)
+                buffer.touched = time.monotonic()
+                self.streams -= 1
+
+    def parse_event_id(self, value):
+        """The sequence number in a Last-Event-ID from this process, else 0 (send the whole buffer)."""
+        token, _, seq = (value or '').partition('-')
+        if token == self._token and seq.isdigit():
+            return int(seq)
+        return 0
+
+    def since(self, user_id, last_seq):
+        """(events after last_seq in order, whether events were dropped that the client never got)."""
+        with self._lock:
+            buffer = self._buffers.get(user_id)
+            if buffer is None:
+                return [], False
+            reset = 0 < last_seq < buffer.floor
+            return [e for e in buffer.events.values() if e.seq > last_seq], reset
+
+    def format(self, event):
+        payload = dict(event.data or {}, key=event.key, count=event.count, ts=event.ts)
+        return (f"id: {self._token}-{event.seq}\nevent: {event.kind}\n"
+                f"data: {json.dumps(payload, separators=(',', ':'))}\n\n")
+
+    def _pending(self, user_id, last_seq):
+        events, reset = self.since(user_id, last_seq)
+        chunk = ''.join(self.format(e) for e in events)
+        if reset:
+            chunk = 'event: reset\ndata: {}\n\n' + chunk
+        return chunk, events[-1].seq if events else last_seq, len(events)
+
+    #─── producers ──────────────────────────────────────────────────────────────────────────────────────────────
+    def has_buffers(self):
+        self._check_fork()
+        return bool(self._buffers)
+
+    def messages_written(self, cur, rows, local_only=False):
+        """Called with each batch of (room, sender, body, created_at) chat rows: one event per member and room.
+
+        With local_only, members this process holds no buffer for are skipped: the event bus hands
+        every batch to every process, and the one the user is streaming from publishes it.
+        """
+        per_room = Counter((room, sender) for room, sender, _, _ in rows)
+        rooms = sorted({room for room, _ in per_room})
+        cur.execute("SELECT conversation_id, user_id FROM conversation_members WHERE conversation_id = ANY(%s)",
+                    (rooms,))
+        for member in cur.fetchall():
+            room, user_id = member['conversation_id'], member['user_id']
+            if local_only and user_id not in self._buffers:
+                continue
+            count = sum(n for (r, sender), n in per_room.items() if r == room and sender != user_id)
+            if count:
+                self.publish(user_id, 'message', key=f"room:{room}", data={'room': room}, count=count)
+
+    #─── Flask transport ────────────────────────────────────────────────────────────────────────────────────────
+    def stream_response(self, user_id, last_event_id=None):
+        """A streaming text/event-stream response for the routes blueprint (one thread per open stream)."""
+        with self._lock:
+            if self.flask_streams >= self.max_flask_streams:
+                self.rejected += 1
+                return Response("Notification streams are busy, use polling\n", status=503, mimetype='text/plain')
+            self.flask_streams += 1
+        wakeup = threading.Event()
+        if not self.subscribe(user_id, wakeup.set):
+            with self._lock:
+                self.flask_streams -= 1
+            return Response("Too many open notification streams\n", status=429, mimetype='text/plain')
+        last_seq = self.parse_event_id(last_event_id)
+        closed = []
+
+        def release():
+            # Runs when the server closes the response, whether or not the generator ever started
+            if not closed:
+                closed.append(True)
+                self.unsubscribe(user_id, wakeup.set)
+                with self._lock:
+                    self.flask_streams -= 1
+
+        def generate():
+            nonlocal last_seq
+            deadline = time.monotonic() + self.stream_max_age
+            yield 'retry: 5000\n\n'
+            while True:
+                chunk, last_seq, sent = self._pending(user_id, last_seq)
+                self.sent += sent
+                yield chunk or ': keep-alive\n\n'
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return  # give the thread back; EventSource reconnects with Last-Event-ID
+                if wakeup.wait(min(self.keepalive, remaining)):
+                    wakeup.clear()
+                    time.sleep(self.delay)  # let the rest of a burst land in the same event
+
+        response = Response(stream_with_context(generate()), mimetype='text/event-stream', headers=SSE_HEADERS)
+        response.call_on_close(release)
+        return response
+
+    #─── asyncio listener ───────────────────────────────────────────────────────────────────────────────────────
+    def start(self):
+        """Starts the SSE listener thread for this process (safe to call again after fork)."""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._server_pid == os.getpid():
+                return
+            self._server_pid = os.getpid()
+            self._writers = set()
+            self._ready = threading.Event()
+            self._thread = threading.Thread(target=self._run, name='notify-sse', daemon=True)
+            self._thread.start()
+        event_bus.start()
+        self._ready.wait(5)
+
+    def _run(self):
+        try:
+            asyncio.run(self._serve())
+        except Exception as e:
+            print(f"[!] Notification listener stopped: {e}")
+            self._ready.set()
+
+    async def _serve(self):
+        self.loop = asyncio.get_running_loop()
+        server = await asyncio.start_server(
+            self._handle, self.app.config['NOTIFY_SSE_HOST'], self.app.config['NOTIFY_SSE_PORT'],
+            reuse_port=hasattr(socket, 'SO_REUSEPORT'), backlog=1024, limit=8192,
+        )
+        async with server:
+            print(f"[✓] Notification stream listening on http://{self.app.config['NOTIFY_SSE_HOST']}:"
+                  f"{self.app.config['NOTIFY_SSE_PORT']}")
+            self._ready.set()
+            while True:
+                await asyncio.sleep(self.keepalive)
+                for writer in list(self._writers):
+                    if writer.transport.get_write_buffer_size() > self.max_pending:
+                        writer.transport.abort()
+                    else:
+                        writer.write(b': keep-alive\n\n')
+
+    def authenticate(self, headers):
+        """The user id for the session cookie in the request headers, or None (uses the chat gateway's lookup)."""
+        chat = self.app.extensions['chat']
+        session_data = chat.load_session(headers.get('cookie'))
+        return chat.resolve_user_id(session_data) if session_data else None
+
+    @staticmethod
+    def _reply(writer, status, body):
+        writer.write(f"HTTP/1.1 {status}\r\nContent-Type: text/plain\r\nContent-Length: {len(body)}\r\n"
+                     f"Connection: close\r\n\r\n{body}".encode())
+        writer.close()
+
+    async def _handle(self, reader, writer):
+        try:
+            head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), 10)
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            writer.close()
+            return
+        request_line, *lines = head.decode('latin-1').split('\r\n')
+        method, target = (request_line.split(' ') + ['', ''])[:2]
+        headers = {}
+        for line in lines:
+            name, _, value = line.partition(':')
+            if name:
+                headers[name.strip().lower()] = value.strip()
+        url = urlsplit(target)
+        if method != 'GET' or url.path != '/notifications/stream':
+            return self._reply(writer, '404 Not Found', 'Not found\n')
+
+        loop = asyncio.get_running_loop()
+        try:
+            user_id = await loop.run_in_executor(None, self.authenticate, headers)
+        except Exception as e:
+            print(f"[!] Notification auth lookup failed: {e}")
+            return self._reply(writer, '503 Service Unavailable', 'Try again later\n')
+        if user_id is None:
+            return self._reply(writer, '401 Unauthorized', 'Login required\n')
+
+        wakeup = asyncio.Event()
+
+        def wake():
+            loop.call_soon_threadsafe(wakeup.set)
+
+        if not self.subscribe(user_id, wake):
+            return self._reply(writer, '429 Too Many Requests', 'Too many open notification streams\n')
+        last_event_id = headers.get('last-event-id') or parse_qs(url.query).get('last_event_id', [None])[0]
+        last_seq = self.parse_event_id(last_event_id)
+
+        cors = ''
+        origin = headers.get('origin')
+        if origin and origin in self.app.config['NOTIFY_CORS_ORIGINS']:
+            cors = f"Access-Control-Allow-Origin: {origin}\r\nAccess-Control-Allow-Credentials: true\r\nVary: Origin\r\n"
+        writer.write(("HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-store\r\n"
+                      f"X-Accel-Buffering: no\r\nConnection: keep-alive\r\n{cors}\r\nretry: 5000\n\n").encode())
+        self._writers.add(writer)
+        # The client never sends anything else; EOF on the socket means it has gone away
+        closed = loop.create_task(reader.read(1))
+        closed.add_done_callback(lambda _: wakeup.set())
+        try:
+            while not closed.done() and not writer.is_closing():
+                chunk, last_seq, sent = self._pending(user_id, last_seq)
+                if chunk:
+                    writer.write(chunk.encode())
+                    self.sent += sent
+                    if writer.transport.get_write_buffer_size() > self.max_pending:
+                        break  # not reading: drop it, it resumes from Last-Event-ID
+                await wakeup.wait()
+                wakeup.clear()
+                if not closed.done():
+                    await asyncio.sleep(self.delay)  # let the rest of a burst land in the same event
+        finally:
+            self._writers.discard(writer)
+            self.unsubscribe(user_id, wake)
+            closed.cancel()
+            writer.close()
+
+    def stats(self):
+        return {
+            'users': len(self._buffers),
+            'streams': self.streams,
+            'flask_streams': self.flask_streams,
+            'sent': self.sent,
+            'coalesced': self.coalesced,
+            'rejected': self.rejected,
+        }
+
+
+notifications = NotificationHub()
@@ -0,0 +1,154 @@
+import os
+import json
+import time
+import pathlib
+import threading
+
+#───────────────────────────────────────────────────────────────────────────────────────────────────────────────────
+# Google OAuth client registry.
+#
+# The dev/prod client secrets in certs/ are parsed once per profile instead of on every login hop.
+# Token exchanges and certificate fetches share one pooled HTTP adapter, so the TLS connection to
+# Google is reused. Google's signing certificates are cached for as long as their Cache-Control
+# header allows, which makes ID token verification local CPU work on the hot path.
+#
+# google-auth, google_auth_oauthlib and requests take longer to import than the rest of the app put
+# together, so they are imported on the first Google login in each process, not at startup.
+#───────────────────────────────────────────────────────────────────────────────────────────────────────────────────
+SCOPES = [
+    "https://www.googleapis.com/auth/userinfo.profile",
+    "https://www.googleapis.com/auth/userinfo.email",
+    "openid"
+]
+GOOGLE_CERTS_URL = "https://www.googleapis.com/oauth2/v1/certs"
+GOOGLE_ISSUERS = ["accounts.google.com", "https://accounts.google.com"]
+DEV_HOSTS = ("localhost", "127.0.0.1", "192.168.", "ngrok")
+
+
+def _max_age(headers):
+    """Seconds a response may be reused for, from Cache-Control max-age minus Age."""
+    directives = [d.strip().lower() for d in headers.get('Cache-Control', '').split(',')]
+    if 'no-store' in directives or 'no-cache' in directives:
+        return 0
+    for directive in directives:
+        if directive.startswith('max-age='):
+            try:
+                return max(0, int(directive[8:]) - int(headers.get('Age', 0)))
+            except ValueError:
+                return 0
+    return 0
+
+
+class CachingRequest:
+    """google.auth transport that serves GETs of the given URLs from cache while they are fresh."""
+
+    def __init__(self, session, cacheable_urls):
+        from google.auth.transport.requests import Request
+        self._request = Request(session=session)
+        self.cacheable_urls = set(cacheable_urls)
+        self._cache = {}  # url -> (response, expires_at)
+        self._lock = threading.Lock()
+        self.fetches = 0
+
+    def __call__(self, url, method="GET", body=None, headers=None, timeout=None, **kwargs):
+        if method != "GET" or url not in self.cacheable_urls:
+            return self._request(url, method=method, body=body, headers=headers, timeout=timeout, **kwargs)
+
+        cached = self._cache.get(url)
+        if cached is not None and cached[1] > time.monotonic():
+            return cached[0]
+        with self._lock:
+            cached = self._cache.get(url)  # another thread may have refreshed it meanwhile
+            if cached is not None and cached[1] > time.monotonic():
+                return cached[0]
+            response = self._request(url, method=method, headers=headers, timeout=timeout, **kwargs)
+            self.fetches += 1
+            ttl = _max_age(response.headers)
+            if response.status == 200 and ttl:
+                response.data  # read the body now so the cached object is self-contained
+                self._cache[url] = (response, time.monotonic() + ttl)
+            return response
+
+
+class OAuthRegistry:
+    def __init__(self, app=None):
+        self._configs = {}
+        self._lock = threading.Lock()
+        self.adapter = None
+        self.http = None
+        self.transport = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault(
+            'OAUTH_CLIENT_SECRETS_DIR',
+            os.path.join(pathlib.Path(__file__).parent.parent.parent, 'certs')
+        )
+        app.config.setdefault('GOOGLE_CERTS_URL', GOOGLE_CERTS_URL)
+        self.secrets_dir = app.config['OAUTH_CLIENT_SECRETS_DIR']
+        self.certs_url = app.config['GOOGLE_CERTS_URL']
+        app.extensions['oauth'] = self
+
+    def _connect(self):
+        """Creates the connection pool shared by every OAuth2Session and certificate fetch in this process."""
+        if self.transport is not None:
+            return
+        with self._lock:
+            if self.transport is not None:
+                return
+            import requests
+            from requests.adapters import HTTPAdapter
+            self.adapter = HTTPAdapter(pool_connections=4, pool_maxsize=32)
+            self.http = requests.Session()
+            self.http.mount('https://', self.adapter)
+            self.http.mount('http://', self.adapter)
+            self.transport = CachingRequest(self.http, [self.certs_url])
+
+    @staticmethod
+    def profile_for_host(host):
+        return 'dev' if any(marker in host for marker in DEV_HOSTS) else 'prod'
+
+    def client_secrets_file(self, profile):
+        return os.path.join(self.secrets_dir, f'client_secret_{profile}.json')
+
+    def client_config(self, profile):
+        """Parsed client secrets for 'dev' or 'prod', read from disk only the first time."""
+        config = self._configs.get(profile)
+        if config is None:
+            with self._lock:
+                config = self._configs.get(profile)
+                if config is None:
+                    with open(self.client_secrets_file(profile), encoding='utf-8') as f:
+                        config = json.load(f)
+                    self._configs[profile] = config
+        return config
+
+    def flow(self, host, redirect_uri, state=None):
+        """A Google Flow for this host whose HTTP calls go through the shared connection pool."""
+        from google_auth_oauthlib.flow import Flow
+        self._connect()
+        flow = Flow.from_client_config(
+            self.client_config(self.profile_for_host(host)),
+            scopes=SCOPES,
+            redirect_uri=redirect_uri,
+            state=state,
+        )
+        flow.oauth2session.mount('https://', self.adapter)
+        flow.oauth2session.mount('http://', self.adapter)
+        return flow
+
+    def verify_id_token(self, token, audience):
+        """Same checks as google.oauth2.id_token.verify_oauth2_token, using cached signing certs."""
+        from google.oauth2 import id_token
+        from google.auth import exceptions
+        self._connect()
+        idinfo = id_token.verify_token(token, self.transport, audience=audience, certs_url=self.certs_url)
+        if idinfo["iss"] not in GOOGLE_ISSUERS:
+            raise exceptions.GoogleAuthError(
+                "Wrong issuer. 'iss' should be one of the following: {}".format(GOOGLE_ISSUERS)
+            )
+        return idinfo
+
+
+oauth_registry = OAuthRegistry()
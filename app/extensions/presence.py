@@ -0,0 +1,236 @@
+import os
+import time
+import atexit
+import threading
+from array import array
+from datetime import datetime, timezone
+from psycopg2.extras import execute_values
+from app.extensions.profile_cache import MemoryBackend
+
+#───────────────────────────────────────────────────────────────────────────────────────────────────────────────────
+# Presence: online / away / offline per user, from heartbeats sent by the dashboard pages.
+#
+# The index is two flat arrays indexed by user id: the last heartbeat (unix seconds, 4 bytes) and an
+# away flag (1 byte). A heartbeat overwrites its slot and marks the user dirty, so any number of
+# pings between flushes cost one row. Every PRESENCE_FLUSH_INTERVAL seconds a background thread
+# writes the dirty users to user_presence in one upsert. It then reads back the rows other workers
+# flushed since the last round, so each worker's index converges on the global state within an interval.
+#
+# Memory is fixed: 5 bytes per id, grown by doubling up to PRESENCE_MAX_USER_ID (at most 5 MiB for
+# 2**20 ids; 0.7 MiB at 100k users). The set of users waiting for the next flush holds at most
+# those active within one interval. Contacts are the users someone shares a conversation with;
+# they are cached per user as an array of ids, so "who of my contacts is online" is O(contacts).
+#───────────────────────────────────────────────────────────────────────────────────────────────────────────────────
+ONLINE, AWAY, OFFLINE = 'online', 'away', 'offline'
+
+CONTACTS_SQL = """
+    SELECT DISTINCT other.user_id
+    FROM conversation_members mine
+    JOIN conversation_members other ON other.conversation_id = mine.conversation_id
+    WHERE mine.user_id = %s AND other.user_id <> %s
+"""
+
+
+class Presence:
+    def __init__(self, app=None):
+        self.app = None
+        self._seen = array('I')  # user id -> last heartbeat in unix seconds, 0 if never
+        self._away = array('B')  # user id -> 1 if the page reported itself hidden or idle
+        self._dirty = set()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._synced_at = None
+        self._contacts = None
+        self.heartbeats = 0
+        self.flushed = 0
+        self.dropped = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('PRESENCE_ONLINE_TTL', 60)  # seconds without a heartbeat before online -> away
+        app.config.setdefault('PRESENCE_AWAY_TTL', 300)   # ... and before away -> offline
+        app.config.setdefault('PRESENCE_FLUSH_INTERVAL', 15.0)
+        app.config.setdefault('PRESENCE_MAX_USER_ID', 1 << 20)
+        app.config.setdefault('PRESENCE_CONTACTS_CACHE_SIZE', 10000)
+        app.config.setdefault('PRESENCE_CONTACTS_TTL', 300)
+        self.app = app
+        self.online_ttl = app.config['PRESENCE_ONLINE_TTL']
+        self.away_ttl = app.config['PRESENCE_AWAY_TTL']
+        self.max_user_id = app.config['PRESENCE_MAX_USER_ID']
+        self._contacts = MemoryBackend(app.config['PRESENCE_CONTACTS_CACHE_SIZE'],
+                                       ttl=app.config['PRESENCE_CONTACTS_TTL'])
+        atexit.register(self.flush)
+        app.extensions['presence'] = self
+
+    #─── heartbeats ─────────────────────────────────────────────────────────────────────────────────────────────
+    def heartbeat(self, user_id, away=False, now=None):
+        """Records that the user has a dashboard open. Returns False for ids outside the budget."""
+        if not 0 < user_id < self.max_user_id:
+            self.dropped += 1
+            return False
+        if user_id >= len(self._seen):
+            self._grow(user_id)
+        self._seen[user_id] = int(now if now is not None else time.time())
+        self._away[user_id] = 1 if away else 0
+        self._dirty.add(user_id)
+        self.heartbeats += 1
+        self._ensure_worker()
+        return True
+
+    def _grow(self, user_id):
+        # Doubling keeps growth amortized; the cap keeps the index within the memory budget
+        with self._lock:
+            size = len(self._seen)
+            if user_id < size:
+                return
+            new_size = min(self.max_user_id, max(user_id + 1, size * 2, 1024))
+            self._seen.frombytes(bytes((new_size - size) * self._seen.itemsize))
+            self._away.frombytes(bytes(new_size - size))
+
+    #─── lookups ────────────────────────────────────────────────────────────────────────────────────────────────
+    def state(self, user_id, now=None):
+        now = now if now is not None else time.time()
+        seen = self._seen[user_id] if 0 < user_id < len(self._seen) else 0
+        age = now - seen
+        if age <= self.online_ttl:
+            return AWAY if self._away[user_id] else ONLINE
+        if age <= self.away_ttl:
+            return AWAY
+        return OFFLINE
+
+    def last_seen(self, user_id):
+        seen = self._seen[user_id] if 0 < user_id < len(self._seen) else 0
+        return datetime.fromtimestamp(seen, timezone.utc) if seen else None
+
+    def contacts(self, user_id):
+        """Ids of the users who share a conversation with user_id (cached)."""
+        ids = self._contacts.get(user_id)
+        if ids is None:
+            pool = self.app.extensions['db_pool']
+            conn = pool.getconn()
+            try:
+                with conn.cursor() as cur:
+                    cur.execute(CONTACTS_SQL, (user_id, user_id))
+                    ids = array('I', (row['user_id'] for row in cur.fetchall()))
+            finally:
+                pool.putconn(conn)
+            self._contacts.set(user_id, ids)
+        return ids
+
+    def invalidate_contacts(self, *user_ids):
+        self._contacts.delete(*user_ids)
+
+    def contacts_status(self, user_id):
+        """The user's contacts that are online or away; everyone else in contacts() is offline."""
+        self._ensure_worker()  # keeps this worker's index synced even if it receives no heartbeats
+        now = time.time()
+        online, away = [], []
+        for contact in self.contacts(user_id):
+            state = self.state(contact, now)
+            if state == ONLINE:
+                online.append(contact)
+            elif state == AWAY:
+                away.append(contact)
+        return {'online': online, 'away': away}
+
+    #─── flush and sync ─────────────────────────────────────────────────────────────────────────────────────────
+    def flush(self):
+        """Writes the users seen since the last flush in one upsert. Returns the number of rows."""
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+        if not dirty or self.app is None:
+            return 0
+        rows = [(user_id, self._seen[user_id], bool(self._away[user_id])) for user_id in dirty]
+        try:
+            pool = self.app.extensions['db_pool']
+            conn = pool.getconn()
+            try:
+                with conn.cursor() as cur:
+                    execute_values(cur, """
+                        INSERT INTO user_presence AS p (user_id, last_seen, away) VALUES %s
+                        ON CONFLICT (user_id) DO UPDATE SET
+                            last_seen = GREATEST(p.last_seen, EXCLUDED.last_seen),
+                            away = CASE WHEN EXCLUDED.last_seen >= p.last_seen THEN EXCLUDED.away ELSE p.away END
+                    """, rows, template="(%s, to_timestamp(%s), %s)")
+                conn.commit()
+            finally:
+                pool.putconn(conn)
+        except Exception as e:
+            print(f"[!] Could not flush presence: {e}")
+            with self._lock:
+                self._dirty.update(dirty)
+            return 0
+        self.flushed += len(rows)
+        return len(rows)
+
+    def sync(self):
+        """Merges in the heartbeats other workers have flushed since the previous sync."""
+        if self._synced_at is None:
+            since = time.time() - self.away_ttl
+        else:
+            # A heartbeat reaches the table at most one flush interval after it happened
+            since = self._synced_at - self.app.config['PRESENCE_FLUSH_INTERVAL'] - 5
+        pool = self.app.extensions['db_pool']
+        conn = pool.getconn()
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT EXTRACT(EPOCH FROM NOW()) AS now")
+                synced_at = float(cur.fetchone()['now'])
+                cur.execute("""
+                    SELECT user_id, EXTRACT(EPOCH FROM last_seen)::bigint AS seen, away
+                    FROM user_presence WHERE last_seen > to_timestamp(%s)
+                """, (since,))
+                rows = cur.fetchall()
+            conn.commit()
+        finally:
+            pool.putconn(conn)
+        merged = 0
+        for row in rows:
+            user_id = row['user_id']
+            if not 0 < user_id < self.max_user_id:
+                continue
+            if user_id >= len(self._seen):
+                self._grow(user_id)
+            if row['seen'] > self._seen[user_id]:
+                self._seen[user_id] = row['seen']
+                self._away[user_id] = 1 if row['away'] else 0
+                merged += 1
+        self._synced_at = synced_at
+        return merged
+
+    def _ensure_worker(self):
+        # Started lazily so each forked worker flushes and syncs its own index
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._synced_at = None
+            self._thread = threading.Thread(target=self._run, name='presence-flush', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        interval = self.app.config['PRESENCE_FLUSH_INTERVAL']
+        while True:
+            time.sleep(interval)
+            self.flush()
+            try:
+                self.sync()
+            except Exception as e:
+                print(f"[!] Could not sync presence: {e}")
+
+    def stats(self):
+        return {
+            'index_bytes': len(self._seen) * self._seen.itemsize + len(self._away),
+            'heartbeats': self.heartbeats,
+            'pending': len(self._dirty),
+            'flushed': self.flushed,
+            'dropped': self.dropped,
+            'contacts_cached': len(self._contacts) if self._contacts is not None else 0,
+        }
+
+
+presence = Presence()
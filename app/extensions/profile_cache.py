@@ -0,0 +1,156 @@
+import json
+import time
+import threading
+from collections import OrderedDict
+from app.routes.postgresql import get_db_connection
+
+#───────────────────────────────────────────────────────────────────────────────────────────────────────────────────
+# User-profile cache for the dashboards.
+#
+# Profiles are cached under both "id:<id>" and "email:<email>" so either dashboard can hit.
+# Routes that change a user call invalidate() with whatever they know; entries also expire
+# after PROFILE_CACHE_TTL seconds. The in-process backend is per worker, and invalidate() only
+# reaches the worker that served the change. It therefore keeps entries for 5 seconds by default,
+# which absorbs a burst of dashboard requests while bounding how long another worker shows a
+# stale profile (e.g. a revoked is_admin). The Redis backend is shared, so invalidations are seen
+# everywhere at once and entries keep for 300 seconds.
+#───────────────────────────────────────────────────────────────────────────────────────────────────────────────────
+PROFILE_COLUMNS = "id, username, email_address, is_admin, is_verified, picture"
+
+
+class MemoryBackend:
+    """Thread-safe LRU with a per-entry TTL."""
+
+    def __init__(self, maxsize=10000, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def __len__(self):
+        return len(self._data)
+
+
+class RedisBackend:
+    """Any Redis-protocol server (Redis, Valkey, KeyDB, ...); the LRU bound is the server's maxmemory policy."""
+
+    def __init__(self, url, ttl=300, prefix='profile:'):
+        import redis  # optional dependency, only needed for this backend
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, key):
+        raw = self.client.get(self.prefix + key)
+        return json.loads(raw) if raw is not None else None
+
+    def set(self, key, value):
+        self.client.set(self.prefix + key, json.dumps(value), ex=self.ttl)
+
+    def delete(self, *keys):
+        if keys:
+            self.client.delete(*(self.prefix + key for key in keys))
+
+    def __len__(self):
+        return 0
+
+
+class ProfileCache:
+    def __init__(self, app=None):
+        self.backend = None
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('PROFILE_CACHE_BACKEND', 'memory')
+        app.config.setdefault('PROFILE_CACHE_URL', 'redis://localhost:6379/0')
+        app.config.setdefault('PROFILE_CACHE_TTL', 300 if app.config['PROFILE_CACHE_BACKEND'] == 'redis' else 5)
+        app.config.setdefault('PROFILE_CACHE_SIZE', 10000)
+        if app.config['PROFILE_CACHE_BACKEND'] == 'redis':
+            self.backend = RedisBackend(app.config['PROFILE_CACHE_URL'], ttl=app.config['PROFILE_CACHE_TTL'])
+        else:
+            self.backend = MemoryBackend(app.config['PROFILE_CACHE_SIZE'], ttl=app.config['PROFILE_CACHE_TTL'])
+        app.extensions['profile_cache'] = self
+
+    def get_by_id(self, user_id):
+        return self._get(f"id:{user_id}", "id = %s", user_id)
+
+    def get_by_email(self, email):
+        return self._get(f"email:{email}", "email_address = %s", email)
+
+    def invalidate(self, user_id=None, email=None):
+        keys = set()
+        if user_id is not None:
+            keys.add(f"id:{user_id}")
+        if email:
+            keys.add(f"email:{email}")
+        # The profile is stored under both keys; drop the twin of whichever one we were given.
+        for key in list(keys):
+            cached = self.backend.get(key)
+            if cached is not None:
+                keys.add(f"id:{cached['id']}")
+                if cached.get('email_address'):
+                    keys.add(f"email:{cached['email_address']}")
+        self.backend.delete(*keys)
+        self.invalidations += 1
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "invalidations": self.invalidations,
+            "entries": len(self.backend),
+        }
+
+    def _get(self, key, predicate, value):
+        """Returns the cached profile dict, loading it on the request's pooled connection on a miss."""
+        profile = self.backend.get(key)
+        if profile is not None:
+            self.hits += 1
+            return profile
+        self.misses += 1
+        conn = get_db_connection()
+        if conn is None:
+            raise RuntimeError("Database unavailable")
+        with conn.cursor() as cursor:
+            cursor.execute(f"SELECT {PROFILE_COLUMNS} FROM users WHERE {predicate}", (value,))
+            row = cursor.fetchone()
+        if row is None:
+            return None  # misses aren't cached; a new signup must be visible immediately
+        profile = dict(row)
+        self.backend.set(f"id:{profile['id']}", profile)
+        if profile.get('email_address'):
+            self.backend.set(f"email:{profile['email_address']}", profile)
+        return profile
+
+
+profile_cache = ProfileCache()
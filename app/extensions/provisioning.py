@@ -0,0 +1,54 @@
+from app.routes.postgresql import db_connection
+from app.extensions.profile_cache import profile_cache
+
+#───────────────────────────────────────────────────────────────────────────────────────────────────────────────────
+# Creates or refreshes the users row for a Google or Facebook sign-in in one statement.
+#
+# INSERT ... ON CONFLICT on the provider's partial unique index (migration 0003) either creates the
+# row or updates the name and picture of the existing one, and RETURNING hands back the profile. Two
+# concurrent first logins for the same account cannot both insert: the loser of the race waits on the
+# index entry and takes the DO UPDATE branch. An uploaded avatar (/avatars/...) is never replaced by
+# the provider's picture.
+#───────────────────────────────────────────────────────────────────────────────────────────────────────────────────
+PROVIDER_COLUMNS = {'google': 'google_id', 'facebook': 'facebook_id'}
+
+UPSERT = """
+    INSERT INTO users (username, email_address, picture, is_verified, {column})
+    VALUES (%(name)s, %(email)s, %(picture)s, %(verified)s, %(subject)s)
+    ON CONFLICT ({column}) WHERE {column} IS NOT NULL DO UPDATE SET
+        username = EXCLUDED.username,
+        email_address = COALESCE(EXCLUDED.email_address, users.email_address),
+        picture = CASE WHEN users.picture LIKE '/avatars/%%' THEN users.picture
+                       ELSE COALESCE(EXCLUDED.picture, users.picture) END,
+        is_verified = users.is_verified OR EXCLUDED.is_verified
+    RETURNING id, username, email_address, is_admin, is_verified, picture, (xmax = 0) AS created
+"""
+
+
+class UserProvisioner:
+    def __init__(self, app=None):
+        self._statements = {provider: UPSERT.format(column=column) for provider, column in PROVIDER_COLUMNS.items()}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.extensions['provisioning'] = self
+
+    def provision(self, provider, subject, name, email=None, picture=None, verified=False):
+        """Returns the users row for (provider, subject), creating or refreshing it in one round trip.
+
+        The row is a dict with id, username, email_address, is_admin, is_verified, picture and
+        created (True when this call inserted it).
+        """
+        statement = self._statements[provider]  # KeyError for an unknown provider, never interpolated SQL
+        params = {'subject': str(subject), 'name': name, 'email': email, 'picture': picture or None,
+                  'verified': verified}
+        with db_connection() as conn, conn.cursor() as cur:
+            cur.execute(statement, params)
+            user = dict(cur.fetchone())
+            conn.commit()
+        profile_cache.invalidate(user_id=user['id'], email=user['email_address'])
+        return user
+
+
+provisioner = UserProvisioner()
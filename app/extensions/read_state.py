@@ -0,0 +1,206 @@
+import os
+import atexit
+import threading
+import psycopg2
+from psycopg2.extras import execute_values
+
+#───────────────────────────────────────────────────────────────────────────────────────────────────────────────────
+# Unread counters and read receipts (columns added to conversation_members by migration 0008).
+#
+# Counting: the chat MessageWriter calls messages_written() inside each batch's transaction. A single
+# UPDATE adds, for every member, the batch's messages from others past their last_read_id. A burst of
+# 200 messages in one room is one row write per member, not 200.
+#
+# Receipts: clients report the newest message id they have on screen, over the chat socket
+# ({"type": "read", "room": 12, "id": 3456}) or POST /chat/conversations/<id>/read. mark_read() only
+# raises an in-memory high-water mark per (user, room). Scrolling through a hundred messages in the
+# same interval costs nothing more. Every READ_STATE_FLUSH_INTERVAL seconds a background thread
+# writes the marks in one statement and recounts unread exactly for those rows. This also corrects
+# any drift in the counters. Ids outside the int4/int8 columns are refused up front. If the batch
+# still fails on a bad value, the marks are written one by one and only the bad ones are dropped,
+# so a single receipt cannot wedge every later flush.
+#
+# Both writes lock member rows in (conversation_id, user_id) order, so two workers writing the same
+# rooms wait for each other instead of deadlocking.
+#───────────────────────────────────────────────────────────────────────────────────────────────────────────────────
+COUNT_SQL = """
+    WITH batch AS (
+        SELECT m.conversation_id, m.user_id, COUNT(*) AS n
+        FROM (VALUES %s) AS v (room, id, sender)
+        JOIN conversation_members m
+          ON m.conversation_id = v.room AND m.user_id <> v.sender AND m.last_read_id < v.id
+        GROUP BY m.conversation_id, m.user_id
+    ), locked AS (
+        SELECT cm.conversation_id, cm.user_id FROM conversation_members cm
+        JOIN batch USING (conversation_id, user_id)
+        ORDER BY cm.conversation_id, cm.user_id
+        FOR UPDATE OF cm
+    )
+    UPDATE conversation_members cm SET unread = cm.unread + batch.n
+    FROM batch JOIN locked USING (conversation_id, user_id)
+    WHERE cm.conversation_id = batch.conversation_id AND cm.user_id = batch.user_id
+"""
+
+RECEIPTS_SQL = """
+    WITH receipts AS (
+        SELECT * FROM (VALUES %s) AS v (conversation_id, user_id, id)
+    ), locked AS (
+        SELECT cm.conversation_id, cm.user_id FROM conversation_members cm
+        JOIN receipts r USING (conversation_id, user_id)
+        WHERE r.id > cm.last_read_id
+        ORDER BY cm.conversation_id, cm.user_id
+        FOR UPDATE OF cm
+    )
+    UPDATE conversation_members cm SET
+        last_read_id = r.id,
+        unread = (SELECT COUNT(*) FROM messages m
+                  WHERE m.conversation_id = cm.conversation_id AND m.id > r.id AND m.sender_id <> cm.user_id)
+    FROM receipts r JOIN locked USING (conversation_id, user_id)
+    WHERE cm.conversation_id = r.conversation_id AND cm.user_id = r.user_id AND r.id > cm.last_read_id
+"""
+
+MAX_ROOM_ID = 2 ** 31 - 1      # conversation_members.conversation_id is an int4
+MAX_MESSAGE_ID = 2 ** 63 - 1   # messages.id is an int8
+
+
+def valid_receipt(room, message_id):
+    """True when both ids are ints (not bools) that fit their columns."""
+    return (type(room) is int and 1 <= room <= MAX_ROOM_ID
+            and type(message_id) is int and 1 <= message_id <= MAX_MESSAGE_ID)
+
+
+class ReadState:
+    def __init__(self, app=None):
+        self.app = None
+        self._pending = {}  # user_id -> {room: highest message id reported read}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._wakeup = threading.Event()
+        self.receipts = 0
+        self.flushed = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('READ_STATE_FLUSH_INTERVAL', 2.0)
+        self.app = app
+        atexit.register(self.flush)
+        app.extensions['read_state'] = self
+
+    #─── counters ───────────────────────────────────────────────────────────────────────────────────────────────
+    def messages_written(self, cur, inserted):
+        """Raises unread for every member but the sender, from a batch of inserted (id, room, sender) rows."""
+        rows = [(row['conversation_id'], row['id'], row['sender_id']) for row in inserted]
+        execute_values(cur, COUNT_SQL, rows, template="(%s::int, %s::bigint, %s::int)", page_size=max(len(rows), 1))
+
+    def unread_counts(self, user_id):
+        """{conversation id: {'unread': n, 'last_read_id': id}} for every conversation the user is in."""
+        self.flush(user_id)  # what they just read must not show as unread
+        pool = self.app.extensions['db_pool']
+        conn = pool.getconn()
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT conversation_id, unread, last_read_id FROM conversation_members WHERE user_id = %s",
+                            (user_id,))
+                rows = cur.fetchall()
+            conn.commit()
+        finally:
+            pool.putconn(conn)
+        return {row['conversation_id']: {'unread': row['unread'], 'last_read_id': row['last_read_id']} for row in rows}
+
+    #─── receipts ───────────────────────────────────────────────────────────────────────────────────────────────
+    def mark_read(self, user_id, room, message_id):
+        """Records that user_id has read room up to message_id, written at the next flush. False if the ids are invalid."""
+        if not valid_receipt(room, message_id):
+            return False
+        with self._lock:
+            rooms = self._pending.setdefault(user_id, {})
+            if message_id > rooms.get(room, 0):
+                rooms[room] = message_id
+            self.receipts += 1
+        self._ensure_worker()
+        return True
+
+    def flush(self, user_id=None):
+        """Writes the pending read marks (all, or only user_id's) in one statement. Returns the number of marks."""
+        with self._lock:
+            if user_id is None:
+                pending, self._pending = self._pending, {}
+            else:
+                rooms = self._pending.pop(user_id, None)
+                pending = {user_id: rooms} if rooms else {}
+        if not pending or self.app is None:
+            return 0
+        rows = sorted((room, user, message_id) for user, rooms in pending.items() for room, message_id in rooms.items())
+        try:
+            pool = self.app.extensions['db_pool']
+            conn = pool.getconn()
+            try:
+                with conn.cursor() as cur:
+                    try:
+                        self._write(cur, rows)
+                    except psycopg2.DataError as e:
+                        conn.rollback()
+                        print(f"[!] Read receipt batch rejected ({e}); writing marks one by one")
+                        rows = self._write_each(cur, rows)
+                conn.commit()
+            finally:
+                pool.putconn(conn)
+        except Exception as e:
+            print(f"[!] Could not flush read receipts: {e}")
+            with self._lock:
+                for user, rooms in pending.items():
+                    current = self._pending.setdefault(user, {})
+                    for room, message_id in rooms.items():
+                        if message_id > current.get(room, 0):
+                            current[room] = message_id
+            return 0
+        self.flushed += len(rows)
+        return len(rows)
+
+    @staticmethod
+    def _write(cur, rows):
+        execute_values(cur, RECEIPTS_SQL, rows, template="(%s::int, %s::int, %s::bigint)", page_size=len(rows))
+
+    def _write_each(self, cur, rows):
+        """Writes rows one at a time under savepoints, dropping those the database rejects. Returns the rest."""
+        written = []
+        for row in rows:
+            cur.execute("SAVEPOINT receipt")
+            try:
+                self._write(cur, [row])
+            except psycopg2.DataError as e:
+                cur.execute("ROLLBACK TO SAVEPOINT receipt")
+                print(f"[!] Dropped read receipt {row}: {e}")
+                continue
+            cur.execute("RELEASE SAVEPOINT receipt")
+            written.append(row)
+        return written
+
+    def _ensure_worker(self):
+        # Started lazily so each forked worker flushes its own marks
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='read-state-flush', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        interval = self.app.config['READ_STATE_FLUSH_INTERVAL']
+        while True:
+            self._wakeup.wait(interval)
+            self.flush()
+
+    def stats(self):
+        return {
+            'pending': sum(len(rooms) for rooms in list(self._pending.values())),
+            'receipts': self.receipts,
+            'flushed': self.flushed,
+        }
+
+
+read_state = ReadState()
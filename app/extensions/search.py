@@ -0,0 +1,132 @@
+from app.extensions.profile_cache import MemoryBackend
+
+#───────────────────────────────────────────────────────────────────────────────────────────────────────────────────
+# Search over messages and users (indexes in migration 0007).
+#
+# Messages: websearch_to_tsquery against the generated body_tsv column, limited to the caller's
+# conversations and paged newest-first by id, like the message history. Quoted phrases, "or" and
+# -exclusions work as in a web search box.
+#
+# Users: autocomplete on username. Prefix matches come first, in name order. Queries of at least
+# SEARCH_FUZZY_MIN_LENGTH characters that leave room in the page are topped up with pg_trgm
+# fuzzy matches ("alcie" -> alice). Autocomplete sends a request per keystroke, and most of them
+# are the same short prefixes. Results are therefore shared by all users, kept in an in-process
+# LRU of SEARCH_PREFIX_CACHE_SIZE queries for SEARCH_PREFIX_CACHE_TTL seconds. A new or renamed
+# user shows up in cached results once the entry expires.
+#───────────────────────────────────────────────────────────────────────────────────────────────────────────────────
+MAX_QUERY_LENGTH = 64
+MAX_PAGE_SIZE = 100
+
+PREFIX_SQL = """
+    SELECT id, username, picture FROM users
+    WHERE lower(username) COLLATE "C" LIKE %s AND is_verified
+    ORDER BY lower(username) COLLATE "C", id
+    LIMIT %s
+"""
+
+FUZZY_SQL = """
+    SELECT id, username, picture FROM users
+    WHERE lower(username) %% %s AND NOT lower(username) COLLATE "C" LIKE %s AND is_verified
+    ORDER BY similarity(lower(username), %s) DESC, id
+    LIMIT %s
+"""
+
+MESSAGES_SQL = """
+    SELECT id, conversation_id, sender_id, body, created_at FROM messages
+    WHERE conversation_id = ANY(ARRAY(
+              SELECT conversation_id FROM conversation_members
+              WHERE user_id = %(user_id)s AND (%(room)s::int IS NULL OR conversation_id = %(room)s)))
+      AND body_tsv @@ websearch_to_tsquery('simple', %(q)s)
+      AND id < %(before)s
+    ORDER BY id DESC
+    LIMIT %(limit)s
+"""
+
+
+def _like_prefix(text):
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+
+
+class Search:
+    def __init__(self, app=None):
+        self.app = None
+        self._prefixes = None
+        self.hits = 0
+        self.misses = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('SEARCH_MAX_RESULTS', 20)
+        app.config.setdefault('SEARCH_FUZZY_MIN_LENGTH', 3)
+        app.config.setdefault('SEARCH_PREFIX_CACHE_SIZE', 4096)
+        app.config.setdefault('SEARCH_PREFIX_CACHE_TTL', 60)
+        self.app = app
+        self.max_results = app.config['SEARCH_MAX_RESULTS']
+        self._prefixes = MemoryBackend(app.config['SEARCH_PREFIX_CACHE_SIZE'],
+                                       ttl=app.config['SEARCH_PREFIX_CACHE_TTL'])
+        app.extensions['search'] = self
+
+    #─── users ──────────────────────────────────────────────────────────────────────────────────────────────────
+    def users(self, query):
+        """Verified users whose name starts with query, then close misspellings (cached per query)."""
+        query = ' '.join(query.lower().split())[:MAX_QUERY_LENGTH]
+        if not query:
+            return []
+        results = self._prefixes.get(query)
+        if results is not None:
+            self.hits += 1
+            return results
+        self.misses += 1
+        results = self.find_users(query)
+        self._prefixes.set(query, results)
+        return results
+
+    def find_users(self, query):
+        limit = self.max_results
+        pattern = _like_prefix(query)
+        pool = self.app.extensions['db_pool']
+        conn = pool.getconn()
+        try:
+            with conn.cursor() as cur:
+                cur.execute(PREFIX_SQL, (pattern, limit))
+                results = [dict(row) for row in cur.fetchall()]
+                if len(results) < limit and len(query) >= self.app.config['SEARCH_FUZZY_MIN_LENGTH']:
+                    cur.execute(FUZZY_SQL, (query, pattern, query, limit - len(results)))
+                    results += [dict(row) for row in cur.fetchall()]
+            conn.commit()
+        finally:
+            pool.putconn(conn)
+        return results
+
+    #─── messages ───────────────────────────────────────────────────────────────────────────────────────────────
+    def messages(self, user_id, query, conversation_id=None, before=None, limit=None):
+        """Newest messages matching query in the user's conversations (or one of them), below id ``before``."""
+        query = query.strip()[:256]
+        if not query:
+            return []
+        limit = min(limit or self.max_results, MAX_PAGE_SIZE)
+        pool = self.app.extensions['db_pool']
+        conn = pool.getconn()
+        try:
+            with conn.cursor() as cur:
+                cur.execute(MESSAGES_SQL, {
+                    'user_id': user_id, 'room': conversation_id, 'q': query,
+                    'before': before if before is not None else 2 ** 63 - 1, 'limit': limit,
+                })
+                rows = cur.fetchall()
+            conn.commit()
+        finally:
+            pool.putconn(conn)
+        return [{'id': row['id'], 'room': row['conversation_id'], 'sender': row['sender_id'],
+                 'body': row['body'], 'created_at': row['created_at'].isoformat()} for row in rows]
+
+    def stats(self):
+        return {
+            'prefix_cached': len(self._prefixes) if self._prefixes is not None else 0,
+            'prefix_hits': self.hits,
+            'prefix_misses': self.misses,
+        }
+
+
+search = Search()
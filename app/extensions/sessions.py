@@ -0,0 +1,245 @@
+import re
+import time
+import secrets
+import random
+import msgpack
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+from app.extensions.profile_cache import MemoryBackend
+
+#───────────────────────────────────────────────────────────────────────────────────────────────────────────────────
+# Server-side sessions.
+#
+# The cookie carries only "<sid>.<version>". The data is msgpack in SESSION_BACKEND: 'redis' (any
+# Redis-compatible server), 'postgres' (the UNLOGGED sessions table, migration 0004) or 'memory' (per
+# process, for development). 'cookie' keeps Flask's signed cookie.
+#
+# Each worker keeps an LRU of recently seen sessions in front of the store. The version in the cookie
+# goes up on every write, so a cached entry is used only when it is the version the client holds;
+# another worker's write makes it a miss, never stale data. A session is written, and the cookie set,
+# only when its serialized bytes change. Rewriting the same values (as dashboardx does) costs nothing.
+# Otherwise the store's expiry is pushed forward once half of PERMANENT_SESSION_LIFETIME has passed.
+#
+# A session whose login identity changes (user_id or google_id gained, changed or dropped) is saved
+# under a fresh sid and the old entry deleted, so an id planted in a browser before login never
+# becomes an authenticated session. Routes can also call session.regenerate() themselves.
+#───────────────────────────────────────────────────────────────────────────────────────────────────────────────────
+COOKIE_VALUE = re.compile(r'^([A-Za-z0-9_-]{43})\.([0-9]{1,10})$')
+IDENTITY_KEYS = ('user_id', 'google_id')
+
+
+def _pack(value):
+    return msgpack.packb(value, use_bin_type=True)
+
+
+def _unpack(packed):
+    return msgpack.unpackb(packed, raw=False, strict_map_key=False)
+
+
+class ServerSession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, sid=None, version=0, packed=None, touched=0.0):
+        def on_update(self):
+            self.modified = True
+        CallbackDict.__init__(self, initial, on_update)
+        self.sid = sid
+        self.version = version
+        self.packed = packed      # bytes as loaded, compared on save to decide whether to write
+        self.touched = touched    # when the store's expiry was last pushed forward
+        self.identity = self._identity()
+        self.retired_sid = None   # deleted from the store when the session is next saved
+        self.modified = False
+
+    def _identity(self):
+        return tuple(self.get(key) for key in IDENTITY_KEYS)
+
+    def regenerate(self):
+        """Moves the session to a new sid on save and deletes the old one (call on login)."""
+        if self.sid is not None:
+            self.retired_sid = self.retired_sid or self.sid
+            self.sid = None
+        self.packed = None
+        self.modified = True
+
+
+class RedisSessionStore:
+    def __init__(self, url, prefix='session:'):
+        import redis  # optional dependency, only needed for this backend
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get(self, sid):
+        return self.client.get(self.prefix + sid)
+
+    def set(self, sid, payload, ttl):
+        self.client.set(self.prefix + sid, payload, ex=ttl)
+
+    def delete(self, sid):
+        self.client.delete(self.prefix + sid)
+
+
+class PostgresSessionStore:
+    """The sessions table, through the app's pool (usable outside a request, e.g. by the chat gateway)."""
+
+    def __init__(self, app, purge_chance=0.01):
+        self.app = app
+        self.purge_chance = purge_chance
+
+    def _run(self, sql, params, fetch=False):
+        pool = self.app.extensions['db_pool']
+        conn = pool.getconn()
+        try:
+            with conn.cursor() as cur:
+                cur.execute(sql, params)
+                row = cur.fetchone() if fetch else None
+            conn.commit()
+            return row
+        finally:
+            pool.putconn(conn)
+
+    def get(self, sid):
+        row = self._run("SELECT data FROM sessions WHERE sid = %s AND expires_at > NOW()", (sid,), fetch=True)
+        return bytes(row['data']) if row else None
+
+    def set(self, sid, payload, ttl):
+        self._run("""
+            INSERT INTO sessions (sid, data, expires_at) VALUES (%s, %s, NOW() + %s * INTERVAL '1 second')
+            ON CONFLICT (sid) DO UPDATE SET data = EXCLUDED.data, expires_at = EXCLUDED.expires_at
+        """, (sid, payload, ttl))
+        if random.random() < self.purge_chance:
+            self._run("DELETE FROM sessions WHERE expires_at < NOW()", ())
+
+    def delete(self, sid):
+        self._run("DELETE FROM sessions WHERE sid = %s", (sid,))
+
+
+class ServerSessionInterface(SessionInterface):
+    def __init__(self, store, local, lifetime):
+        self.store = store        # None for 'memory': the LRU is the only copy
+        self.local = local
+        self.lifetime = lifetime
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.touches = 0
+        self.skipped = 0
+
+    def load(self, cookie_value):
+        """Returns the ServerSession named by a cookie value, or None if it is malformed, unknown or expired."""
+        match = COOKIE_VALUE.match(cookie_value or '')
+        if match is None:
+            return None
+        sid, version = match.group(1), int(match.group(2))
+        entry = self.local.get(sid)
+        if entry is not None and entry[0] == version:
+            self.hits += 1
+        else:
+            self.misses += 1
+            payload = self.store.get(sid) if self.store is not None else None
+            if payload is None:
+                return None
+            entry = tuple(_unpack(payload))
+            self.local.set(sid, entry)
+        version, touched, packed = entry
+        return ServerSession(_unpack(packed), sid, version, packed, touched)
+
+    def open_session(self, app, request):
+        # An unknown sid starts a fresh session with a new id; a client never picks its own sid
+        return self.load(request.cookies.get(self.get_cookie_name(app))) or ServerSession()
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        if session.accessed:
+            response.vary.add('Cookie')
+
+        if not session:
+            stale = [sid for sid in (session.sid, session.retired_sid) if sid is not None]
+            for sid in stale:
+                self._delete(sid)
+            if stale:
+                response.delete_cookie(name, domain=domain, path=path,
+                                       secure=self.get_cookie_secure(app),
+                                       samesite=self.get_cookie_samesite(app))
+            return
+
+        if session.sid is not None and session._identity() != session.identity:
+            session.regenerate()  # logged in, out or as someone else: never keep the old sid
+        if session.retired_sid is not None:
+            self._delete(session.retired_sid)
+            session.retired_sid = None
+        session.identity = session._identity()
+
+        packed = _pack(dict(session))
+        now = time.time()
+        if packed != session.packed:
+            session.sid = session.sid or secrets.token_urlsafe(32)
+            session.version += 1
+            self.writes += 1
+        elif now - session.touched > self.lifetime / 2:
+            self.touches += 1
+        else:
+            self.skipped += 1
+            return
+
+        entry = (session.version, now, packed)
+        if self.store is not None:
+            self.store.set(session.sid, _pack(entry), self.lifetime)
+        self.local.set(session.sid, entry)
+        response.set_cookie(name, f"{session.sid}.{session.version}",
+                            expires=self.get_expiration_time(app, session),
+                            httponly=self.get_cookie_httponly(app), domain=domain, path=path,
+                            secure=self.get_cookie_secure(app), samesite=self.get_cookie_samesite(app))
+
+    def _delete(self, sid):
+        self.local.delete(sid)
+        if self.store is not None:
+            self.store.delete(sid)
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'writes': self.writes,
+            'touches': self.touches,
+            'skipped_writes': self.skipped,
+            'cached': len(self.local),
+        }
+
+
+class ServerSessions:
+    def __init__(self, app=None):
+        self.interface = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('SESSION_BACKEND', 'memory')
+        app.config.setdefault('SESSION_REDIS_URL', 'redis://localhost:6379/0')
+        app.config.setdefault('SESSION_LOCAL_SIZE', 10000)
+        app.config.setdefault('SESSION_LOCAL_TTL', 60)
+        backend = app.config['SESSION_BACKEND']
+        if backend == 'cookie':
+            return
+
+        lifetime = int(app.permanent_session_lifetime.total_seconds())
+        if backend == 'redis':
+            store = RedisSessionStore(app.config['SESSION_REDIS_URL'])
+        elif backend == 'postgres':
+            store = PostgresSessionStore(app)
+        elif backend == 'memory':
+            store = None
+        else:
+            raise ValueError(f"Unknown SESSION_BACKEND {backend!r}")
+        # With no store behind it the LRU must keep sessions for their whole lifetime
+        local_ttl = lifetime if store is None else min(app.config['SESSION_LOCAL_TTL'], lifetime)
+        self.interface = ServerSessionInterface(store, MemoryBackend(app.config['SESSION_LOCAL_SIZE'], local_ttl),
+                                                lifetime)
+        app.session_interface = self.interface
+        app.extensions['server_sessions'] = self
+
+    def stats(self):
+        return self.interface.stats() if self.interface is not None else {}
+
+
+server_sessions = ServerSessions()
@@ -0,0 +1,155 @@
+import os
+import gzip
+import hashlib
+from flask import request
+from jinja2 import nodes, FileSystemBytecodeCache
+from jinja2.ext import Extension
+from app.extensions.profile_cache import MemoryBackend
+
+#───────────────────────────────────────────────────────────────────────────────────────────────────────────────────
+# Template rendering: compiled once, cached in pieces, compressed once.
+#
+#  * Compiled templates are written to a bytecode cache in the instance folder and loaded at startup.
+#    A cold worker unmarshals them instead of parsing Jinja. Under gunicorn's preload_app the master
+#    compiles them once for every forked worker.
+#  * {% cache 'name', key, ... %}...{% endcache %} renders a fragment once per template, name and key
+#    values (e.g. role and verification state) and then reuses the HTML. Use it for the parts built
+#    from url_for() and other helpers, not for per-user data.
+#  * HTML and JSON responses are compressed (brotli, else gzip) for clients that accept it.
+#    Identical bodies, such as the anonymous index page, reuse the compressed bytes from an LRU.
+#───────────────────────────────────────────────────────────────────────────────────────────────────────────────────
+COMPRESSIBLE = ('text/html', 'application/json')
+
+
+class FragmentCache(Extension):
+    tags = {'cache'}
+
+    def __init__(self, environment):
+        super().__init__(environment)
+        environment.extend(fragment_cache=None)
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        key = [parser.parse_expression()]
+        while parser.stream.skip_if('comma'):
+            key.append(parser.parse_expression())
+        body = parser.parse_statements(('name:endcache',), drop_needle=True)
+        call = self.call_method('_render', [nodes.Const(parser.name), nodes.List(key)])
+        return nodes.CallBlock(call, [], [], body).set_lineno(lineno)
+
+    def _render(self, template, key, caller):
+        cache = self.environment.fragment_cache
+        if cache is None:
+            return caller()
+        cache_key = (template, *key)
+        html = cache.get(cache_key)
+        if html is None:
+            html = caller()
+            cache.set(cache_key, html)
+        return html
+
+
+class Templating:
+    def __init__(self, app=None):
+        self.fragments = None
+        self.compressed = None
+        self.compressions = 0
+        self.compression_hits = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('TEMPLATE_BYTECODE_CACHE', os.path.join(app.instance_path, 'jinja_bytecode'))
+        app.config.setdefault('TEMPLATE_PRELOAD', True)
+        app.config.setdefault('TEMPLATE_FRAGMENT_CACHE_SIZE', 1000)
+        app.config.setdefault('TEMPLATE_FRAGMENT_CACHE_TTL', 3600)
+        app.config.setdefault('TEMPLATE_COMPRESS', True)
+        app.config.setdefault('TEMPLATE_COMPRESS_MIN_SIZE', 1024)
+        app.config.setdefault('TEMPLATE_COMPRESS_CACHE_SIZE', 256)
+        app.config.setdefault('TEMPLATE_BROTLI_QUALITY', 5)
+        app.config.setdefault('TEMPLATE_GZIP_LEVEL', 6)
+
+        env = app.jinja_env
+        if app.config['TEMPLATE_BYTECODE_CACHE']:
+            os.makedirs(app.config['TEMPLATE_BYTECODE_CACHE'], exist_ok=True)
+            env.bytecode_cache = FileSystemBytecodeCache(app.config['TEMPLATE_BYTECODE_CACHE'])
+        env.add_extension(FragmentCache)
+        self.fragments = MemoryBackend(app.config['TEMPLATE_FRAGMENT_CACHE_SIZE'],
+                                       ttl=app.config['TEMPLATE_FRAGMENT_CACHE_TTL'])
+        env.fragment_cache = self.fragments
+        if app.config['TEMPLATE_PRELOAD']:
+            self.preload(app)
+
+        if app.config['TEMPLATE_COMPRESS']:
+            self.min_size = app.config['TEMPLATE_COMPRESS_MIN_SIZE']
+            self.brotli_quality = app.config['TEMPLATE_BROTLI_QUALITY']
+            self.gzip_level = app.config['TEMPLATE_GZIP_LEVEL']
+            self.compressed = MemoryBackend(app.config['TEMPLATE_COMPRESS_CACHE_SIZE'], ttl=3600)
+            app.after_request(self._compress)
+        app.extensions['templating'] = self
+
+    def preload(self, app):
+        """Compiles (or loads from the bytecode cache) every template now, before any worker forks."""
+        loaded = 0
+        for name in app.jinja_env.list_templates(filter_func=lambda n: n.endswith('.html')):
+            try:
+                app.jinja_env.get_template(name)
+                loaded += 1
+            except Exception as e:
+                print(f"[!] Template {name} failed to compile: {e}")
+        return loaded
+
+    #─── response compression ───────────────────────────────────────────────────────────────────────────────────
+    def _encode(self, encoding, body):
+        if encoding == 'br':
+            import brotli
+            return brotli.compress(body, quality=self.brotli_quality)
+        return gzip.compress(body, compresslevel=self.gzip_level, mtime=0)
+
+    def _compress(self, response):
+        if response.status_code == 304:
+            response.vary.add('Accept-Encoding')  # the 200 it revalidates varied too
+            return response
+        if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+                or 'Content-Encoding' in response.headers or response.mimetype not in COMPRESSIBLE
+                or 'no-transform' in (response.headers.get('Cache-Control') or '')):
+            return response
+        response.vary.add('Accept-Encoding')
+        accepted = request.accept_encodings
+        encoding = 'br' if accepted['br'] else 'gzip' if accepted['gzip'] else None
+        if encoding is None:
+            return response
+        body = response.get_data()
+        if len(body) < self.min_size:
+            return response
+
+        key = (encoding, hashlib.blake2b(body, digest_size=16).digest())
+        data = self.compressed.get(key)
+        if data is None:
+            try:
+                data = self._encode(encoding, body)
+            except ImportError:  # brotli is optional; fall back to gzip
+                if not accepted['gzip']:
+                    return response
+                encoding, key = 'gzip', ('gzip', key[1])
+                data = self._encode(encoding, body)
+            self.compressed.set(key, data)
+            self.compressions += 1
+        else:
+            self.compression_hits += 1
+        response.set_data(data)
+        response.headers['Content-Encoding'] = encoding
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)  # same entity, different bytes: only a weak match
+        return response
+
+    def stats(self):
+        return {
+            'fragments_cached': len(self.fragments) if self.fragments is not None else 0,
+            'compressions': self.compressions,
+            'compression_hits': self.compression_hits,
+        }
+
+
+templating = Templating()
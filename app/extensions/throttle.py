@@ -0,0 +1,137 @@
+import time
+from functools import wraps
+from flask import current_app, request, flash, redirect, url_for
+from flask_limiter import Limiter
+from flask_limiter.errors import RateLimitExceeded
+
+#───────────────────────────────────────────────────────────────────────────────────────────────────────────────────
+# Brute-force throttling for /login, /signup and /forgot-password.
+#
+# Flask-Limiter checks per-IP and per-account limits before the view runs, so a throttled request
+# never reaches bcrypt or SMTP. It uses the sliding-window-counter strategy, which keeps two counters
+# per key instead of a timestamp per hit. Repeated wrong passwords for one account also trigger an
+# exponential lockout (LOCKOUT_BASE seconds, doubling per further failure, capped at LOCKOUT_MAX).
+# The lockout is kept in the same storage. RATELIMIT_STORAGE_URI is memory:// (per worker) or
+# redis://... (shared).
+#───────────────────────────────────────────────────────────────────────────────────────────────────────────────────
+
+
+def client_ip():
+    """The client address, skipping THROTTLE_PROXY_HOPS trusted reverse proxies (e.g. Render's)."""
+    hops = current_app.config['THROTTLE_PROXY_HOPS']
+    route = request.access_route
+    if hops and len(route) >= hops:
+        return route[-hops]
+    return request.remote_addr or '-'
+
+
+def _account(field):
+    def key():
+        return f"acct:{(request.form.get(field) or '').strip().lower()}"
+    return key
+
+
+class Throttle:
+    def __init__(self, app=None):
+        self.limiter = Limiter(key_func=client_ip)
+        self.login = self._limits('THROTTLE_LOGIN_IP', 'THROTTLE_LOGIN_ACCOUNT', 'username')
+        self.signup = self._limits('THROTTLE_SIGNUP_IP', 'THROTTLE_SIGNUP_ACCOUNT', 'username')
+        self.forgot_password = self._limits('THROTTLE_FORGOT_IP', 'THROTTLE_FORGOT_ACCOUNT', 'forgot_email')
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('RATELIMIT_STORAGE_URI', 'memory://')
+        app.config.setdefault('RATELIMIT_STRATEGY', 'sliding-window-counter')
+        app.config.setdefault('RATELIMIT_HEADERS_ENABLED', True)
+        app.config.setdefault('RATELIMIT_SWALLOW_ERRORS', True)  # a Redis outage must not block logins
+        app.config.setdefault('THROTTLE_PROXY_HOPS', 0)
+        app.config.setdefault('THROTTLE_LOGIN_IP', '20/minute;200/hour')
+        app.config.setdefault('THROTTLE_LOGIN_ACCOUNT', '10/15 minutes')
+        app.config.setdefault('THROTTLE_SIGNUP_IP', '5/minute;30/hour')
+        app.config.setdefault('THROTTLE_SIGNUP_ACCOUNT', '5/hour')
+        app.config.setdefault('THROTTLE_FORGOT_IP', '5/minute;30/hour')
+        app.config.setdefault('THROTTLE_FORGOT_ACCOUNT', '3/hour')
+        app.config.setdefault('LOCKOUT_THRESHOLD', 5)
+        app.config.setdefault('LOCKOUT_BASE', 30)
+        app.config.setdefault('LOCKOUT_MAX', 3600)
+        self.threshold = app.config['LOCKOUT_THRESHOLD']
+        self.base = app.config['LOCKOUT_BASE']
+        self.max = app.config['LOCKOUT_MAX']
+
+        self.limiter.init_app(app)
+        app.register_error_handler(RateLimitExceeded, self._too_many)
+        app.extensions['throttle'] = self
+
+    def _limits(self, ip_key, account_key, field):
+        """Decorator applying the per-IP and per-account limits named by the two config keys."""
+        by_ip = self.limiter.limit(lambda: current_app.config[ip_key], scope=f"{ip_key.lower()}")
+        by_account = self.limiter.limit(lambda: current_app.config[account_key], key_func=_account(field),
+                                        scope=f"{account_key.lower()}")
+
+        def decorator(view):
+            return by_ip(by_account(view))
+        return decorator
+
+    @staticmethod
+    def _too_many(e):
+        flash('Too many attempts. Please wait a moment and try again.', 'danger')
+        response = redirect(url_for('routes.index'))
+        response.headers['Retry-After'] = str(int(e.limit.limit.get_expiry()))
+        return response
+
+    #─── exponential lockout ────────────────────────────────────────────────────────────────────────────────────
+    def locked_for(self, account):
+        """Seconds until the account may try again (0 when it is not locked)."""
+        if not self.limiter.enabled:
+            return 0
+        key = f"throttle/lockout/{account.strip().lower()}"
+        try:
+            if self.limiter.storage.get(key) <= 0:
+                return 0
+            return max(1, int(self.limiter.storage.get_expiry(key) - time.time()))
+        except Exception as e:
+            print(f"[!] Lockout check failed: {e}")
+            return 0
+
+    def record_failure(self, account):
+        if not self.limiter.enabled:
+            return
+        account = account.strip().lower()
+        storage = self.limiter.storage
+        try:
+            failures = storage.incr(f"throttle/failures/{account}", self.max)
+            if failures >= self.threshold:
+                duration = min(self.base * 2 ** (failures - self.threshold), self.max)
+                storage.clear(f"throttle/lockout/{account}")
+                storage.incr(f"throttle/lockout/{account}", duration)
+        except Exception as e:
+            print(f"[!] Could not record failed login: {e}")
+
+    def record_success(self, account):
+        if not self.limiter.enabled:
+            return
+        account = account.strip().lower()
+        try:
+            self.limiter.storage.clear(f"throttle/failures/{account}")
+            self.limiter.storage.clear(f"throttle/lockout/{account}")
+        except Exception as e:
+            print(f"[!] Could not reset failed logins: {e}")
+
+    def reject_locked(self, field):
+        """Rejects the request before the view when the account in request.form[field] is locked."""
+        def decorator(view):
+            @wraps(view)
+            def wrapped(*args, **kwargs):
+                remaining = self.locked_for(request.form.get(field) or '')
+                if remaining:
+                    flash(f'Too many failed attempts. Try again in {remaining} seconds.', 'danger')
+                    response = redirect(url_for('routes.index'))
+                    response.headers['Retry-After'] = str(remaining)
+                    return response
+                return view(*args, **kwargs)
+            return wrapped
+        return decorator
+
+
+throttle = Throttle()
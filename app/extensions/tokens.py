@@ -0,0 +1,105 @@
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from itsdangerous import URLSafeTimedSerializer, SignatureExpired, BadSignature
+
+#───────────────────────────────────────────────────────────────────────────────────────────────────────────────────
+# Signed email-verification and password-reset tokens.
+#
+# The serializers (and their derived HMAC keys) are built once in init_app instead of on every
+# call. Tokens carry the user id so the routes can UPDATE by primary key. Tokens that have already
+# been used are remembered in a bounded in-memory set, so repeated clicks on the same link are
+# answered without touching PostgreSQL.
+#───────────────────────────────────────────────────────────────────────────────────────────────────────────────────
+VERIFY_MAX_AGE = 3600    # 1 hour
+RESET_MAX_AGE = 60       # the reset email promises a short-lived link
+
+
+class TokenInvalid(ValueError):
+    """The token is malformed, has a bad signature, or has expired."""
+
+
+class TokenExpired(TokenInvalid):
+    pass
+
+
+class ReplayCache:
+    """Bounded set of used tokens. Entries only need to outlive the token's max_age."""
+
+    def __init__(self, maxsize=50000):
+        self.maxsize = maxsize
+        self._seen = OrderedDict()  # digest -> forget_at
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _digest(token):
+        return hashlib.blake2b(token.encode('utf-8'), digest_size=16).digest()
+
+    def add(self, token, ttl):
+        with self._lock:
+            self._seen[self._digest(token)] = time.monotonic() + ttl
+            while len(self._seen) > self.maxsize:
+                self._seen.popitem(last=False)
+
+    def __contains__(self, token):
+        key = self._digest(token)
+        with self._lock:
+            forget_at = self._seen.get(key)
+            if forget_at is None:
+                return False
+            if forget_at < time.monotonic():
+                del self._seen[key]
+                return False
+            return True
+
+
+class TokenService:
+    def __init__(self, app=None):
+        self.used = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('TOKEN_REPLAY_CACHE_SIZE', 50000)
+        secret = app.config['SECRET_KEY']
+        self._verify = URLSafeTimedSerializer(secret, salt=app.config['SECURITY_PASSWORD_SALT'])
+        self._reset = URLSafeTimedSerializer(secret, salt='password-reset-salt')
+        self.used = ReplayCache(app.config['TOKEN_REPLAY_CACHE_SIZE'])
+        app.extensions['tokens'] = self
+
+    #─── issue ──────────────────────────────────────────────────────────────────────────────────────────────────
+    def issue_verification(self, user_id, email):
+        return self._verify.dumps({'uid': user_id, 'email': email})
+
+    def issue_reset(self, user_id, email):
+        return self._reset.dumps({'uid': user_id, 'email': email})
+
+    #─── verify ─────────────────────────────────────────────────────────────────────────────────────────────────
+    def verify_verification(self, token, max_age=VERIFY_MAX_AGE):
+        """Returns (user_id, email). user_id is None for tokens issued before ids were embedded."""
+        return self._load(self._verify, token, max_age)
+
+    def verify_reset(self, token, max_age=RESET_MAX_AGE):
+        return self._load(self._reset, token, max_age)
+
+    def is_used(self, token):
+        return token in self.used
+
+    def mark_used(self, token, max_age=VERIFY_MAX_AGE):
+        self.used.add(token, max_age)
+
+    @staticmethod
+    def _load(serializer, token, max_age):
+        try:
+            payload = serializer.loads(token, max_age=max_age)
+        except SignatureExpired:
+            raise TokenExpired("The link has expired.")
+        except BadSignature:
+            raise TokenInvalid("The link is invalid.")
+        if isinstance(payload, str):  # legacy token: just the email address
+            return None, payload
+        return payload.get('uid'), payload.get('email')
+
+
+tokens = TokenService()
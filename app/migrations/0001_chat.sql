@@ -0,0 +1,27 @@
+-- Chat schema: conversations (one-to-one or group), their members, and messages.
+
+CREATE TABLE IF NOT EXISTS conversations (
+    id          SERIAL PRIMARY KEY,
+    name        VARCHAR(100),
+    is_group    BOOLEAN NOT NULL DEFAULT FALSE,
+    created_by  INTEGER,
+    created_at  TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS conversation_members (
+    conversation_id INTEGER NOT NULL REFERENCES conversations (id) ON DELETE CASCADE,
+    user_id         INTEGER NOT NULL,
+    joined_at       TIMESTAMP NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (conversation_id, user_id)
+);
+
+-- The gateway loads a user's rooms on connect
+CREATE INDEX IF NOT EXISTS conversation_members_user_id ON conversation_members (user_id);
+
+CREATE TABLE IF NOT EXISTS messages (
+    id              BIGSERIAL PRIMARY KEY,
+    conversation_id INTEGER NOT NULL REFERENCES conversations (id) ON DELETE CASCADE,
+    sender_id       INTEGER NOT NULL,
+    body            TEXT NOT NULL,
+    created_at      TIMESTAMP NOT NULL DEFAULT NOW()
+);
@@ -0,0 +1,5 @@
+-- Message history is paged newest-first with keyset cursors:
+--   WHERE conversation_id = $1 AND id < $cursor ORDER BY id DESC LIMIT $n
+-- This index serves that as a single backward range scan at any depth.
+
+CREATE INDEX IF NOT EXISTS messages_conversation_id_id ON messages (conversation_id, id);
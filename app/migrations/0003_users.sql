@@ -0,0 +1,44 @@
+-- Users: the table every login, signup, verification and dashboard route reads.
+--
+-- Deployed databases already have a users table created by hand, so this migration only adds what
+-- is missing: CREATE TABLE IF NOT EXISTS for fresh databases, ADD COLUMN IF NOT EXISTS for old ones.
+-- Column order matches the original table.
+
+CREATE TABLE IF NOT EXISTS users (
+    id                        SERIAL PRIMARY KEY,
+    username                  VARCHAR(150) NOT NULL,
+    password                  VARCHAR(255),
+    email_address             VARCHAR(255),
+    verification_token        TEXT,
+    verification_token_expiry TIMESTAMP,
+    is_verified               BOOLEAN NOT NULL DEFAULT FALSE,
+    picture                   TEXT,
+    google_id                 VARCHAR(64),
+    facebook_id               VARCHAR(64),
+    is_admin                  BOOLEAN NOT NULL DEFAULT FALSE,
+    created_at                TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
+ALTER TABLE users ADD COLUMN IF NOT EXISTS password VARCHAR(255);
+ALTER TABLE users ADD COLUMN IF NOT EXISTS email_address VARCHAR(255);
+ALTER TABLE users ADD COLUMN IF NOT EXISTS verification_token TEXT;
+ALTER TABLE users ADD COLUMN IF NOT EXISTS verification_token_expiry TIMESTAMP;
+ALTER TABLE users ADD COLUMN IF NOT EXISTS is_verified BOOLEAN NOT NULL DEFAULT FALSE;
+ALTER TABLE users ADD COLUMN IF NOT EXISTS picture TEXT;
+ALTER TABLE users ADD COLUMN IF NOT EXISTS google_id VARCHAR(64);
+ALTER TABLE users ADD COLUMN IF NOT EXISTS facebook_id VARCHAR(64);
+ALTER TABLE users ADD COLUMN IF NOT EXISTS is_admin BOOLEAN NOT NULL DEFAULT FALSE;
+ALTER TABLE users ADD COLUMN IF NOT EXISTS created_at TIMESTAMP NOT NULL DEFAULT NOW();
+
+-- login and signup match usernames only among password accounts (AND password IS NOT NULL), so
+-- they must be unique there. Google and Facebook display names share the column and may repeat.
+CREATE UNIQUE INDEX IF NOT EXISTS users_username_password_key
+    ON users (username) WHERE password IS NOT NULL;
+
+-- dashboard, verify_email, forgot_password, reset_password. Not unique (yet): a Google account
+-- can share an address with an existing password account.
+CREATE INDEX IF NOT EXISTS users_email_address ON users (email_address);
+
+-- OAuth callbacks. Partial, so the many NULLs from other sign-in methods are not indexed.
+CREATE UNIQUE INDEX IF NOT EXISTS users_google_id_key ON users (google_id) WHERE google_id IS NOT NULL;
+CREATE UNIQUE INDEX IF NOT EXISTS users_facebook_id_key ON users (facebook_id) WHERE facebook_id IS NOT NULL;
@@ -0,0 +1,12 @@
+-- Server-side sessions (SESSION_BACKEND=postgres, app/extensions/sessions.py).
+--
+-- UNLOGGED: writes skip the WAL. After a crash the table is emptied, which only signs people out.
+-- Expired rows are ignored by reads and purged now and then by writes, through the expires_at index.
+
+CREATE UNLOGGED TABLE IF NOT EXISTS sessions (
+    sid        TEXT PRIMARY KEY,
+    data       BYTEA NOT NULL,
+    expires_at TIMESTAMPTZ NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS sessions_expires_at ON sessions (expires_at);
@@ -0,0 +1,80 @@
+-- Admin analytics rollups: one row per UTC day and sign-in method.
+--
+-- Triggers on users keep signups, verifications and the running users/verified deltas current on
+-- every path that writes users (signup, OAuth upsert, verify_email, deletes). Logins change no user
+-- row; the app counts them in memory and adds them in batches (app/extensions/analytics.py). A chart
+-- reads O(days x methods) rows, never users, and totals are SUM(users_delta) over the same rows.
+
+CREATE TABLE IF NOT EXISTS user_daily_stats (
+    day            DATE        NOT NULL,
+    method         VARCHAR(16) NOT NULL,          -- 'password', 'google' or 'facebook'
+    signups        INTEGER     NOT NULL DEFAULT 0,
+    verifications  INTEGER     NOT NULL DEFAULT 0,
+    logins         INTEGER     NOT NULL DEFAULT 0,
+    users_delta    INTEGER     NOT NULL DEFAULT 0,  -- signups minus deletions
+    verified_delta INTEGER     NOT NULL DEFAULT 0,  -- users that became verified minus those removed
+    PRIMARY KEY (day, method)
+);
+
+CREATE OR REPLACE FUNCTION user_signin_method(google_id TEXT, facebook_id TEXT) RETURNS TEXT
+LANGUAGE sql IMMUTABLE AS $$
+    SELECT CASE WHEN google_id IS NOT NULL THEN 'google'
+                WHEN facebook_id IS NOT NULL THEN 'facebook'
+                ELSE 'password' END
+$$;
+
+CREATE OR REPLACE FUNCTION user_daily_stats_add(p_method TEXT, p_signups INTEGER, p_verifications INTEGER,
+                                                p_users INTEGER, p_verified INTEGER) RETURNS void
+LANGUAGE sql AS $$
+    INSERT INTO user_daily_stats AS s (day, method, signups, verifications, users_delta, verified_delta)
+    VALUES ((NOW() AT TIME ZONE 'UTC')::date, p_method, p_signups, p_verifications, p_users, p_verified)
+    ON CONFLICT (day, method) DO UPDATE SET
+        signups = s.signups + EXCLUDED.signups,
+        verifications = s.verifications + EXCLUDED.verifications,
+        users_delta = s.users_delta + EXCLUDED.users_delta,
+        verified_delta = s.verified_delta + EXCLUDED.verified_delta
+$$;
+
+CREATE OR REPLACE FUNCTION users_rollup() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        PERFORM user_daily_stats_add(user_signin_method(NEW.google_id, NEW.facebook_id), 1,
+                                     NEW.is_verified::int, 1, NEW.is_verified::int);
+    ELSIF TG_OP = 'DELETE' THEN
+        PERFORM user_daily_stats_add(user_signin_method(OLD.google_id, OLD.facebook_id), 0, 0,
+                                     -1, -(OLD.is_verified::int));
+    ELSE  -- is_verified changed
+        PERFORM user_daily_stats_add(user_signin_method(NEW.google_id, NEW.facebook_id), 0,
+                                     NEW.is_verified::int, 0, CASE WHEN NEW.is_verified THEN 1 ELSE -1 END);
+    END IF;
+    RETURN NULL;
+END
+$$;
+
+DROP TRIGGER IF EXISTS users_rollup_insert_delete ON users;
+CREATE TRIGGER users_rollup_insert_delete AFTER INSERT OR DELETE ON users
+    FOR EACH ROW EXECUTE FUNCTION users_rollup();
+
+-- The OAuth upsert assigns is_verified on every login; only real changes reach the rollup
+DROP TRIGGER IF EXISTS users_rollup_verified ON users;
+CREATE TRIGGER users_rollup_verified AFTER UPDATE OF is_verified ON users
+    FOR EACH ROW WHEN (OLD.is_verified IS DISTINCT FROM NEW.is_verified) EXECUTE FUNCTION users_rollup();
+
+-- One-time backfill from existing users. Verification dates were never stored, so they count on the
+-- signup day. Users that predate 0003 got created_at = NOW() when it added the column, i.e. the
+-- applied_at 0003 recorded in the same transaction. Their signup day is unknown: they count in the
+-- all-time totals (on today's row) but not as signups or verifications, so the first chart shows
+-- no spike on the day 0003 ran. Historic signups before 0003 are therefore not in the series.
+INSERT INTO user_daily_stats (day, method, signups, verifications, users_delta, verified_delta)
+SELECT CASE WHEN known THEN created_at::date ELSE (NOW() AT TIME ZONE 'UTC')::date END,
+       user_signin_method(google_id, facebook_id),
+       count(*) FILTER (WHERE known), count(*) FILTER (WHERE known AND is_verified),
+       count(*), count(*) FILTER (WHERE is_verified)
+FROM (
+    SELECT created_at, google_id, facebook_id, is_verified,
+           created_at IS DISTINCT FROM (SELECT applied_at FROM schema_migrations WHERE version = '0003') AS known
+    FROM users
+) u
+GROUP BY 1, 2
+ON CONFLICT (day, method) DO NOTHING;
@@ -0,0 +1,14 @@
+-- Presence: when each user was last seen on a dashboard page, written in batches by
+-- app/extensions/presence.py (one multi-row upsert per flush, not one UPDATE per heartbeat).
+--
+-- Kept out of users so the heartbeat flushes never rewrite the wide, heavily indexed users rows.
+-- Workers read back the recently seen rows (last_seen index) to learn about heartbeats that
+-- reached other workers.
+
+CREATE TABLE IF NOT EXISTS user_presence (
+    user_id   INTEGER     PRIMARY KEY,
+    last_seen TIMESTAMPTZ NOT NULL,
+    away      BOOLEAN     NOT NULL DEFAULT FALSE  -- the page reported itself hidden or idle
+);
+
+CREATE INDEX IF NOT EXISTS user_presence_last_seen ON user_presence (last_seen);
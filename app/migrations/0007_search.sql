@@ -0,0 +1,26 @@
+-- Search (app/extensions/search.py): full-text over message bodies, prefix and fuzzy over usernames.
+--
+-- messages.body_tsv is a generated column, so PostgreSQL keeps it in step with body on every INSERT
+-- and UPDATE: indexing is incremental and needs no trigger or batch job. The 'simple' configuration
+-- lowercases words but does not stem them or drop stop words. Chat here mixes English and Filipino,
+-- so an English stemmer would mangle half of it. Adding the column rewrites messages once, under
+-- an exclusive lock; run it outside peak hours on a large table.
+
+ALTER TABLE messages ADD COLUMN IF NOT EXISTS body_tsv tsvector
+    GENERATED ALWAYS AS (to_tsvector('simple', body)) STORED;
+
+-- Search only ever covers the caller's own conversations. btree_gin puts conversation_id in the
+-- same GIN index, so "these rooms AND these words" is a single index lookup. The result does not
+-- grow with everyone else's messages.
+CREATE EXTENSION IF NOT EXISTS btree_gin;
+
+CREATE INDEX IF NOT EXISTS messages_conversation_id_body_tsv ON messages USING GIN (conversation_id, body_tsv);
+
+-- Username autocomplete. Prefixes ("ali" -> alice, alina) are a range scan on a "C"-collated
+-- index: LIKE 'ali%' can use it, and the rows come out already in order for ORDER BY ... LIMIT.
+-- Typos ("alcie") go through pg_trgm similarity on the GIN trigram index. Both are over
+-- lower(username), so matching ignores case.
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX IF NOT EXISTS users_username_prefix ON users ((lower(username) COLLATE "C"));
+CREATE INDEX IF NOT EXISTS users_username_trgm ON users USING GIN (lower(username) gin_trgm_ops);
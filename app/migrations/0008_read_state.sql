@@ -0,0 +1,20 @@
+-- Read state (app/extensions/read_state.py): how far each member has read, and how many messages
+-- from others they have not.
+--
+-- Both live on conversation_members, which already has one row per user per conversation and an
+-- index on user_id. The dashboard gets every unread count with one index scan and never counts
+-- messages. unread is a denormalized counter. The chat writer raises it once per member per write
+-- batch, in the same transaction as the messages. A read receipt recounts it exactly, from the
+-- (conversation_id, id) index over the messages after last_read_id only. Neither column is
+-- indexed, and the fillfactor leaves room on each page, so these frequent updates stay HOT and do
+-- not touch the table's indexes.
+
+ALTER TABLE conversation_members ADD COLUMN IF NOT EXISTS last_read_id BIGINT NOT NULL DEFAULT 0;
+ALTER TABLE conversation_members ADD COLUMN IF NOT EXISTS unread INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE conversation_members SET (fillfactor = 80);
+
+-- Existing members start with everything read, so no one opens the new dashboard to a wall of
+-- unread history.
+UPDATE conversation_members cm SET last_read_id = COALESCE(
+    (SELECT MAX(id) FROM messages m WHERE m.conversation_id = cm.conversation_id), 0)
+WHERE last_read_id = 0;
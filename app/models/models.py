@@ -1,20 +0,0 @@
-from app import db
-from datetime import datetime
-
-class User(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    username = db.Column(db.String(150), nullable=False, unique=True)
-    email = db.Column(db.String(150), nullable=False, unique=True)
-    password = db.Column(db.String(150), nullable=False)
-    email_verified = db.Column(db.Boolean, default=False)
-    verification_token = db.Column(db.String(500), nullable=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-
-    def __repr__(self):
-        return f"<User {self.username}>"
-    
-    
-    
-    
-    
-    
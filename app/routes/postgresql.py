@@ -1,34 +1,343 @@
 from psycopg2 import connect
 from psycopg2.extras import RealDictCursor
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE, connection as _pg_connection, cursor as _pg_cursor
+from contextlib import contextmanager
+from collections import deque
+from flask import current_app, g
+from app.extensions.metrics import metrics
+import threading
+import time
 import os
-from dotenv import load_dotenv
 
-# Load environment variables
-load_dotenv()
+_timed_cursors = {}
 
-def get_db_connection():
+
+def _timed_cursor(base):
+    """A subclass of the given cursor class whose execute() calls are reported to metrics."""
+    cls = _timed_cursors.get(base)
+    if cls is None:
+        def execute(self, query, vars=None):
+            start = time.perf_counter()
+            try:
+                return base.execute(self, query, vars)
+            finally:
+                metrics.record_query(time.perf_counter() - start)
+
+        def executemany(self, query, vars_list):
+            start = time.perf_counter()
+            try:
+                return base.executemany(self, query, vars_list)
+            finally:
+                metrics.record_query(time.perf_counter() - start)
+
+        cls = _timed_cursors[base] = type(f"Timed{base.__name__}", (base,),
+                                          {'execute': execute, 'executemany': executemany})
+    return cls
+
+
+class InstrumentedConnection(_pg_connection):
+    """Connection whose cursors, of whatever cursor_factory, are timed."""
+
+    def cursor(self, *args, **kwargs):
+        factory = kwargs.get('cursor_factory') or self.cursor_factory or _pg_cursor
+        kwargs['cursor_factory'] = _timed_cursor(factory)
+        return super().cursor(*args, **kwargs)
+
+
+def _connect():
     try:
         database_url = os.getenv("DATABASE_URL")
-        print(f"Trying to connect with DATABASE_URL: {database_url}")  # Log the URL
         if database_url:
             return connect(
                 dsn=database_url,
+                connection_factory=InstrumentedConnection,
                 cursor_factory=RealDictCursor
             )
         else:
             raise ValueError("DATABASE_URL not set")
     except Exception as e:
         print("Failed with DATABASE_URL, falling back to individual variables. Error:", e)
+        print(f"Trying to connect with individual DB variables: Host={os.getenv('DB_HOST')}")  # Log individual vars
+        return connect(
+            host=os.getenv("DB_HOST"),
+            port=os.getenv("DB_PORT"),
+            dbname=os.getenv("DB_NAME"),
+            user=os.getenv("DB_USER"),
+            password=os.getenv("DB_PASSWORD"),
+            connection_factory=InstrumentedConnection,
+            cursor_factory=RealDictCursor
+        )
+#───────────────────────────────────────────────────────────────────────────────────────────────────────────────────
+class PoolTimeout(Exception):
+    """Raised when no connection became available within the checkout timeout."""
+
+
+class ConnectionPool:
+    """Thread-safe PostgreSQL connection pool.
+
+    Connections are opened lazily up to ``maxconn``; callers block (up to
+    ``timeout`` seconds) when the pool is saturated. ``warm()`` opens
+    ``minconn`` of them ahead of the first request; it is called per worker
+    after the fork (gunicorn post_worker_init), since sockets must not cross it.
+    Idle connections are pinged before reuse and recycled once they exceed
+    ``max_age`` seconds or ``max_uses`` checkouts. Idle connections beyond
+    ``minconn`` are closed after ``max_idle`` seconds.
+    """
+
+    def __init__(self, connect_fn, minconn=1, maxconn=10, timeout=10.0,
+                 max_age=1800, max_uses=1000, max_idle=300, ping_after=30):
+        self._connect = connect_fn
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.max_age = max_age
+        self.max_uses = max_uses
+        self.max_idle = max_idle
+        self.ping_after = ping_after
+
+        self._cond = threading.Condition()
+        self._idle = deque()   # (conn, returned_at), most recently used on the right
+        self._meta = {}        # id(conn) -> [opened_at, uses]
+        self._size = 0
+        self._in_use = 0
+        self._pid = os.getpid()
+
+        self._checkouts = 0
+        self._waits = 0
+        self._timeouts = 0
+        self._opened = 0
+        self._recycled = 0
+        self._failed_pings = 0
+        self._checkout_time = 0.0
+        self._checkout_time_max = 0.0
+
+    def getconn(self):
+        start = time.perf_counter()
+        self._check_fork()
+        conn = None
+        with self._cond:
+            waited = False
+            while True:
+                if self._idle:
+                    conn, returned_at = self._idle.pop()
+                    break
+                if self._size < self.maxconn:
+                    self._size += 1
+                    returned_at = None
+                    break
+                if not waited:
+                    self._waits += 1
+                    waited = True
+                remaining = self.timeout - (time.perf_counter() - start)
+                if remaining <= 0 or not self._cond.wait(remaining):
+                    if self._idle or self._size < self.maxconn:
+                        continue
+                    self._timeouts += 1
+                    raise PoolTimeout(f"No database connection available after {self.timeout}s")
+            self._in_use += 1
+
         try:
-            print(f"Trying to connect with individual DB variables: Host={os.getenv('DB_HOST')}")  # Log individual vars
-            return connect(
-                host=os.getenv("DB_HOST"),
-                port=os.getenv("DB_PORT"),
-                dbname=os.getenv("DB_NAME"),
-                user=os.getenv("DB_USER"),
-                password=os.getenv("DB_PASSWORD"),
-                cursor_factory=RealDictCursor
-            )
-        except Exception as e2:
-            print("PostgreSQL Connection Error:", e2)
-            return None
+            if conn is None:
+                conn = self._open()
+            elif not self._healthy(conn, returned_at):
+                self._close(conn)
+                conn = self._open()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+
+        elapsed = time.perf_counter() - start
+        with self._cond:
+            self._meta[id(conn)][1] += 1
+            self._checkouts += 1
+            self._checkout_time += elapsed
+            self._checkout_time_max = max(self._checkout_time_max, elapsed)
+        return conn
+
+    def putconn(self, conn, discard=False):
+        self._check_fork()
+        with self._cond:
+            meta = self._meta.get(id(conn))
+        if meta is None:
+            # Not one of ours, e.g. checked out before a fork: close it without touching the counts
+            self._close(conn)
+            return
+
+        if not discard and not conn.closed:
+            try:
+                if conn.info.transaction_status != TRANSACTION_STATUS_IDLE:
+                    conn.rollback()  # never hand out a connection mid-transaction
+            except Exception:
+                discard = True
+
+        expired = time.monotonic() - meta[0] > self.max_age or meta[1] >= self.max_uses
+        if discard or conn.closed or expired:
+            self._close(conn)
+            with self._cond:
+                if expired and not discard:
+                    self._recycled += 1
+                self._size -= 1
+                self._in_use -= 1
+                self._cond.notify()
+            return
+
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._in_use -= 1
+            self._trim_idle()
+            self._cond.notify()
+
+    def warm(self):
+        """Opens connections until ``minconn`` are idle or checked out. Returns the number opened."""
+        self._check_fork()
+        opened = 0
+        while True:
+            with self._cond:
+                if self._size >= self.minconn:
+                    return opened
+                self._size += 1
+            try:
+                conn = self._open()
+            except Exception as e:
+                with self._cond:
+                    self._size -= 1
+                print(f"[!] Could not open pooled connection: {e}")
+                return opened
+            with self._cond:
+                self._idle.append((conn, time.monotonic()))
+                self._cond.notify()
+            opened += 1
+
+    def closeall(self):
+        with self._cond:
+            while self._idle:
+                conn, _ = self._idle.popleft()
+                self._close(conn)
+                self._size -= 1
+
+    def metrics(self):
+        with self._cond:
+            checkouts = self._checkouts
+            return {
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": self._in_use,
+                "min": self.minconn,
+                "max": self.maxconn,
+                "saturation": self._in_use / self.maxconn if self.maxconn else 0.0,
+                "checkouts": checkouts,
+                "waits": self._waits,
+                "timeouts": self._timeouts,
+                "opened": self._opened,
+                "recycled": self._recycled,
+                "failed_pings": self._failed_pings,
+                "checkout_avg_ms": (self._checkout_time / checkouts * 1000) if checkouts else 0.0,
+                "checkout_max_ms": self._checkout_time_max * 1000,
+            }
+
+    #─── internals ────────────────────────────────────────────────────────────────────────────────────────────────
+    def _open(self):
+        conn = self._connect()
+        self._meta[id(conn)] = [time.monotonic(), 0]
+        self._opened += 1
+        return conn
+
+    def _close(self, conn):
+        self._meta.pop(id(conn), None)
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _healthy(self, conn, returned_at):
+        if conn.closed:
+            return False
+        if time.monotonic() - returned_at < self.ping_after:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except Exception:
+            self._failed_pings += 1
+            return False
+
+    def _trim_idle(self):
+        # Called with the lock held. Oldest idle connections sit on the left.
+        now = time.monotonic()
+        while len(self._idle) > self.minconn and now - self._idle[0][1] > self.max_idle:
+            conn, _ = self._idle.popleft()
+            self._close(conn)
+            self._size -= 1
+
+    def _check_fork(self):
+        # Sockets must not be shared across fork(); start fresh in the child.
+        if os.getpid() != self._pid:
+            with self._cond:
+                self._idle.clear()
+                self._meta.clear()
+                self._size = 0
+                self._in_use = 0
+                self._pid = os.getpid()
+#───────────────────────────────────────────────────────────────────────────────────────────────────────────────────
+def init_db_pool(app):
+    """Creates the application's connection pool. Called once from create_app()."""
+    pool = ConnectionPool(
+        _connect,
+        minconn=app.config.get('DB_POOL_MIN', 1),
+        maxconn=app.config.get('DB_POOL_MAX', 10),
+        timeout=app.config.get('DB_POOL_TIMEOUT', 10),
+        max_age=app.config.get('DB_POOL_MAX_AGE', 1800),
+        max_uses=app.config.get('DB_POOL_MAX_USES', 1000),
+    )
+    app.extensions['db_pool'] = pool
+    app.teardown_appcontext(_release_request_connection)
+    return pool
+
+
+def get_pool():
+    return current_app.extensions['db_pool']
+
+
+def open_connection():
+    """A connection outside the pool, for long-lived uses such as LISTEN. The caller closes it."""
+    return _connect()
+
+
+@contextmanager
+def db_connection():
+    """Checks a connection out of the pool and always returns it, even when the block raises.
+
+    Uncommitted work is rolled back when the connection goes back to the pool.
+    """
+    pool = get_pool()
+    conn = pool.getconn()
+    try:
+        yield conn
+    finally:
+        pool.putconn(conn)
+
+
+def get_db_connection():
+    """Returns the request's pooled connection, or None if the database is unreachable.
+
+    The connection is released automatically when the app context tears down.
+    """
+    if 'db_conn' in g:
+        return g.db_conn
+    try:
+        g.db_conn = get_pool().getconn()
+    except Exception as e:
+        print("PostgreSQL Connection Error:", e)
+        return None
+    return g.db_conn
+
+
+def _release_request_connection(exc=None):
+    conn = g.pop('db_conn', None)
+    if conn is not None:
+        get_pool().putconn(conn)
@@ -1,20 +1,20 @@
 import os
-import pathlib
 from flask import Blueprint, redirect, session, request, abort
-from google_auth_oauthlib.flow import Flow
-from google.oauth2 import id_token
-from google.auth.transport.requests import Request
-from dotenv import load_dotenv
+from app.extensions.oauth import oauth_registry
+from app.extensions.provisioning import provisioner
+from app.extensions.analytics import analytics
+from app.extensions.presence import presence
+from app.extensions.read_state import read_state, valid_receipt
+from app.extensions.notifications import notifications
+from app.extensions.search import search, MAX_PAGE_SIZE as SEARCH_MAX_PAGE_SIZE
 from functools import wraps
-from flask import make_response
-from app.routes.postgresql import get_db_connection
+from flask import make_response, jsonify, Response, stream_with_context
+from app.routes.postgresql import get_db_connection, db_connection
+from app.extensions.profile_cache import profile_cache
 from flask import render_template
 from flask import session
 from flask import current_app
 #--------------------------------------------------------------------------------------------------
-# Load environment variables from .env file
-load_dotenv()
-#--------------------------------------------------------------------------------------------------
 # Blueprint setup for Google OAuth routes
 routes = Blueprint('routes', __name__)
 #--------------------------------------------------------------------------------------------------
@@ -31,16 +31,9 @@ GOOGLE_CLIENT_ID = os.getenv("GOOGLE_OAUTH_CLIENT_ID")
 #--------------------------------------------------------------------------------------------------
 #--------------------------------------------------------------------------------------------------
 #--------------------------------------------------------------------------------------------------
-# Define CLIENT_SECRETS_FILE globally by using a helper function
+# Define CLIENT_SECRETS_FILE globally by using a helper function (dev for local hosts, prod otherwise)
 def get_client_secrets_file():
-    host = request.host
-    if "localhost" in host or "127.0.0.1" in host or "192.168." in host or "ngrok" in host:
-        return os.path.join(
-            pathlib.Path(__file__).parent.parent.parent, 'certs', 'client_secret_dev.json'
-        )
-    return os.path.join(
-        pathlib.Path(__file__).parent.parent.parent, 'certs', 'client_secret_prod.json'
-    )
+    return oauth_registry.client_secrets_file(oauth_registry.profile_for_host(request.host))
 #--------------------------------------------------------------------------------------------------
 # Get the redirect URI. Always use the Render callback URL for production.
 def get_redirect_uri():
@@ -72,17 +65,10 @@ def login_google():
         return response
 
     redirect_uri = get_redirect_uri()
-    print(f"Redirect URI being used: {redirect_uri}")
-
-    flow = Flow.from_client_secrets_file(
-        client_secrets_file=get_client_secrets_file(),
-        scopes=[
-            "https://www.googleapis.com/auth/userinfo.profile",
-            "https://www.googleapis.com/auth/userinfo.email",
-            "openid"
-        ],
-        redirect_uri=redirect_uri
-    )
+    current_app.logger.debug("OAuth redirect URI: %s", redirect_uri)
+
+    # Client secrets are parsed once per profile; the flow reuses the pooled HTTP connections
+    flow = oauth_registry.flow(request.host, redirect_uri)
 
     authorization_url, state = flow.authorization_url(
         access_type='offline',
@@ -95,12 +81,7 @@ def login_google():
 # Google OAuth callback route
 @routes.route("/callback")
 def callback():
-    print("Google OAuth callback triggered.")
     redirect_uri = get_redirect_uri()
-    print(f"Using redirect URI: {redirect_uri}")
-
-    # Debug: Full URL received from Google
-    print(f"Authorization Response URL: {request.url}")
 
     # ✅ Insert ALLOWED_HOSTS check here
     ALLOWED_HOSTS = ["127.0.0.1", "192.168.", "chatmekol.onrender.com"]
@@ -112,27 +93,13 @@ def callback():
         return response
 
     try:
-        flow = Flow.from_client_secrets_file(
-            client_secrets_file=get_client_secrets_file(),
-            scopes=[
-                "https://www.googleapis.com/auth/userinfo.profile",
-                "https://www.googleapis.com/auth/userinfo.email",
-                "openid"
-            ],
-            redirect_uri=redirect_uri
-        )
+        flow = oauth_registry.flow(request.host, redirect_uri)
 
         flow.fetch_token(authorization_response=request.url)
         credentials = flow.credentials
 
-        print("Verifying ID token...")
-        request_obj = Request()
-        id_info = id_token.verify_oauth2_token(
-            credentials._id_token,
-            request_obj,
-            GOOGLE_CLIENT_ID
-        )
-        print("ID token verified!")
+        # Google's signing certs are cached per Cache-Control, so this is normally local work
+        id_info = oauth_registry.verify_id_token(credentials._id_token, GOOGLE_CLIENT_ID)
 
         # Store Google user data in session
         session["google_id"] = id_info.get("sub")
@@ -140,26 +107,13 @@ def callback():
         session["email"] = id_info.get("email")
         session["picture"] = id_info.get("picture", "")
 
-        print(f"Logged in as: {session['email']}")
-
-        # Insert user data into PostgreSQL if not already in the database
-        from app.routes.postgresql import get_db_connection
-        conn = get_db_connection()
-        cur = conn.cursor()
+        current_app.logger.debug("Google login: %s", session['email'])
 
-        # Check if user already exists by Google ID
-        cur.execute("SELECT id FROM users WHERE google_id = %s", (session["google_id"],))
-        existing_user = cur.fetchone()
-
-        if not existing_user:
-            cur.execute("""
-                INSERT INTO users (username, email_address, google_id, picture, is_verified)
-                VALUES (%s, %s, %s, %s, %s)
-            """, (session["name"], session["email"], session["google_id"], session["picture"], True))
-            conn.commit()
-
-        cur.close()
-        conn.close()
+        # Create the user on first login, refresh name and picture afterwards (one round trip)
+        user = provisioner.provision('google', session["google_id"], session["name"], session["email"],
+                                     session["picture"], verified=True)
+        session['user_id'] = user['id']  # chat and presence key on the users row, as for Facebook
+        analytics.record_login('google')
 
         # Redirect user to dashboard after successful login
         return redirect("/dashboard")
@@ -180,9 +134,10 @@ def index():
     if "google_id" in session:
         return redirect("/dashboard")
     response = make_response(render_template("index.html"))
-    response.headers['Cache-Control'] = 'no-store, no-cache, must-revalidate, post-check=0, pre-check=0, max-age=0'
-    response.headers['Pragma'] = 'no-cache'
-    return response
+    # Revalidate on every load, but let the browser keep the page: an unchanged page is a bodyless 304
+    response.headers['Cache-Control'] = 'private, no-cache'
+    response.add_etag()
+    return response.make_conditional(request)
 #--------------------------------------------------------------------------------------------------
 # Protected area route (for logged-in users)
 @routes.route("/dashboard")
@@ -193,32 +148,19 @@ def dashboard():
     email = session.get("email")
     picture = session.get("picture")
     
-    # Check the email verification status from the database
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
-    try:
-        # First: fetch verification status for the current email
-        cursor.execute("SELECT is_verified FROM users WHERE email_address = %s", (email,))
-        verification_status = cursor.fetchone()
-
-        # Optional: fetch columns info for debug
-        cursor.execute("SELECT * FROM users LIMIT 1")
-        columns = [desc[0] for desc in cursor.description]
-        print(f"Columns in the users table: {columns}")
-
-    finally:
-        cursor.close()
-        conn.close()
+    # Check the email verification status (cached; only a cache miss queries the database)
+    profile = profile_cache.get_by_email(email)
 
     # Handle verification status safely
-    if verification_status:
-        is_verified = verification_status['is_verified']  # <-- fix here
+    if profile:
+        is_verified = profile['is_verified']
+        picture = profile['picture'] or picture  # an uploaded avatar replaces the Google picture
     else:
         is_verified = False  # Default if no result found
 
     # Pass everything to the template
-    return render_template("user_dashboard.html", name=name, email=email, picture=picture, is_verified=is_verified)
+    return render_template("user_dashboard.html", name=name, email=email, picture=picture, is_verified=is_verified,
+                           unread=_unread_counts(session.get('user_id')))
 #--------------------------------------------------------------------------------------------------
 @routes.route('/test-db')
 def test_db():
@@ -246,24 +188,25 @@ def test_db():
 #--------------------------------------------------------------------------------------------------
 #--------------------------------------------------------------------------------------------------
 from flask import Blueprint, render_template, request, redirect, url_for, flash, session
-from flask_mail import Message
-from flask_dance.contrib.google import google
 from app.extensions.mail import mail
+from app.extensions.mail_queue import mail_queue
 from app.utils import (generate_token, send_email, send_verification_email, send_reset_email)
-import bcrypt
+from app.extensions.hashing import hasher, HasherBusy
+from app.extensions.avatars import avatars, UploadRejected
+from app.extensions.throttle import throttle
 import re
 from datetime import datetime, timedelta
 import logging
 import psycopg2.extras
+import json
 from flask import current_app as app
-from itsdangerous import URLSafeTimedSerializer
+from app.extensions.tokens import tokens, TokenExpired, TokenInvalid, RESET_MAX_AGE
 from flask import render_template, request, redirect, url_for, flash, session
 
 # =====Upload Picture============================================================================================================
 from flask import Flask, request, redirect, url_for, session, render_template
 import os
 from werkzeug.utils import secure_filename
-import jwt
 
 # =================================================================================================================
 def validate_username(username):
@@ -274,9 +217,11 @@ def validate_username(username):
     return None
 #==============Login=============================================================================================
 def hash_password(password):
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    return hasher.hash(password)
 #==============Login=============================================================================================
 @routes.route('/login', methods=['POST'])
+@throttle.login
+@throttle.reject_locked('username')
 def login():
     # Prevent logged-in users from going back to login page
     if 'user_id' in session:
@@ -285,38 +230,38 @@ def login():
     username = request.form['username']
     password = request.form['password']
 
-    # Try creating a connection using get_db_connection
-    conn = get_db_connection()
-    if conn is None:
-        flash('Failed to connect to the database.', 'danger')
-        return redirect(url_for('routes.index'))
-
     try:
-        cursor = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-        cursor.execute("SELECT * FROM users WHERE username=%s", (username,))
-        user = cursor.fetchone()
+        with db_connection() as conn, conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cursor:
+            cursor.execute(
+                "SELECT id, username, password, is_admin FROM users WHERE username = %s AND password IS NOT NULL",
+                (username,)
+            )
+            user = cursor.fetchone()
     except Exception as e:
         print("[DB ERROR]", e)
         flash('Database error occurred.', 'danger')
         return redirect(url_for('routes.index'))
-    finally:
-        if conn:
-            conn.close()
 
     if user:
         try:
-            stored_hash = user[2]  # Assuming 3rd column is password hash
+            stored_hash = user['password']
             if stored_hash and isinstance(stored_hash, str):
-                stored_hash = stored_hash.encode('utf-8')
-                if bcrypt.checkpw(password.encode('utf-8'), stored_hash):
-                    session['user_id'] = user[0]
-                    session['username'] = user[1]
-                    session['is_admin'] = user[-2]
+                if hasher.verify(password, stored_hash):
+                    throttle.record_success(username)
+                    if hasher.needs_rehash(stored_hash):
+                        rehash_password(user['id'], password)
+                    session['user_id'] = user['id']
+                    session['username'] = user['username']
+                    session['is_admin'] = user['is_admin']
+                    analytics.record_login('password')
                     return redirect(url_for('routes.dashboardx'))
                 else:
+                    throttle.record_failure(username)
                     flash('Incorrect password.', 'danger')
             else:
                 flash('Invalid password format in the database.', 'danger')
+        except HasherBusy:
+            flash('The server is busy. Please try again in a moment.', 'warning')
         except ValueError as e:
             print("Bcrypt error:", e)
             flash('Invalid password hash. Please contact support.', 'danger')
@@ -324,6 +269,16 @@ def login():
         flash('User not found.', 'danger')
 
     return redirect(url_for('routes.index'))
+#==============Login=============================================================================================
+# Upgrade a stored hash made with an old bcrypt cost while we still have the plaintext
+def rehash_password(user_id, password):
+    try:
+        new_hash = hasher.hash(password)
+        with db_connection() as conn, conn.cursor() as cursor:
+            cursor.execute("UPDATE users SET password = %s WHERE id = %s", (new_hash, user_id))
+            conn.commit()
+    except Exception as e:
+        print(f"Rehash failed for user {user_id}: {e}")
 #=============Dashboard==============================================================================================
 @routes.route('/dashboard-manual-login')
 def dashboardx():
@@ -332,19 +287,9 @@ def dashboardx():
         flash('You need to login to access the system', 'warning')
         return redirect(url_for('routes.index'))
     
-    # Establish database connection
-    conn = get_db_connection()
-    if not conn:
-        flash('Failed to connect to the database', 'danger')
-        return redirect(url_for('routes.index'))
-    
-    # Create a cursor for executing SQL queries
-    cursor = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-    
     try:
-        # Fetch the username, email, is_admin, and is_verified for the logged-in user
-        cursor.execute("SELECT username, email_address, is_admin, is_verified FROM users WHERE id=%s", (session['user_id'],))
-        user = cursor.fetchone()
+        # Fetch the username, email, is_admin, and is_verified for the logged-in user (cached)
+        user = profile_cache.get_by_id(session['user_id'])
         
         # Check if user data was found
         if not user:
@@ -352,46 +297,279 @@ def dashboardx():
             return redirect(url_for('routes.logout'))
 
         # Extract user information
-        username, email, is_admin, is_verified = user
+        username, email, is_admin, is_verified = (
+            user['username'], user['email_address'], user['is_admin'], user['is_verified']
+        )
 
         # Save is_admin, is_verified, and email in session for future use
         session['is_admin'] = is_admin
         session['is_verified'] = is_verified
         session['email'] = email
 
-        # Debugging: Log the user data
-        print(f"User found: {username}, is_admin: {is_admin}, is_verified: {is_verified}, email: {email}")
-        
-        # Handle email verification status in dashboard
-        if is_verified:
-            print(f"User {username} is verified.")
-        else:
-            print(f"User {username} is not verified. Please check your email.")
-
         # Render appropriate dashboard based on user role
+        unread = _unread_counts(session['user_id'])
         if is_admin:
-            print(f"Rendering admin dashboard for {username}")
-            return render_template('admin_dashboard.html', username=username, is_verified=is_verified, email=email)
+            return render_template('admin_dashboard.html', username=username, is_verified=is_verified, email=email,
+                                   unread=unread)
         else:
-            # Provide a default profile picture
-            picture = 'background/bp1.png'
-            print(f"Rendering user dashboard for {username}")
-            return render_template('user_dashboard.html', username=username, is_verified=is_verified, email=email, profile_picture=picture)
+            # Uploaded avatars (and Google pictures) are URLs; anything else falls back to the default
+            picture = user['picture'] if (user['picture'] or '').startswith(('/avatars/', 'http')) else None
+            return render_template('user_dashboard.html', username=username, is_verified=is_verified, email=email,
+                                   picture=picture, profile_picture='background/bp1.png', unread=unread)
 
     except Exception as e:
         # Log any exceptions
         print(f"Error: {str(e)}")
         flash('An error occurred while fetching your data. Please try again later.', 'danger')
         return redirect(url_for('routes.index'))
-    
-    finally:
-        # Ensure the cursor and connection are closed after the operation
-        cursor.close()
-        conn.close()
+#=============Admin Analytics===========================================================================================
+# Chart data for admin_dashboard.html, read from the user_daily_stats rollup rather than users, so
+# a request costs O(days), however many users there are.
+@routes.route('/admin/analytics')
+def admin_analytics():
+    if 'user_id' not in session:
+        return jsonify({"error": "Login required"}), 401
+    if not session.get('is_admin'):
+        return jsonify({"error": "Admins only"}), 403
+    try:
+        report = analytics.report(request.args.get('days', 30, type=int))
+    except Exception as e:
+        print(f"[!] Analytics query failed: {e}")
+        return jsonify({"error": "Analytics are unavailable"}), 503
+    response = jsonify(report)
+    response.headers['Cache-Control'] = 'private, max-age=60'
+    return response
+#=============Presence==================================================================================================
+# The dashboards send a heartbeat every 30 seconds ("away" while the tab is hidden). Heartbeats only
+# update the in-memory index; last_seen reaches PostgreSQL in periodic batches.
+@routes.route('/presence/heartbeat', methods=['POST'])
+def presence_heartbeat():
+    if 'user_id' not in session:
+        return jsonify({"error": "Login required"}), 401
+    data = request.get_json(silent=True) or {}
+    presence.heartbeat(session['user_id'], away=data.get('state') == 'away')
+    return '', 204
+
+
+@routes.route('/presence/contacts')
+def presence_contacts():
+    if 'user_id' not in session:
+        return jsonify({"error": "Login required"}), 401
+    try:
+        status = presence.contacts_status(session['user_id'])
+    except Exception as e:
+        print(f"[!] Presence lookup failed: {e}")
+        return jsonify({"error": "Presence is unavailable"}), 503
+    response = jsonify(status)
+    response.headers['Cache-Control'] = 'private, no-store'
+    return response
+#=============Notifications=============================================================================================
+# Server-Sent Events from the per-user notification buffers. EventSource reconnects by itself and
+# sends Last-Event-ID, so a dropped stream resumes where it stopped.
+@routes.route('/notifications/stream')
+def notification_stream():
+    if 'user_id' not in session:
+        return jsonify({"error": "Login required"}), 401
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    return notifications.stream_response(session['user_id'], last_event_id)
+#=============Search====================================================================================================
+# /search/users backs the "new conversation" autocomplete; /search/messages searches the caller's
+# conversations and pages like the message history (?before=<id of the last result>).
+@routes.route('/search/users')
+def search_users():
+    if 'user_id' not in session:
+        return jsonify({"error": "Login required"}), 401
+    try:
+        users = search.users(request.args.get('q', ''))
+    except Exception as e:
+        print(f"[!] User search failed: {e}")
+        return jsonify({"error": "Search is unavailable"}), 503
+    response = jsonify({"users": [u for u in users if u['id'] != session['user_id']]})
+    response.headers['Cache-Control'] = 'private, max-age=30'
+    return response
+
+
+@routes.route('/search/messages')
+def search_messages():
+    if 'user_id' not in session:
+        return jsonify({"error": "Login required"}), 401
+    limit = min(request.args.get('limit', search.max_results, type=int), SEARCH_MAX_PAGE_SIZE)
+    if limit < 1:
+        return jsonify({"error": "limit must be positive"}), 400
+    try:
+        messages = search.messages(session['user_id'], request.args.get('q', ''),
+                                   conversation_id=request.args.get('conversation', type=int),
+                                   before=request.args.get('before', type=int), limit=limit)
+    except Exception as e:
+        print(f"[!] Message search failed: {e}")
+        return jsonify({"error": "Search is unavailable"}), 503
+    next_cursor = messages[-1]['id'] if len(messages) == limit else None
+    response = jsonify({"messages": messages, "next_cursor": next_cursor})
+    response.headers['Cache-Control'] = 'private, no-store'
+    return response
+#=============Profile Picture===========================================================================================
+# Accepts either a multipart form field named "picture" (the dashboard form) or a raw image body.
+# The upload is streamed to disk; thumbnails are rendered in the avatar pool, and users.picture is
+# pointed at them only once they exist, so the dashboards never link to a missing image.
+def _session_profile():
+    if 'user_id' in session:
+        return profile_cache.get_by_id(session['user_id'])
+    if 'google_id' in session and session.get('email'):
+        return profile_cache.get_by_email(session['email'])
+    return None
+
+
+@routes.route('/profile/picture', methods=['POST'])
+def upload_profile_picture():
+    profile = _session_profile()
+    if profile is None:
+        abort(401)
+    back = url_for('routes.dashboardx') if 'user_id' in session else url_for('routes.dashboard')
+
+    upload = request.files.get('picture') if request.mimetype == 'multipart/form-data' else None
+    try:
+        path, digest = avatars.receive(upload.stream if upload is not None else request.stream)
+    except UploadRejected as e:
+        if upload is None:
+            return jsonify({"error": str(e)}), e.status
+        flash(str(e), 'danger')
+        return redirect(back)
+
+    picture = avatars.url_for_digest(digest)
+    app_obj = current_app._get_current_object()
+    user_id, email = profile['id'], profile['email_address']
+
+    def on_done(error):
+        if error is not None:
+            print(f"[!] Thumbnail generation failed for user {user_id}: {error}")
+            return
+        with app_obj.app_context():
+            try:
+                with db_connection() as conn, conn.cursor() as cur:
+                    cur.execute("UPDATE users SET picture = %s WHERE id = %s", (picture, user_id))
+                    conn.commit()
+                profile_cache.invalidate(user_id=user_id, email=email)
+            except Exception as e:
+                print(f"[!] Could not save picture for user {user_id}: {e}")
+
+    avatars.process(path, digest, on_done)
+    if upload is None:
+        return jsonify({"picture": picture}), 202
+    flash('Profile picture updated.', 'success')
+    return redirect(back)
+
+
+@routes.route('/avatars/<filename>')
+def avatar(filename):
+    return avatars.send(filename)
+#=============Unread Counts & Read Receipts=============================================================================
+# Unread counts come from the counters on conversation_members: one indexed query per dashboard, no
+# COUNT(*) over messages. Receipts are debounced in memory and written every READ_STATE_FLUSH_INTERVAL.
+def _unread_counts(user_id):
+    """{conversation id: unread} for the dashboards; empty (not an error page) if the lookup fails."""
+    if user_id is None:
+        return {}
+    try:
+        return {room: state['unread'] for room, state in read_state.unread_counts(user_id).items() if state['unread']}
+    except Exception as e:
+        print(f"[!] Unread counts failed: {e}")
+        return {}
+
+
+@routes.route('/chat/unread')
+def unread_counts():
+    if 'user_id' not in session:
+        return jsonify({"error": "Login required"}), 401
+    try:
+        counts = read_state.unread_counts(session['user_id'])
+    except Exception as e:
+        print(f"[!] Unread counts failed: {e}")
+        return jsonify({"error": "Unread counts are unavailable"}), 503
+    response = jsonify({"conversations": {str(room): state for room, state in counts.items()},
+                        "total": sum(state['unread'] for state in counts.values())})
+    response.headers['Cache-Control'] = 'private, no-store'
+    return response
+
+
+@routes.route('/chat/conversations/<int:conversation_id>/read', methods=['POST'])
+def mark_read(conversation_id):
+    if 'user_id' not in session:
+        return jsonify({"error": "Login required"}), 401
+    body = request.get_json(silent=True)
+    message_id = body.get('message_id') if isinstance(body, dict) else None
+    if not valid_receipt(conversation_id, message_id):
+        return jsonify({"error": "message_id must be a positive integer that fits a message id"}), 400
+
+    with db_connection() as conn, conn.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM conversation_members WHERE conversation_id = %s AND user_id = %s",
+            (conversation_id, session['user_id'])
+        )
+        if cursor.fetchone() is None:
+            return jsonify({"error": "Not a member of this conversation"}), 403
+
+    read_state.mark_read(session['user_id'], conversation_id, message_id)
+    return '', 202
+#=============Message History===========================================================================================
+# Pages backwards through a conversation with a keyset cursor (?before=<message id>) instead of OFFSET,
+# so the 1st and the 10,000th page cost the same index range scan on (conversation_id, id).
+HISTORY_PAGE_SIZE = 50
+HISTORY_MAX_PAGE_SIZE = 200
+
+@routes.route('/chat/conversations/<int:conversation_id>/messages')
+def message_history(conversation_id):
+    if 'user_id' not in session:
+        return jsonify({"error": "Login required"}), 401
+
+    try:
+        limit = min(int(request.args.get('limit', HISTORY_PAGE_SIZE)), HISTORY_MAX_PAGE_SIZE)
+        before = request.args.get('before', type=int)
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+    if limit < 1:
+        return jsonify({"error": "limit must be positive"}), 400
+
+    with db_connection() as conn, conn.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM conversation_members WHERE conversation_id = %s AND user_id = %s",
+            (conversation_id, session['user_id'])
+        )
+        if cursor.fetchone() is None:
+            return jsonify({"error": "Not a member of this conversation"}), 403
+
+    if before is None:
+        before = 2 ** 63 - 1  # newest page
+
+    def generate():
+        # A named (server-side) cursor streams rows as they are read instead of fetchall()-ing the page.
+        with db_connection() as conn, conn.cursor(name='message_history', cursor_factory=psycopg2.extensions.cursor) as cursor:
+            cursor.itersize = limit
+            cursor.execute("""
+                SELECT id, sender_id, body, created_at
+                FROM messages
+                WHERE conversation_id = %s AND id < %s
+                ORDER BY id DESC
+                LIMIT %s
+            """, (conversation_id, before, limit))
+            yield '{"messages":['
+            last_id = None
+            count = 0
+            for message_id, sender_id, body, created_at in cursor:
+                if count:
+                    yield ','
+                yield json.dumps({"id": message_id, "sender": sender_id, "body": body,
+                                  "created_at": created_at.isoformat()})
+                last_id = message_id
+                count += 1
+            next_cursor = last_id if count == limit else None
+            yield '],"next_cursor":%s}' % json.dumps(next_cursor)
+
+    return Response(stream_with_context(generate()), mimetype='application/json')
 
 #=======================================================================================================================
 # Signup route
 @routes.route('/signup', methods=['POST'])
+@throttle.signup
 def signup():
     username = request.form.get('username')
     password = request.form.get('password')
@@ -406,80 +584,53 @@ def signup():
     if password != confirmation_password:
         flash('Passwords do not match.', 'danger')
         return redirect(url_for('routes.index'))
-    conn = None
-    cursor = None
     try:
-        # 🔐 Hash password using bcrypt
-        hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
-        verification_token = generate_token(email_address)
+        # Check if username or email already exists (before paying for bcrypt)
+        with db_connection() as conn, conn.cursor() as cursor:
+            cursor.execute(
+                "SELECT 1 FROM users WHERE (username = %s AND password IS NOT NULL) OR email_address = %s",
+                (username, email_address)
+            )
+            if cursor.fetchone():
+                flash('Username or Email already exists.', 'danger')
+                return redirect(url_for('routes.index'))
+        # 🔐 Hash password using bcrypt (runs in the hashing pool)
+        hashed_password = hasher.hash(password)
         verification_expiry = datetime.utcnow() + timedelta(hours=1)
-        conn = get_db_connection()  
-        cursor = conn.cursor()
-        # Check if username or email already exists
-        cursor.execute("SELECT * FROM users WHERE username=%s OR email_address=%s", (username, email_address))
-        if cursor.fetchone():
-            flash('Username or Email already exists.', 'danger')
-            return redirect(url_for('routes.index'))
-        # Set the default profile picture path
-        default_profile_picture = 'background/bp1.png'  # ✅ Correct path
-        # Insert new user with default picture
-        cursor.execute(""" 
-            INSERT INTO users (username, password, email_address, verification_token, verification_token_expiry, is_verified, picture)
-            VALUES (%s, %s, %s, %s, %s, %s, %s)
-        """, (username, hashed_password, email_address, verification_token, verification_expiry, False, default_profile_picture))
-        conn.commit()
+        with db_connection() as conn, conn.cursor() as cursor:
+            # Set the default profile picture path
+            default_profile_picture = 'background/bp1.png'  # ✅ Correct path
+            # Insert new user with default picture
+            cursor.execute(""" 
+                INSERT INTO users (username, password, email_address, verification_token, verification_token_expiry, is_verified, picture)
+                VALUES (%s, %s, %s, %s, %s, %s, %s)
+                RETURNING id
+            """, (username, hashed_password, email_address, '', verification_expiry, False, default_profile_picture))
+            user_id = cursor.fetchone()['id']
+            # The token embeds the new user's id so verify_email can update by primary key
+            verification_token = tokens.issue_verification(user_id, email_address)
+            cursor.execute("UPDATE users SET verification_token = %s WHERE id = %s", (verification_token, user_id))
+            conn.commit()
+        profile_cache.invalidate(email=email_address)
         send_verification_email_function(email_address, verification_token, username)
         flash('Signup successful. Check your email to verify your account.', 'success')
+    except HasherBusy:
+        flash('The server is busy. Please try again in a moment.', 'warning')
     except Exception as e:
         print(f"Signup error: {e}")
         flash('An error occurred during signup. Please try again.', 'danger')
-    finally:
-        if cursor:
-            cursor.close()
-        if conn:
-            conn.close()
 
     return redirect(url_for('routes.index'))
 #=======================================================================================================================
 #=======================================================================================================================
-# Function to generate a token
-def generate_token(email_address):
-    serializer = URLSafeTimedSerializer(current_app.config['SECRET_KEY'])
-    return serializer.dumps(email_address, salt=current_app.config['SECURITY_PASSWORD_SALT'])
-#=======================================================================================================================
 #=== FOR SIGN UP FOR SENDING A VERIFICATION TO EMAIL====================================================================
 #=======================================================================================================================
 #=======================================================================================================================
-# Route for email verification
-# Generate a verification token for email
-def generate_verification_token(email):
-    try:
-        expiration_time = datetime.utcnow() + timedelta(hours=1)  # Token expires in 1 hour
-        payload = {'email': email, 'exp': expiration_time}
-        token = jwt.encode(payload, current_app.config['SECRET_KEY'], algorithm='HS256')
-        return token
-    except Exception as e:
-        print(f"Error generating token: {e}")
-        return None
-#=== FOR SIGN UP FOR SENDING A VERIFICATION TO EMAIL====================================================================
-# Function to confirm the verification token
-def confirm_verification_token(token):
-    try:
-        # Try decoding the token
-        payload = jwt.decode(token, current_app.config['SECRET_KEY'], algorithms=['HS256'])
-        return payload['email']
-    except jwt.ExpiredSignatureError:
-        raise ValueError("The token has expired.")
-    except jwt.DecodeError:
-        raise ValueError("Invalid token.")
-    except Exception as e:
-        raise ValueError(f"Error decoding token: {e}")
 #=== FOR SIGN UP FOR SENDING A VERIFICATION TO EMAIL====================================================================
 # Function to send the verification email
 def send_verification_email_function(email, token, username):
     
     try:
-        print(f"Generating verification email for {email} with token {token}")
         subject = "Email Verification"
         
         # Generate the verification URL using url_for
@@ -497,68 +648,49 @@ def send_verification_email_function(email, token, username):
         TunNer Developer Team
         """
         
-        # Debugging: Check email body and recipient
-        print(f"Email body: {body}")
-        print(f"Sending to: {email}")
-        
         # Send the email using the send_email function
         send_email(subject, body, email)
     except Exception as e:
         print(f"Error sending verification email: {e}")
 #=== FOR SIGN UP FOR SENDING A VERIFICATION TO EMAIL====================================================================
-# Function to send email using Flask-Mail
-def send_email(subject, body, recipient):
+# Function to send email using Flask-Mail (queued, delivered off the request thread)
+def send_email(subject, body, recipient, dedup_key=None):
     try:
-        print(f"Sending email to {recipient}")  # Debug line to check if the email is being triggered
-        msg = Message(subject, recipients=[recipient])
-        msg.body = body
-        mail.send(msg)
-        print("Email sent successfully!")  # Debug line to confirm email was sent
+        if mail_queue.enqueue(subject, body, recipient, dedup_key=dedup_key):
+            current_app.logger.debug("Email to %s queued", recipient)
     except Exception as e:
         print(f"Error sending email: {e}")
 #=== FOR SIGN UP FOR SENDING A VERIFICATION TO EMAIL====================================================================
 # Route to verify the email and token
 @routes.route('/verify_email/<token>', methods=['GET'])
 def verify_email(token):
+    # Repeat clicks on an already-used link never reach the database
+    if tokens.is_used(token):
+        flash('Email verified successfully. You can now log in.', 'success')
+        return redirect(url_for('routes.index'))
     try:
-        # Deserialize the token using the same secret key and salt
-        serializer = URLSafeTimedSerializer(current_app.config['SECRET_KEY'])
-        email_address = serializer.loads(
-            token,
-            salt=current_app.config['SECURITY_PASSWORD_SALT'],
-            max_age=3600  # The token is valid for 1 hour
-        )
+        user_id, email_address = tokens.verify_verification(token)
 
         # Update the user's 'is_verified' status in the database
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("UPDATE users SET is_verified = TRUE WHERE email_address = %s", (email_address,))
-        conn.commit()
+        with db_connection() as conn, conn.cursor() as cursor:
+            if user_id is not None:
+                cursor.execute("UPDATE users SET is_verified = TRUE WHERE id = %s RETURNING id", (user_id,))
+            else:  # links sent before tokens carried the user id
+                cursor.execute("UPDATE users SET is_verified = TRUE WHERE email_address = %s RETURNING id", (email_address,))
+            updated = cursor.fetchone()
+            conn.commit()
+        tokens.mark_used(token)
+        profile_cache.invalidate(user_id=updated['id'] if updated else None, email=email_address)
         flash('Email verified successfully. You can now log in.', 'success')
 
-    except SignatureExpired:
+    except TokenExpired:
         flash('Verification link has expired.', 'danger')
+    except TokenInvalid:
+        flash('Verification link is invalid.', 'danger')
     except Exception as e:
         flash(f'Error verifying email: {e}', 'danger')
-    finally:
-        if cursor:
-            cursor.close()
-        if conn:
-            conn.close()
 
     return redirect(url_for('routes.index'))
-#=== FOR SIGN UP FOR SENDING A VERIFICATION TO EMAIL====================================================================
-# Generate a confirmation token (alternative function)
-def generate_confirmation_token(email):
-    try:
-        payload = {
-            'email': email,
-            'exp': datetime.utcnow() + timedelta(hours=1)
-        }
-        return jwt.encode(payload, current_app.config['SECRET_KEY'], algorithm='HS256')
-    except Exception as e:
-        print(f"Error generating confirmation token: {e}")
-        return None
 #=======================================================================================================================
 #=======================================================================================================================
 #=======================================================================================================================
@@ -566,32 +698,26 @@ def generate_confirmation_token(email):
 #============================FORGOT PASSWORD========================================================================
 # Forgot Password Route
 
-DATABASE_URL = os.getenv("DATABASE_URL")  # Fetch the database URL from environment
-
 @routes.route('/forgot-password', methods=['POST'])
+@throttle.forgot_password
 def forgot_password():
     email = request.form.get('forgot_email')
     if not email:
         flash('Please enter a valid email address.', 'danger')
         return redirect(url_for('routes.index'))
     
-    conn = None
-    cursor = None
     try:
-        # Establish connection to PostgreSQL database
-        conn = psycopg2.connect(DATABASE_URL, sslmode='require')  # Ensure SSL connection
-        cursor = conn.cursor()
-
         # Check if the email exists in the database
-        cursor.execute("SELECT email_address, username FROM users WHERE email_address = %s", (email,))
-        user = cursor.fetchone()
+        with db_connection() as conn, conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cursor:
+            cursor.execute("SELECT id, email_address, username FROM users WHERE email_address = %s", (email,))
+            user = cursor.fetchone()
         
         if user:
             # Extract username from the fetched data
-            username = user[1]
+            username = user['username']
             
             # Generate a reset token
-            reset_token = generate_reset_token(email)
+            reset_token = tokens.issue_reset(user['id'], email)
             # Generate the reset link
             reset_link = url_for('routes.reset_password', token=reset_token, _external=True)
             
@@ -611,8 +737,8 @@ Best regards,
 TunNer Team
 """
             
-            # Send the reset email
-            send_email(subject, body, email)
+            # Send the reset email (repeat requests within the dedup window are dropped)
+            send_email(subject, body, email, dedup_key=f"reset:{email}")
             flash('A password reset link has been sent to your email. The link will expire in 30 seconds.', 'success')
         else:
             flash('Email address not found.', 'danger')
@@ -621,21 +747,17 @@ TunNer Team
         print(f"Error in forgot-password route: {e}")
         flash(f"An error occurred while processing your request: {e}", 'danger')
     
-    finally:
-        if cursor:
-            cursor.close()
-        if conn:
-            conn.close()
-    
     return redirect(url_for('routes.index'))
 
 #=======================================================================================================================
 # Reset Password Route
 @routes.route('/reset-password/<token>', methods=['GET', 'POST'])
 def reset_password(token):
+    if tokens.is_used(token):
+        flash('This reset link has already been used.', 'danger')
+        return redirect(url_for('routes.index'))
     try:
-        email = confirm_verification_token_reset(token)
-        print(f"Decoded email: {email}")  # Log decoded email
+        user_id, email = tokens.verify_reset(token)
         
         if request.method == 'POST':
             new_password = request.form.get('new_password')
@@ -645,109 +767,111 @@ def reset_password(token):
                 flash('Passwords do not match.', 'danger')
                 return redirect(url_for('routes.reset_password', token=token))
             
-            hashed_password = bcrypt.hashpw(new_password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            cursor.execute("UPDATE users SET password = %s WHERE email_address = %s", (hashed_password, email))
-            conn.commit()
+            hashed_password = hasher.hash(new_password)
+            with db_connection() as conn, conn.cursor() as cursor:
+                if user_id is not None:
+                    cursor.execute("UPDATE users SET password = %s WHERE id = %s RETURNING id", (hashed_password, user_id))
+                else:
+                    cursor.execute("UPDATE users SET password = %s WHERE email_address = %s RETURNING id", (hashed_password, email))
+                updated = cursor.fetchone()
+                conn.commit()
+            tokens.mark_used(token, RESET_MAX_AGE)
+            profile_cache.invalidate(user_id=updated['id'] if updated else None, email=email)
             flash('Password has been reset successfully. You can now log in.', 'success')
             return redirect(url_for('routes.index'))  
         return render_template('reset_password.html', token=token)  
+    except HasherBusy:
+        flash('The server is busy. Please try again in a moment.', 'warning')
+        return redirect(url_for('routes.reset_password', token=token))
     except ValueError as e:
         print(f"Error: {e}")
         flash('The reset link is invalid or expired.', 'danger')
         return redirect(url_for('routes.index'))
 #=======================================================================================================================
-# Generate Reset Token Function
-def generate_reset_token(email):
-    serializer = URLSafeTimedSerializer(app.secret_key)
-    return serializer.dumps(email, salt='password-reset-salt')
-#=======================================================================================================================
-# Confirm Reset Token Function
-def confirm_verification_token_reset(token, expiration=60):  # expiration is in seconds (20 = 20 seconds)
-    serializer = URLSafeTimedSerializer(app.secret_key)
-    try:
-        email = serializer.loads(token, salt='password-reset-salt', max_age=expiration)
-    except Exception as e:
-        print(f"Error: {e}")
-        raise ValueError("The reset link is invalid or expired.")
-    return email
-#=======================================================================================================================
-def verify_reset_token(token):
-    try:
-        email = jwt.decode(token, app.config['SECRET_KEY'], algorithms=["HS256"])['email']
-    except Exception:
-        return None
-    return User.query.filter_by(email=email).first()
-#=======================================================================================================================
 #=======================================================================================================================
 #=======================================================================================================================
 #=====THIS IS FACEBOOK LOGIN============================================================================================
-from flask_dance.contrib.facebook import facebook
+# flask_dance (and requests_oauthlib behind it) is imported on the first Facebook login, not at startup
 from flask import redirect, url_for, flash, render_template, session
 import psycopg2
 
 # Route for handling Facebook login callback
 @routes.route('/facebook-login/callback')
 def facebook_login_callback():
+    from flask_dance.contrib.facebook import facebook
     if not facebook.authorized:
         flash('Login failed', 'danger')
         return redirect(url_for('routes.index'))
 
     # Fetch user data from Facebook
-    resp = facebook.get('/me?fields=id,name,email')
+    resp = facebook.get('/me?fields=id,name,email,picture.type(large)')
     
     if resp.ok:
         user_info = resp.json()
-        facebook_id = user_info['id']
         facebook_name = user_info['name']
-        facebook_email = user_info.get('email')
+        picture = ((user_info.get('picture') or {}).get('data') or {}).get('url')
+
+        try:
+            # Create the user on first login, refresh name and picture afterwards (one round trip)
+            user = provisioner.provision('facebook', user_info['id'], facebook_name, user_info.get('email'), picture)
+        except Exception as e:
+            print(f"Error creating or fetching Facebook user: {e}")
+            flash('An error occurred while creating your account.', 'danger')
+            return redirect(url_for('routes.index'))
 
-        # Connect to PostgreSQL and create or fetch user
-        user = create_or_fetch_user(facebook_id, facebook_name, facebook_email)
-        
         # Set session and redirect to the dashboard
-        session['user_id'] = user[0]  # Assuming user id is at index 0
+        session['user_id'] = user['id']
+        analytics.record_login('facebook')
         flash(f'Welcome, {facebook_name}!', 'success')
         return redirect(url_for('routes.dashboard'))  # Redirect to the dashboard
     else:
         flash('Failed to fetch user data from Facebook', 'danger')
         return redirect(url_for('routes.index'))
 
-
-# Function to create a new user in the database
-def create_new_user(facebook_id, name, email):
-    try:
-        # Connect to PostgreSQL (using your existing connection function)
-        conn = get_db_connection()
-        cursor = conn.cursor()
-
-        # Insert new user into the users table
-        cursor.execute(
-            "INSERT INTO users (facebook_id, username, email_address) VALUES (%s, %s, %s) RETURNING id;",
-            (facebook_id, name, email)
-        )
-        user_id = cursor.fetchone()[0]
-        conn.commit()
-
-        # Fetch and return the newly created user
-        cursor.execute("SELECT * FROM users WHERE id = %s", (user_id,))
-        user = cursor.fetchone()
-        return user  # Returning the user object
-        
-    except Exception as e:
-        print(f"Error creating new user: {e}")
-        flash('An error occurred while creating your account.', 'danger')
-    finally:
-        if conn:
-            cursor.close()
-            conn.close()
-
 # Facebook login route
 @routes.route('/login/facebook')
 def facebook_login():
+    from flask_dance.contrib.facebook import facebook
     if not facebook.authorized:
         return redirect(url_for('facebook.login'))  # Redirect to Facebook login if not authorized
     
     # If authorized, redirect to Facebook login callback
-    return redirect(url_for('routes.facebook_login_callback'))
\ No newline at end of file
+    return redirect(url_for('routes.facebook_login_callback'))
+#=====CHAT CONVERSATIONS================================================================================================
+# Messages themselves travel over the WebSocket gateway (app/extensions/chat.py); this route only
+# creates the one-to-one or group conversation the gateway fans out to.
+@routes.route('/chat/conversations', methods=['POST'])
+def create_conversation():
+    if 'user_id' not in session:
+        return jsonify({"error": "Login required"}), 401
+
+    data = request.get_json(silent=True) or {}
+    try:
+        members = {int(m) for m in data.get('members', [])}
+    except (TypeError, ValueError):
+        return jsonify({"error": "members must be a list of user ids"}), 400
+    members.add(session['user_id'])
+    if len(members) < 2:
+        return jsonify({"error": "A conversation needs at least one other member"}), 400
+
+    name = (data.get('name') or '').strip()[:100] or None
+    is_group = len(members) > 2
+    try:
+        with db_connection() as conn, conn.cursor() as cursor:
+            cursor.execute(
+                "INSERT INTO conversations (name, is_group, created_by) VALUES (%s, %s, %s) RETURNING id",
+                (name, is_group, session['user_id'])
+            )
+            conversation_id = cursor.fetchone()['id']
+            psycopg2.extras.execute_values(
+                cursor,
+                "INSERT INTO conversation_members (conversation_id, user_id) VALUES %s",
+                [(conversation_id, member) for member in members]
+            )
+            conn.commit()
+    except Exception as e:
+        print(f"Error creating conversation: {e}")
+        return jsonify({"error": "Could not create conversation"}), 500
+    presence.invalidate_contacts(*members)  # they are now each other's contacts
+
+    return jsonify({"id": conversation_id, "name": name, "is_group": is_group, "members": sorted(members)}), 201
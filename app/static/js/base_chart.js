@@ -0,0 +1,65 @@
+// Admin dashboard charts, drawn from /admin/analytics (daily rollups, cached server-side).
+const METHOD_COLORS = {
+  password: "#4e73df",
+  google: "#e74a3b",
+  facebook: "#1cc88a",
+};
+
+function methodDatasets(series) {
+  return Object.keys(series).map(function (method) {
+    return {
+      label: method,
+      data: series[method],
+      backgroundColor: METHOD_COLORS[method] || "#858796",
+      borderColor: METHOD_COLORS[method] || "#858796",
+      fill: false,
+    };
+  });
+}
+
+function drawCharts(report) {
+  const shortDays = report.days.map(function (day) { return day.slice(5); });
+
+  const users = document.getElementById("userChart");
+  if (users) {
+    new Chart(users, {
+      type: "bar",
+      data: { labels: shortDays, datasets: methodDatasets(report.signups) },
+      options: { plugins: { title: { display: true, text: "Signups per day" } },
+                 scales: { x: { stacked: true }, y: { stacked: true, beginAtZero: true } } },
+    });
+  }
+
+  const logins = document.getElementById("userAnalyticsChart");
+  if (logins) {
+    new Chart(logins, {
+      type: "line",
+      data: { labels: shortDays, datasets: methodDatasets(report.logins) },
+      options: { plugins: { title: { display: true, text: "Logins per day" } },
+                 scales: { y: { beginAtZero: true } } },
+    });
+  }
+
+  const verified = document.getElementById("statsChart");
+  if (verified) {
+    const totals = report.totals;
+    new Chart(verified, {
+      type: "doughnut",
+      data: {
+        labels: ["Verified", "Not verified"],
+        datasets: [{ data: [totals.verified, totals.users - totals.verified],
+                     backgroundColor: ["#1cc88a", "#f6c23e"] }],
+      },
+      options: { plugins: { title: { display: true,
+                 text: totals.users + " users, " + Math.round(totals.verified_ratio * 100) + "% verified" } } },
+    });
+  }
+}
+
+fetch("/admin/analytics?days=30", { credentials: "same-origin" })
+  .then(function (response) {
+    if (!response.ok) throw new Error("HTTP " + response.status);
+    return response.json();
+  })
+  .then(drawCharts)
+  .catch(function (error) { console.error("Analytics unavailable:", error); });
@@ -0,0 +1,90 @@
+// Live notifications for the dashboards over Server-Sent Events. The browser reconnects on its own
+// and sends Last-Event-ID, so nothing is missed across short drops. Bursts arrive pre-coalesced:
+// one "message" event per room carrying the running count.
+// Without a stream URL (or when the server turns the stream away) the page polls /chat/unread.
+// The page starts from the unread counts rendered by the dashboard; live counts are added on top.
+const script = document.currentScript;
+const streamUrl = (script && script.dataset.streamUrl) || "";
+const pollInterval = Number((script && script.dataset.pollInterval) || 30) * 1000;
+const initialUnread = JSON.parse((script && script.dataset.unread) || "{}");
+const unread = new Map();
+const baseTitle = document.title;
+
+Object.keys(initialUnread).forEach(function (room) {
+  unread.set("room:" + room, initialUnread[room]);
+});
+
+function showNotification(text) {
+  let box = document.getElementById("notification-toast");
+  if (!box) {
+    box = document.createElement("div");
+    box.id = "notification-toast";
+    box.className = "alert alert-info";
+    box.style.cssText = "position:fixed;right:1rem;bottom:1rem;z-index:1080;display:none";
+    document.body.appendChild(box);
+  }
+  box.textContent = text;
+  box.style.display = "block";
+  clearTimeout(box.hideTimer);
+  box.hideTimer = setTimeout(function () { box.style.display = "none"; }, 5000);
+}
+
+function totalUnread() {
+  let total = 0;
+  unread.forEach(function (count) { total += count; });
+  return total;
+}
+
+function updateTitle() {
+  const total = totalUnread();
+  document.title = total ? "(" + total + ") " + baseTitle : baseTitle;
+}
+
+// Replaces every count with the server's; with announce, tells the user how many are new
+function reloadCounts(announce) {
+  return fetch("/chat/unread", { credentials: "same-origin" })
+    .then(function (response) { return response.ok ? response.json() : null; })
+    .then(function (data) {
+      if (!data) return;
+      const before = totalUnread();
+      unread.clear();
+      Object.keys(initialUnread).forEach(function (room) { delete initialUnread[room]; });
+      Object.keys(data.conversations).forEach(function (room) {
+        initialUnread[room] = data.conversations[room].unread;
+        if (initialUnread[room]) unread.set("room:" + room, initialUnread[room]);
+      });
+      updateTitle();
+      const added = totalUnread() - before;
+      if (announce && added > 0) showNotification(added === 1 ? "1 new message" : added + " new messages");
+    })
+    .catch(function () {});
+}
+
+function startPolling() {
+  setInterval(function () {
+    if (!document.hidden) reloadCounts(true);
+  }, pollInterval);
+}
+
+updateTitle();
+
+if (streamUrl && window.EventSource) {
+  const source = new EventSource(streamUrl, { withCredentials: true });
+
+  source.addEventListener("message", function (event) {
+    const data = JSON.parse(event.data);
+    unread.set(data.key, (initialUnread[data.room] || 0) + data.count);
+    updateTitle();
+    showNotification(data.count === 1 ? "1 new message" : data.count + " new messages");
+  });
+
+  // Events were dropped while away: reload the counts from the server instead of guessing
+  source.addEventListener("reset", function () { reloadCounts(false); });
+
+  // A refused stream (busy or too many tabs) is not retried by the browser: poll instead
+  source.addEventListener("error", function () {
+    if (source.readyState === EventSource.CLOSED) startPolling();
+  });
+} else {
+  startPolling();
+}
@@ -0,0 +1,42 @@
+// Presence heartbeats for the dashboards: "online" while the tab is visible, "away" while hidden.
+// Elements with data-user-id get a presence-online / presence-away / presence-offline class.
+const HEARTBEAT_MS = 30000;
+const CONTACTS_MS = 60000;
+
+function sendHeartbeat() {
+  fetch("/presence/heartbeat", {
+    method: "POST",
+    credentials: "same-origin",
+    keepalive: true,
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify({ state: document.hidden ? "away" : "online" }),
+  }).catch(function () {});
+}
+
+function showContacts() {
+  const badges = document.querySelectorAll("[data-user-id]");
+  if (!badges.length || document.hidden) return;
+  fetch("/presence/contacts", { credentials: "same-origin" })
+    .then(function (response) { return response.ok ? response.json() : null; })
+    .then(function (status) {
+      if (!status) return;
+      const online = new Set(status.online);
+      const away = new Set(status.away);
+      badges.forEach(function (badge) {
+        const id = Number(badge.dataset.userId);
+        const state = online.has(id) ? "online" : away.has(id) ? "away" : "offline";
+        badge.classList.remove("presence-online", "presence-away", "presence-offline");
+        badge.classList.add("presence-" + state);
+      });
+    })
+    .catch(function () {});
+}
+
+sendHeartbeat();
+showContacts();
+setInterval(sendHeartbeat, HEARTBEAT_MS);
+setInterval(showContacts, CONTACTS_MS);
+document.addEventListener("visibilitychange", function () {
+  sendHeartbeat();
+  if (!document.hidden) showContacts();
+});
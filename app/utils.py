@@ -1,10 +1,9 @@
 import random
 import string
 import re
-import bcrypt
-from flask_mail import Message
-from flask import url_for
-from app.extensions.mail import mail
+from app.extensions.hashing import hasher
+from flask import url_for, current_app
+from app.extensions.mail_queue import mail_queue
 import secrets
 
 # ============================================
@@ -16,15 +15,13 @@ def generate_token(length=32):
     return secrets.token_urlsafe(length)
 
 
-def send_email(subject, body, recipient_email):
-    """Sends an email with the given subject, body, and recipient."""
-    msg = Message(subject=subject, recipients=[recipient_email])
-    msg.body = body
+def send_email(subject, body, recipient_email, dedup_key=None):
+    """Queues an email with the given subject, body, and recipient for background delivery."""
     try:
-        mail.send(msg)
-        print(f"[✓] Email sent to {recipient_email}")
+        if mail_queue.enqueue(subject, body, recipient_email, dedup_key=dedup_key):
+            current_app.logger.debug("Email queued for %s", recipient_email)
     except Exception as e:
-        print(f"[!] Failed to send email to {recipient_email}: {e}")
+        print(f"[!] Failed to queue email to {recipient_email}: {e}")
 
 # =============================================================================================================
 def send_verification_email(email, token, username):
@@ -63,7 +60,7 @@ If you did not request this, you can safely ignore this email.
 Best regards,
 TunNer Team
 """
-    send_email(subject, body, email)
+    send_email(subject, body, email, dedup_key=f"reset:{email}")
 # =============================================================================================================
 
 def validate_username(username):
@@ -76,14 +73,13 @@ def validate_username(username):
 
 
 def hash_password(password):
-    """Hashes the password using bcrypt and returns the hashed password."""
-    salt = bcrypt.gensalt()
-    return bcrypt.hashpw(password.encode('utf-8'), salt)
+    """Hashes the password using bcrypt (off the request thread) and returns the hashed password."""
+    return hasher.hash(password)
 
 
 def verify_password(password, hashed_password):
     """Verifies the provided password against the stored hashed password."""
-    return bcrypt.checkpw(password.encode('utf-8'), hashed_password)
+    return hasher.verify(password, hashed_password)
 
 
 def get_user_by_email(email):
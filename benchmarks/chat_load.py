@@ -0,0 +1,118 @@
+"""Load test for the chat WebSocket gateway on localhost.
+
+Starts a ChatGateway in-process with membership and persistence stubbed out (so no PostgreSQL is
+needed; batches still go through the writer, which fans them out once "stored"), connects N clients to one room using signed session cookies, has S of them send
+messages, and reports delivered messages per second and delivery latency percentiles.
+
+    python benchmarks/chat_load.py --clients 2000 --senders 20 --messages 50
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from flask import Flask
+from websockets.asyncio.client import connect
+from app.extensions.chat import ChatGateway, MessageWriter
+
+ROOM = 1
+
+
+class NullWriter(MessageWriter):
+    def _insert(self, rows):
+        start, self.written_ids = self.written_ids, self.written_ids + len(rows)
+        return [{'id': start + i, 'conversation_id': row[0], 'sender_id': row[1]} for i, row in enumerate(rows, 1)]
+
+
+class BenchGateway(ChatGateway):
+    """Everyone belongs to ROOM; messages are discarded instead of written."""
+
+    def load_rooms(self, user_id):
+        return {ROOM}
+
+    def make_writer(self):
+        writer = NullWriter(None, on_stored=self._stored, on_failed=self._failed)
+        writer.written_ids = 0
+        return writer
+
+
+def make_app(port):
+    app = Flask(__name__)
+    app.secret_key = 'bench'
+    app.extensions['db_pool'] = None
+    app.config.update(CHAT_ENABLED=False, CHAT_WS_HOST='127.0.0.1', CHAT_WS_PORT=port)
+    return app
+
+
+def session_cookie(app, user_id):
+    serializer = app.session_interface.get_signing_serializer(app)
+    return f"session={serializer.dumps({'user_id': user_id})}"
+
+
+async def client(url, cookie, ready, latencies, expected, done):
+    async with connect(url, additional_headers={'Cookie': cookie}, compression=None) as ws:
+        received = 0
+        ready.append(ws)
+        async for raw in ws:
+            msg = json.loads(raw)
+            latencies.append(time.perf_counter() - msg['client_id'])
+            received += 1
+            if received == expected:
+                break
+    done.append(1)
+
+
+async def run(args):
+    ready = []
+    app = make_app(args.port)
+    gateway = BenchGateway()
+    gateway.init_app(app)
+    gateway.start()
+    url = f"ws://127.0.0.1:{args.port}"
+
+    expected = args.senders * args.messages
+    latencies, done = [], []
+    tasks = [
+        asyncio.create_task(client(url, session_cookie(app, i + 1), ready, latencies, expected, done))
+        for i in range(args.clients)
+    ]
+    while len(ready) < args.clients:
+        failed = next((t for t in tasks if t.done() and t.exception()), None)
+        if failed:
+            raise failed.exception()
+        await asyncio.sleep(0.05)
+    print(f"{args.clients} clients connected")
+
+    senders = ready[:args.senders]
+    start = time.perf_counter()
+    for _ in range(args.messages):
+        for ws in senders:
+            await ws.send(json.dumps({"type": "send", "room": ROOM, "body": "x" * args.size,
+                                      "client_id": time.perf_counter()}))
+        await asyncio.sleep(args.interval)
+    await asyncio.wait_for(asyncio.gather(*tasks), timeout=args.timeout)
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    pct = lambda p: latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+    print(f"sent {expected} messages, delivered {len(latencies)} in {elapsed:.2f}s")
+    print(f"delivered msgs/sec: {len(latencies) / elapsed:,.0f}")
+    print(f"latency ms  p50={pct(0.50):.2f}  p95={pct(0.95):.2f}  p99={pct(0.99):.2f}  "
+          f"mean={statistics.fmean(latencies) * 1000:.2f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clients', type=int, default=500)
+    parser.add_argument('--senders', type=int, default=10)
+    parser.add_argument('--messages', type=int, default=20)
+    parser.add_argument('--size', type=int, default=64, help='message body length')
+    parser.add_argument('--interval', type=float, default=0.01, help='pause between sending rounds (s)')
+    parser.add_argument('--port', type=int, default=8799)
+    parser.add_argument('--timeout', type=float, default=120)
+    asyncio.run(run(parser.parse_args()))
@@ -0,0 +1,155 @@
+"""Cross-process chat fan-out over the event bus: several gateway processes, one PostgreSQL.
+
+Starts --processes chat gateways, each in its own process with its own port, DB pool and event bus
+connection, like gunicorn workers or separate instances. The session lookup is replaced by the
+user id sent in the cookie. --users members of one group conversation connect round-robin across
+the gateways. A sender on process 0 then posts --messages messages at --rate per second. Every
+member measures send -> receive latency. Every message waits for the writer's batch and commit.
+Members on process 0 then get the in-process fan-out; everyone else also waits for NOTIFY and one
+fetch by id.
+
+It reports p50/p99 for local and remote delivery, messages lost, and per process the bus batches
+and messages per fetch. The database is a scratch one on --dsn or a throwaway initdb cluster, as in
+load_suite.py.
+
+    python benchmarks/event_bus_fanout.py --dsn postgresql://localhost/postgres --processes 4 --users 400
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import statistics
+import multiprocessing
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import psycopg2
+from load_suite import Database, free_port
+
+
+#─── gateway process ────────────────────────────────────────────────────────────────────────────────────────────────
+def gateway_main(url, port, write_delay, pipe):
+    os.environ['DATABASE_URL'] = url
+    from flask import Flask
+    from app.routes.postgresql import init_db_pool
+    from app.extensions.event_bus import event_bus
+    from app.extensions.chat import chat
+
+    app = Flask(__name__)
+    app.config.update(CHAT_WS_HOST='127.0.0.1', CHAT_WS_PORT=port, CHAT_WRITE_DELAY=write_delay,
+                      CHAT_AUTOSTART=False, DB_POOL_MAX=4)
+    init_db_pool(app)
+    event_bus.init_app(app)
+    chat.init_app(app)
+    chat.load_session = lambda cookie: {'user_id': int(cookie.split('=', 1)[1])}  # no sessions here
+    chat.start()
+    deadline = time.time() + 10
+    while not event_bus.connected and time.time() < deadline:
+        time.sleep(0.05)
+    pipe.send(event_bus.connected)
+    pipe.recv()  # stop
+    stats = event_bus.stats()
+    stats['remote_delivered'] = chat.remote_delivered
+    pipe.send(stats)
+
+
+#─── clients ────────────────────────────────────────────────────────────────────────────────────────────────────────
+async def run_clients(ports, args, room):
+    from websockets.asyncio.client import connect
+
+    latencies = {'local': [], 'remote': []}
+    sockets = []
+    for user in range(1, args.users + 1):
+        port = ports[(user - 1) % len(ports)]
+        ws = await connect(f"ws://127.0.0.1:{port}/", additional_headers={'Cookie': f"session={user}"},
+                           compression=None, max_size=2 ** 16)
+        sockets.append((user, port, ws))
+
+    async def receive(user, port, ws):
+        kind = 'local' if port == ports[0] else 'remote'
+        async for raw in ws:
+            msg = json.loads(raw)
+            if msg.get('type') == 'message' and msg['sender'] != user:
+                latencies[kind].append(time.time() - json.loads(msg['body'])['t'])
+
+    readers = [asyncio.create_task(receive(*s)) for s in sockets[1:]]
+    await asyncio.sleep(1)  # every socket subscribed to the room
+    sender = sockets[0][2]
+    for i in range(args.messages):
+        await sender.send(json.dumps({'type': 'send', 'room': room, 'body': json.dumps({'i': i, 't': time.time()})}))
+        await asyncio.sleep(1 / args.rate)
+    await asyncio.sleep(args.settle)
+    for task in readers:
+        task.cancel()
+    for _, _, ws in sockets:
+        await ws.close()
+    return latencies
+
+
+def percentile(values, p):
+    return values[min(len(values) - 1, int(len(values) * p))] if values else float('nan')
+
+
+def main(args):
+    workdir = tempfile.mkdtemp(prefix='chatmekol_bus_')
+    db = Database(args.dsn, workdir)
+    gateways = []
+    try:
+        db.seed(args.users, rounds=4)
+        conn = psycopg2.connect(db.dsn)
+        with conn.cursor() as cur:
+            cur.execute("INSERT INTO conversations (name, is_group, created_by) VALUES ('bench', TRUE, 1) RETURNING id")
+            room = cur.fetchone()[0]
+            cur.execute("INSERT INTO conversation_members (conversation_id, user_id) "
+                        "SELECT %s, g FROM generate_series(1, %s) AS g", (room, args.users))
+        conn.commit()
+        conn.close()
+
+        ports = [free_port() for _ in range(args.processes)]
+        for port in ports:
+            pipe, child_pipe = multiprocessing.Pipe()
+            proc = multiprocessing.Process(target=gateway_main, args=(db.url, port, args.write_delay, child_pipe),
+                                           daemon=True)
+            proc.start()
+            gateways.append((proc, pipe))
+        if not all(pipe.recv() for _, pipe in gateways):
+            sys.exit("[!] A gateway could not connect its event bus")
+
+        latencies = asyncio.run(run_clients(ports, args, room))
+        stats = []
+        for _, pipe in gateways:
+            pipe.send('stop')
+            stats.append(pipe.recv())
+
+        members_per_process = [len(range(i + 1, args.users + 1, args.processes)) for i in range(args.processes)]
+        print(f"processes {args.processes}, users {args.users}, messages {args.messages} at {args.rate}/s, "
+              f"CHAT_WRITE_DELAY {args.write_delay} s")
+        for kind, expected in (('local', (members_per_process[0] - 1) * args.messages),
+                               ('remote', sum(members_per_process[1:]) * args.messages)):
+            values = sorted(latencies[kind])
+            print(f"{kind:<7} {len(values):>8} delivered of {expected:<8} "
+                  f"p50={percentile(values, 0.5) * 1e3:7.1f} ms  p99={percentile(values, 0.99) * 1e3:7.1f} ms")
+        for i, s in enumerate(stats):
+            per_fetch = s['received'] / s['batches'] if s['batches'] else 0
+            print(f"process {i}: bus sent={s['sent']} received={s['received']} batches={s['batches']} "
+                  f"({per_fetch:.1f} notifications per fetch), delivered from others={s['remote_delivered']}, "
+                  f"reconnects={s['reconnects']}")
+    finally:
+        for proc, _ in gateways:
+            proc.terminate()
+        db.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--dsn', help='PostgreSQL to create the scratch database on (default: initdb)')
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--users', type=int, default=400)
+    parser.add_argument('--messages', type=int, default=200)
+    parser.add_argument('--rate', type=float, default=20, help='messages per second from the sender')
+    parser.add_argument('--write-delay', type=float, default=0.05, help='CHAT_WRITE_DELAY')
+    parser.add_argument('--settle', type=float, default=2, help='seconds to wait for the last deliveries')
+    main(parser.parse_args())
@@ -0,0 +1,90 @@
+"""Message history page latency at increasing depth: keyset cursor vs OFFSET.
+
+Seeds one conversation with --rows messages in a local PostgreSQL (DATABASE_URL), then times
+fetching a 50-row page at several depths both ways. Keyset pages should stay flat; OFFSET grows
+linearly with depth.
+
+    DATABASE_URL=postgresql://localhost/chatme_bench python benchmarks/history_pagination.py --rows 5000000
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import psycopg2
+from app.extensions.migrations import upgrade
+
+PAGE = 50
+
+
+def seed(conn, rows):
+    with conn.cursor() as cur:
+        cur.execute("SELECT count(*) FROM messages WHERE conversation_id = 1")
+        existing = cur.fetchone()[0]
+        if existing >= rows:
+            return existing
+        cur.execute("INSERT INTO conversations (id, name, is_group) VALUES (1, 'bench', TRUE) ON CONFLICT DO NOTHING")
+        print(f"seeding {rows - existing:,} messages...")
+        cur.execute("""
+            INSERT INTO messages (conversation_id, sender_id, body, created_at)
+            SELECT 1, (g %% 100) + 1, md5(g::text), NOW() - (g || ' seconds')::interval
+            FROM generate_series(%s, %s) AS g
+        """, (existing + 1, rows))
+        # Noise in other conversations so the index isn't trivially one conversation
+        cur.execute("INSERT INTO conversations (id, name) VALUES (2, 'noise') ON CONFLICT DO NOTHING")
+        cur.execute("""
+            INSERT INTO messages (conversation_id, sender_id, body)
+            SELECT 2, 1, 'noise' FROM generate_series(1, %s)
+        """, (rows // 10,))
+    conn.commit()
+    with conn.cursor() as cur:
+        cur.execute("ANALYZE messages")
+    conn.commit()
+    return rows
+
+
+def time_query(conn, sql, params, repeat):
+    samples = []
+    with conn.cursor() as cur:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            cur.execute(sql, params)
+            cur.fetchall()
+            samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def main(args):
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    upgrade(conn)
+    total = seed(conn, args.rows)
+
+    print(f"{'depth':>12} {'keyset ms':>10} {'offset ms':>10}")
+    depth = PAGE
+    while depth < total:
+        with conn.cursor() as cur:
+            # The cursor a client would hold after paging down to this depth
+            cur.execute("SELECT id FROM messages WHERE conversation_id = 1 ORDER BY id DESC OFFSET %s LIMIT 1", (depth,))
+            cursor_id = cur.fetchone()[0]
+        keyset = time_query(conn, """
+            SELECT id, sender_id, body, created_at FROM messages
+            WHERE conversation_id = 1 AND id < %s ORDER BY id DESC LIMIT %s
+        """, (cursor_id, PAGE), args.repeat)
+        offset = time_query(conn, """
+            SELECT id, sender_id, body, created_at FROM messages
+            WHERE conversation_id = 1 ORDER BY id DESC OFFSET %s LIMIT %s
+        """, (depth, PAGE), args.repeat) if not args.skip_offset else float('nan')
+        print(f"{depth:>12,} {keyset:>10.3f} {offset:>10.3f}")
+        depth *= 10
+    conn.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=2_000_000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--skip-offset', action='store_true', help='only time keyset pages')
+    main(parser.parse_args())
@@ -0,0 +1,594 @@
+"""Load test of the whole app: signup -> verify -> login -> dashboard, with a regression gate.
+
+Boots create_app() under gunicorn (run.py, production mode) against local stand-ins:
+
+  * a disposable PostgreSQL database: created on --dsn and dropped afterwards, or, without --dsn, a
+    throwaway cluster made with initdb on a free port. Migrations are applied and --seed-users
+    verified accounts inserted;
+  * an SMTP sink that records the verification links the app mails out;
+  * a fake Google OAuth server (authorize redirect, token endpoint, signing certs) issuing RS256 ID
+    tokens, so /login/google -> /callback -> /dashboard runs the real verification code.
+
+Client processes then run virtual users picked by --mix:
+
+  new        GET / -> POST /signup -> GET the mailed /verify_email link -> POST /login -> /dashboardx x3 -> /logout
+  returning  POST /login (seeded account) -> /dashboardx x3 -> /logout
+  google     /login/google -> fake consent -> /callback -> /dashboard x2 -> /logout
+
+Each virtual user comes from its own X-Forwarded-For address, so the login throttle sees distinct
+clients. Per step it reports requests/s, p50/p95/p99 and DB queries per request; the query counts
+come from the app's /metrics at a sample rate of 1. Use --workers 1 for exact query counts, since
+/metrics only describes the worker that answers it.
+
+The run is compared with --baseline (benchmarks/load_baseline.json) when one exists. It exits 1 if
+any step's p95/p99 grew, or its throughput fell, by more than --tolerance, or if it now runs more
+queries per request. --save-baseline records the run as the new baseline instead.
+
+    python benchmarks/load_suite.py --dsn postgresql://localhost/postgres --duration 60 --save-baseline
+    python benchmarks/load_suite.py --dsn postgresql://localhost/postgres --duration 60
+"""
+import os
+import re
+import sys
+import json
+import time
+import email
+import random
+import socket
+import shutil
+import secrets
+import argparse
+import datetime
+import tempfile
+import threading
+import subprocess
+import http.client
+import socketserver
+import multiprocessing
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlencode, urlsplit, parse_qs
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+import bcrypt
+import psycopg2
+from psycopg2.extensions import make_dsn, parse_dsn
+from app.extensions.migrations import upgrade
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'load_baseline.json')
+PASSWORD = 'load-test-password'
+CLIENT_ID = 'loadtest.apps.googleusercontent.com'
+STEP_ENDPOINTS = {
+    'index': 'routes.index',
+    'signup': 'routes.signup',
+    'verify': 'routes.verify_email',
+    'login': 'routes.login',
+    'dashboardx': 'routes.dashboardx',
+    'google_login': 'routes.login_google',
+    'callback': 'routes.callback',
+    'dashboard': 'routes.dashboard',
+    'logout': 'routes.logout',
+}
+VERIFY_LINK = re.compile(r'https?://\S+/verify_email/\S+')
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+#─── disposable PostgreSQL ──────────────────────────────────────────────────────────────────────────────────────────
+class Database:
+    """A scratch database on --dsn's server, or on a temporary initdb cluster when no dsn is given."""
+
+    def __init__(self, dsn, workdir):
+        self.cluster = None
+        if not dsn:
+            if not shutil.which('initdb'):
+                sys.exit("Pass --dsn (any PostgreSQL you may create databases on) or put initdb on PATH")
+            self.cluster = os.path.join(workdir, 'pgdata')
+            port = free_port()
+            subprocess.run(['initdb', '-D', self.cluster, '-U', 'postgres', '-A', 'trust', '-E', 'UTF8'],
+                           check=True, stdout=subprocess.DEVNULL)
+            subprocess.run(['pg_ctl', '-D', self.cluster, '-w', '-l', os.path.join(workdir, 'postgres.log'),
+                            '-o', f"-p {port} -k {workdir} -c listen_addresses=127.0.0.1", 'start'],
+                           check=True, stdout=subprocess.DEVNULL)
+            dsn = f"postgresql://postgres@127.0.0.1:{port}/postgres"
+        self.admin_dsn = dsn
+        self.name = f"chatmekol_load_{os.getpid()}"
+        self._admin(f"CREATE DATABASE {self.name}")
+        self.dsn = make_dsn(dsn, dbname=self.name)
+        params = parse_dsn(self.dsn)
+        self.url = "postgresql://{user}{password}@{host}:{port}/{dbname}".format(
+            user=params.get('user', ''), password=f":{params['password']}" if params.get('password') else '',
+            host=params.get('host', '127.0.0.1'), port=params.get('port', 5432), dbname=self.name)
+
+    def _admin(self, sql):
+        conn = psycopg2.connect(self.admin_dsn)
+        conn.autocommit = True
+        try:
+            with conn.cursor() as cur:
+                cur.execute(sql)
+        finally:
+            conn.close()
+
+    def seed(self, users, rounds):
+        conn = psycopg2.connect(self.dsn)
+        try:
+            upgrade(conn)
+            hashed = bcrypt.hashpw(PASSWORD.encode(), bcrypt.gensalt(rounds)).decode()
+            with conn.cursor() as cur:
+                cur.execute("""
+                    INSERT INTO users (username, password, email_address, is_verified, picture)
+                    SELECT 'load' || g, %s, 'load' || g || '@example.com', TRUE, 'background/bp1.png'
+                    FROM generate_series(1, %s) AS g
+                """, (hashed, users))
+                cur.execute("ANALYZE users")
+            conn.commit()
+        finally:
+            conn.close()
+
+    def close(self):
+        try:
+            self._admin(f"DROP DATABASE IF EXISTS {self.name} WITH (FORCE)")
+        finally:
+            if self.cluster:
+                subprocess.run(['pg_ctl', '-D', self.cluster, '-w', '-m', 'immediate', 'stop'],
+                               stdout=subprocess.DEVNULL)
+
+
+#─── SMTP sink ──────────────────────────────────────────────────────────────────────────────────────────────────────
+class _SmtpHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(line + b"\r\n")
+
+    def handle(self):
+        self.reply(b"220 sink ESMTP")
+        recipients = []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line[:4].upper()
+            if command == b'RCPT':
+                recipients.append(line.split(b'<', 1)[-1].split(b'>', 1)[0].decode().lower())
+                self.reply(b"250 OK")
+            elif command == b'DATA':
+                self.reply(b"354 End data with <CR><LF>.<CR><LF>")
+                lines = []
+                for data_line in iter(self.rfile.readline, b''):
+                    if data_line in (b'.\r\n', b'.\n'):
+                        break
+                    lines.append(data_line[1:] if data_line.startswith(b'..') else data_line)
+                self.server.deliver(recipients, b''.join(lines))
+                recipients = []
+                self.reply(b"250 OK queued")
+            elif command == b'QUIT':
+                self.reply(b"221 Bye")
+                return
+            else:  # EHLO, HELO, MAIL, RSET, NOOP
+                if command == b'MAIL':
+                    recipients = []
+                self.reply(b"250 OK")
+
+
+class SmtpSink(socketserver.ThreadingTCPServer):
+    """Accepts every message and keeps the verification link mailed to each recipient."""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, links):
+        self.links = links
+        self.received = 0
+        super().__init__(('127.0.0.1', 0), _SmtpHandler)
+
+    def deliver(self, recipients, raw):
+        self.received += 1
+        message = email.message_from_bytes(raw)
+        for part in message.walk():
+            payload = part.get_payload(decode=True)
+            match = VERIFY_LINK.search(payload.decode(errors='replace')) if payload else None
+            if match:
+                for recipient in recipients:
+                    self.links[recipient] = match.group(0)
+
+
+#─── fake Google OAuth ──────────────────────────────────────────────────────────────────────────────────────────────
+class FakeGoogle(ThreadingHTTPServer):
+    """Authorize endpoint (redirects straight back with a code), token endpoint and signing certs."""
+    daemon_threads = True
+
+    def __init__(self):
+        from cryptography import x509
+        from cryptography.x509.oid import NameOID
+        from cryptography.hazmat.primitives import hashes, serialization
+        from cryptography.hazmat.primitives.asymmetric import rsa
+        from google.auth import crypt
+
+        key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, 'fake-google')])
+        now = datetime.datetime.now(datetime.timezone.utc)
+        cert = (x509.CertificateBuilder().subject_name(name).issuer_name(name).public_key(key.public_key())
+                .serial_number(x509.random_serial_number()).not_valid_before(now - datetime.timedelta(days=1))
+                .not_valid_after(now + datetime.timedelta(days=1)).sign(key, hashes.SHA256()))
+        self.kid = secrets.token_hex(8)
+        self.certs = json.dumps({self.kid: cert.public_bytes(serialization.Encoding.PEM).decode()}).encode()
+        pem = key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                serialization.NoEncryption())
+        self.signer = crypt.RSASigner.from_string(pem, key_id=self.kid)
+        self.codes = {}
+        self.app_base = None
+        super().__init__(('127.0.0.1', 0), _GoogleHandler)
+
+    @property
+    def base(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def client_secrets(self):
+        return {'web': {
+            'client_id': CLIENT_ID,
+            'client_secret': 'loadtest-secret',
+            'auth_uri': f"{self.base}/auth",
+            'token_uri': f"{self.base}/token",
+            'redirect_uris': ['https://chatmekol.onrender.com/callback', 'https://127.0.0.1:5000/callback'],
+        }}
+
+    def id_token(self, subject):
+        from google.auth import jwt
+        now = int(time.time())
+        return jwt.encode(self.signer, {
+            'iss': 'https://accounts.google.com', 'aud': CLIENT_ID, 'sub': subject, 'iat': now, 'exp': now + 3600,
+            'email': f"{subject}@example.com", 'email_verified': True, 'name': f"Google {subject}",
+            'picture': f"https://lh3.googleusercontent.com/a/{subject}=s96-c",
+        }).decode()
+
+
+class _GoogleHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def send(self, status, body=b'', content_type='application/json', headers=()):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path == '/certs':
+            return self.send(200, self.server.certs, headers=[('Cache-Control', 'public, max-age=3600')])
+        if url.path == '/auth':
+            query = parse_qs(url.query)
+            code = secrets.token_urlsafe(16)
+            self.server.codes[code] = query.get('login_hint', ['g' + secrets.token_hex(6)])[0]
+            location = f"{self.server.app_base}/callback?" + urlencode({'state': query['state'][0], 'code': code})
+            return self.send(302, headers=[('Location', location)])
+        self.send(404)
+
+    def do_POST(self):
+        body = parse_qs(self.rfile.read(int(self.headers.get('Content-Length', 0))).decode())
+        subject = self.server.codes.pop(body.get('code', [''])[0], None)
+        if urlsplit(self.path).path != '/token' or subject is None:
+            return self.send(400, b'{"error": "invalid_grant"}')
+        self.send(200, json.dumps({
+            'access_token': secrets.token_urlsafe(24), 'token_type': 'Bearer', 'expires_in': 3599,
+            'id_token': self.server.id_token(subject),
+        }).encode())
+
+
+#─── the app under test ─────────────────────────────────────────────────────────────────────────────────────────────
+def start_app(port, db, smtp_port, google, workdir, args):
+    metrics_token = secrets.token_urlsafe(16)
+    env = dict(os.environ, PORT=str(port), FLASK_ENV='production', LOCAL_TLS='false', SECRET_KEY='load-test',
+               DATABASE_URL=db.url, WEB_CONCURRENCY=str(args.workers), GUNICORN_THREADS=str(args.server_threads),
+               GUNICORN_LOG_LEVEL='warning', CHAT_ENABLED='false', BCRYPT_ROUNDS=str(args.bcrypt_rounds),
+               MAIL_SERVER='127.0.0.1', MAIL_PORT=str(smtp_port), MAIL_USE_TLS='false',
+               MAIL_USERNAME='loadtest@example.com', MAIL_PASSWORD='',
+               MAIL_QUEUE_PATH=os.path.join(workdir, 'mail_queue.sqlite3'),
+               METRICS_SAMPLE_RATE='1', METRICS_TOKEN=metrics_token, THROTTLE_PROXY_HOPS='1',
+               OAUTH_CLIENT_SECRETS_DIR=workdir, GOOGLE_CERTS_URL=f"{google.base}/certs",
+               GOOGLE_OAUTH_CLIENT_ID=CLIENT_ID, OAUTHLIB_INSECURE_TRANSPORT='1', OAUTHLIB_RELAX_TOKEN_SCOPE='1')
+    with open(os.path.join(workdir, 'client_secret_dev.json'), 'w') as f:
+        json.dump(google.client_secrets(), f)
+    log = open(os.path.join(workdir, 'app.log'), 'wb')
+    proc = subprocess.Popen([sys.executable, 'run.py'], cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            break
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=2)
+            conn.request('GET', '/')
+            if conn.getresponse().status == 200:
+                return proc, metrics_token
+        except OSError:
+            time.sleep(0.3)
+    proc.kill()
+    sys.exit(f"The app did not come up on port {port}; see {log.name}")
+
+
+def scrape_db_queries(port, token):
+    """{endpoint: mean queries per request} from the app's db_queries_per_request histogram."""
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+    conn.request('GET', '/metrics', headers={'Authorization': f"Bearer {token}"})
+    text = conn.getresponse().read().decode()
+    sums, counts = {}, {}
+    for name, endpoint, value in re.findall(r'^db_queries_per_request_(sum|count)\{endpoint="([^"]+)"\} (\S+)$',
+                                            text, re.M):
+        (sums if name == 'sum' else counts)[endpoint] = float(value)
+    return {endpoint: sums.get(endpoint, 0.0) / count for endpoint, count in counts.items() if count}
+
+
+#─── virtual users ──────────────────────────────────────────────────────────────────────────────────────────────────
+class Browser:
+    """One visitor: its own cookies and X-Forwarded-For address, over a shared keep-alive connection."""
+
+    def __init__(self, conn, samples, rng):
+        self.conn = conn
+        self.samples = samples
+        self.cookies = {}
+        self.ip = f"10.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(1, 255)}"
+
+    def request(self, step, method, path, form=None, expect=(200,), location=None):
+        headers = {'X-Forwarded-For': self.ip}
+        if self.cookies:
+            headers['Cookie'] = '; '.join(f"{k}={v}" for k, v in self.cookies.items())
+        body = None
+        if form is not None:
+            body = urlencode(form)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        start = time.perf_counter()
+        try:
+            self.conn.request(method, path, body=body, headers=headers)
+            response = self.conn.getresponse()
+            response.read()
+        except (OSError, http.client.HTTPException):
+            self.conn.close()
+            self.samples.append((step, time.perf_counter() - start, False))
+            raise
+        elapsed = time.perf_counter() - start
+        for header in response.headers.get_all('Set-Cookie') or ():
+            name, _, rest = header.partition('=')
+            value = rest.split(';', 1)[0]
+            if value and 'expires=thu, 01 jan 1970' not in header.lower():
+                self.cookies[name] = value
+            else:
+                self.cookies.pop(name, None)
+        target = response.getheader('Location', '')
+        ok = response.status in expect and (location is None or location in target)
+        self.samples.append((step, elapsed, ok))
+        return target
+
+
+def new_user(browser, rng, ctx):
+    username = 'n' + secrets.token_hex(5)
+    address = f"{username}@example.com"
+    browser.request('index', 'GET', '/')
+    browser.request('signup', 'POST', '/signup', {'username': username, 'email_address': address,
+                                                  'password': PASSWORD, 'confirm_password': PASSWORD}, expect=(302,))
+    deadline = time.monotonic() + 30
+    while address not in ctx['links']:
+        if time.monotonic() > deadline:
+            browser.samples.append(('verify', 30.0, False))
+            return
+        time.sleep(0.05)
+    link = urlsplit(ctx['links'].pop(address))
+    browser.request('verify', 'GET', link.path, expect=(302,))
+    password_session(browser, username)
+
+
+def returning_user(browser, rng, ctx):
+    password_session(browser, f"load{rng.randrange(ctx['seeded']) + 1}")
+
+
+def password_session(browser, username):
+    browser.request('login', 'POST', '/login', {'username': username, 'password': PASSWORD},
+                    expect=(302,), location='/dashboardx')
+    for _ in range(3):
+        browser.request('dashboardx', 'GET', '/dashboardx')
+    browser.request('logout', 'GET', '/logout', expect=(302,))
+
+
+def google_user(browser, rng, ctx):
+    consent = browser.request('google_login', 'GET', '/login/google', expect=(302,), location='/auth')
+    url = urlsplit(consent)
+    google = http.client.HTTPConnection(url.hostname, url.port, timeout=30)
+    google.request('GET', f"{url.path}?{url.query}&login_hint=g{rng.randrange(ctx['google_accounts'])}")
+    callback = urlsplit(google.getresponse().getheader('Location'))
+    google.close()
+    browser.request('callback', 'GET', f"{callback.path}?{callback.query}", expect=(302,), location='/dashboard')
+    for _ in range(2):
+        browser.request('dashboard', 'GET', '/dashboard')
+    browser.request('logout', 'GET', '/logout', expect=(302,))
+
+
+JOURNEYS = {'new': new_user, 'returning': returning_user, 'google': google_user}
+
+
+def client(port, ctx, mix, threads, duration, results):
+    stop_at = time.monotonic() + duration
+    names, weights = zip(*mix.items())
+    samples, lock = [], threading.Lock()
+
+    def loop():
+        rng = random.Random()
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+        local = []
+        while time.monotonic() < stop_at:
+            journey = JOURNEYS[rng.choices(names, weights)[0]]
+            try:
+                journey(Browser(conn, local, rng), rng, ctx)
+            except (OSError, http.client.HTTPException):
+                conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+        with lock:
+            samples.extend(local)
+
+    workers = [threading.Thread(target=loop) for _ in range(threads)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    results.put(samples)
+
+
+def drive(port, ctx, args, duration):
+    results = multiprocessing.Queue()
+    procs = [multiprocessing.Process(target=client, args=(port, ctx, args.mix, args.threads, duration, results))
+             for _ in range(args.clients)]
+    for p in procs:
+        p.start()
+    samples = []
+    for _ in procs:
+        samples.extend(results.get())
+    for p in procs:
+        p.join()
+    return samples
+
+
+#─── report and gate ────────────────────────────────────────────────────────────────────────────────────────────────
+def summarize(samples, duration, db_queries):
+    steps = {}
+    for step in STEP_ENDPOINTS:
+        latencies = sorted(s for name, s, _ in samples if name == step)
+        if not latencies:
+            continue
+        pick = lambda q: latencies[min(len(latencies) - 1, int(len(latencies) * q))] * 1000
+        steps[step] = {
+            'count': len(latencies),
+            'errors': sum(1 for name, _, ok in samples if name == step and not ok),
+            'rps': len(latencies) / duration,
+            'p50_ms': pick(0.50),
+            'p95_ms': pick(0.95),
+            'p99_ms': pick(0.99),
+            'db_queries': db_queries.get(STEP_ENDPOINTS[step]),
+        }
+    return steps
+
+
+def print_table(steps):
+    print(f"{'step':<13} {'count':>7} {'errors':>6} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'queries':>8}")
+    for step, s in steps.items():
+        queries = f"{s['db_queries']:.2f}" if s['db_queries'] is not None else '-'
+        print(f"{step:<13} {s['count']:>7} {s['errors']:>6} {s['rps']:>8.1f} {s['p50_ms']:>8.1f} "
+              f"{s['p95_ms']:>8.1f} {s['p99_ms']:>8.1f} {queries:>8}")
+
+
+def regressions(steps, baseline, tolerance):
+    found = []
+    for step, before in baseline['steps'].items():
+        now = steps.get(step)
+        if now is None:
+            found.append(f"{step}: no longer exercised")
+            continue
+        for key in ('p95_ms', 'p99_ms'):
+            if now[key] > before[key] * (1 + tolerance):
+                found.append(f"{step}: {key} {before[key]:.1f} -> {now[key]:.1f}")
+        if now['rps'] < before['rps'] * (1 - tolerance):
+            found.append(f"{step}: req/s {before['rps']:.1f} -> {now['rps']:.1f}")
+        if before.get('db_queries') is not None and now['db_queries'] is not None \
+                and now['db_queries'] > before['db_queries'] + 0.25:
+            found.append(f"{step}: queries/request {before['db_queries']:.2f} -> {now['db_queries']:.2f}")
+        if now['errors'] > before['errors']:
+            found.append(f"{step}: errors {before['errors']} -> {now['errors']}")
+    return found
+
+
+def main(args):
+    workdir = tempfile.mkdtemp(prefix='chatmekol-load-')
+    manager = multiprocessing.Manager()
+    links = manager.dict()
+    smtp = SmtpSink(links)
+    google = FakeGoogle()
+    for server in (smtp, google):
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    db = Database(args.dsn, workdir)
+    proc = None
+    try:
+        db.seed(args.seed_users, args.bcrypt_rounds)
+        port = free_port()
+        google.app_base = f"http://127.0.0.1:{port}"
+        proc, token = start_app(port, db, smtp.server_address[1], google, workdir, args)
+        ctx = {'links': links, 'seeded': args.seed_users, 'google_accounts': args.seed_users}
+        if args.warmup:
+            drive(port, ctx, args, args.warmup)
+        samples = drive(port, ctx, args, args.duration)
+        db_queries = scrape_db_queries(port, token)
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait(30)
+        db.close()
+        smtp.shutdown()
+        google.shutdown()
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    steps = summarize(samples, args.duration, db_queries)
+    print_table(steps)
+    result = {
+        'created': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'cpus': os.cpu_count(),
+        'config': {k: getattr(args, k) for k in ('duration', 'clients', 'threads', 'workers', 'server_threads',
+                                                 'bcrypt_rounds', 'seed_users', 'mix')},
+        'steps': steps,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(result, f, indent=2)
+        print(f"\nBaseline saved to {args.baseline}")
+        return
+    if not os.path.exists(args.baseline):
+        print(f"\nNo baseline at {args.baseline}; run with --save-baseline to record one")
+        return
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline['config'] != result['config'] or baseline['cpus'] != result['cpus']:
+        print("\n[~] Baseline was recorded with a different configuration or machine; comparing anyway")
+    found = regressions(steps, baseline, args.tolerance)
+    if found:
+        print(f"\n{len(found)} regression(s) against {args.baseline}:")
+        for line in found:
+            print(f"  {line}")
+        sys.exit(1)
+    print(f"\nNo regressions against {args.baseline} (tolerance {args.tolerance:.0%})")
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        if name not in JOURNEYS:
+            raise argparse.ArgumentTypeError(f"unknown journey {name!r}; choose from {', '.join(JOURNEYS)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--dsn', default=os.getenv('LOAD_TEST_DSN'),
+                        help='server to create the scratch database on (default: a temporary initdb cluster)')
+    parser.add_argument('--duration', type=float, default=60)
+    parser.add_argument('--warmup', type=float, default=5, help='seconds of unmeasured load first')
+    parser.add_argument('--clients', type=int, default=2, help='client processes')
+    parser.add_argument('--threads', type=int, default=8, help='virtual users per client process')
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix('new=2,returning=6,google=2'))
+    parser.add_argument('--workers', type=int, default=1, help='gunicorn workers')
+    parser.add_argument('--server-threads', type=int, default=8, help='gunicorn threads per worker')
+    parser.add_argument('--bcrypt-rounds', type=int, default=12)
+    parser.add_argument('--seed-users', type=int, default=5000, help='verified accounts for returning users')
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--tolerance', type=float, default=0.15, help='allowed relative slowdown per step')
+    parser.add_argument('--output', help='also write this run as JSON here')
+    parser.add_argument('--keep', action='store_true', help='keep the work directory (app log, mail queue)')
+    main(parser.parse_args())
@@ -0,0 +1,119 @@
+"""Credential-stuffing load test: CPU spent on /login with and without throttling.
+
+Builds a small app whose /login has the same decorators as the real route (per-IP and per-account
+sliding windows plus the exponential lockout). It verifies every attempt with the real bcrypt
+process pool. Attacker threads then cycle through --accounts usernames from --ips addresses. Each
+second it samples the CPU used by the bcrypt workers. (The attacker threads share this process, so
+its own CPU is busy either way.) Without throttling, bcrypt CPU is pinned for the whole attack. With
+throttling, it spikes for the first allowed attempts, then drops to zero while the rejected requests
+cost microseconds each.
+
+    python benchmarks/login_attack.py --duration 20 --threads 16
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import psutil
+from flask import Flask, Blueprint, request, redirect, flash
+from werkzeug.test import create_environ
+from app.extensions.hashing import PasswordHasher
+from app.extensions.throttle import Throttle
+
+
+def make_app(throttled, rounds):
+    app = Flask(__name__)
+    app.config.update(SECRET_KEY='bench', BCRYPT_ROUNDS=rounds, BCRYPT_MAX_PENDING=64,
+                      BCRYPT_QUEUE_TIMEOUT=30, RATELIMIT_ENABLED=throttled)
+    hasher = PasswordHasher(app)
+    throttle = Throttle(app)
+    stored = hasher.hash('correct horse battery staple')
+    stats = {'bcrypt': 0}
+
+    routes = Blueprint('routes', __name__)
+
+    @routes.route('/')
+    def index():
+        return 'index'
+
+    @routes.route('/login', methods=['POST'])
+    @throttle.login
+    @throttle.reject_locked('username')
+    def login():
+        stats['bcrypt'] += 1
+        if hasher.verify(request.form['password'], stored):
+            throttle.record_success(request.form['username'])
+        else:
+            throttle.record_failure(request.form['username'])
+            flash('Incorrect password.', 'danger')
+        return redirect('/')
+
+    app.register_blueprint(routes)
+    return app, stats
+
+
+def attack(app, args):
+    stop_at = time.monotonic() + args.duration
+    answered = [0]
+    lock = threading.Lock()
+
+    def attacker():
+        rng = random.Random()
+        done = 0
+        while time.monotonic() < stop_at:
+            environ = create_environ('/login', method='POST',
+                                     data={'username': f"user{rng.randrange(args.accounts)}",
+                                           'password': f"guess{rng.random()}"},
+                                     environ_base={'REMOTE_ADDR': f"10.0.0.{rng.randrange(args.ips)}"})
+            for _ in app(environ, lambda status, headers: None):
+                pass
+            done += 1
+        with lock:
+            answered[0] += done
+
+    me = psutil.Process()
+    threads = [threading.Thread(target=attacker) for _ in range(args.threads)]
+    for t in threads:
+        t.start()
+    samples = []
+    last = None
+    while any(t.is_alive() for t in threads):
+        cpu = 0.0
+        for p in me.children(recursive=True):
+            try:
+                times = p.cpu_times()
+                cpu += times.user + times.system
+            except psutil.NoSuchProcess:
+                pass
+        if last is not None:
+            samples.append(cpu - last)
+        last = cpu
+        time.sleep(1)
+    for t in threads:
+        t.join()
+    return answered[0], samples
+
+
+def main(args):
+    for throttled in (False, True):
+        app, stats = make_app(throttled, args.rounds)
+        answered, samples = attack(app, args)
+        label = 'throttled' if throttled else 'unthrottled'
+        per_second = ' '.join(f"{s:4.2f}" for s in samples)
+        print(f"{label:>11}: {answered / args.duration:8,.0f} req/s  bcrypt runs={stats['bcrypt']:>6}  "
+              f"bcrypt CPU s/s [{per_second}]")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--duration', type=float, default=20)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--accounts', type=int, default=200, help='usernames the attacker cycles through')
+    parser.add_argument('--ips', type=int, default=2, help='source addresses the attacker rotates')
+    parser.add_argument('--rounds', type=int, default=12, help='bcrypt cost')
+    main(parser.parse_args())
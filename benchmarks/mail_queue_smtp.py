@@ -0,0 +1,138 @@
+"""Mail queue against a local SMTP sink: enqueue cost, batched delivery, retries, dedup and restart.
+
+Runs an aiosmtpd server on localhost (requirements-dev.txt) and points Flask-Mail at it, so no
+mail leaves the machine. Checks, in order:
+
+  burst    --messages emails queued from request-like calls, delivered by the worker thread over
+           one SMTP connection per batch (reports enqueue latency and connections used)
+  dedup    the same reset email requested five times in a row is queued once
+  retry    a message the sink rejects with 451 once is retried with backoff and delivered
+  restart  mail left pending by a stopped process is delivered when the next one starts
+
+Exits 1 if a check fails.
+
+    python benchmarks/mail_queue_smtp.py --messages 500
+"""
+import os
+import sys
+import time
+import socket
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from aiosmtpd.controller import Controller
+from flask import Flask
+from app.extensions.mail import mail
+from app.extensions.mail_queue import MailQueue
+
+
+class Sink:
+    """Collects messages; rejects the first attempt for any recipient in ``flaky``."""
+
+    def __init__(self):
+        self.received = []
+        self.connections = set()
+        self.flaky = set()
+
+    async def handle_DATA(self, server, session, envelope):
+        self.connections.add(session.peer)
+        for rcpt in envelope.rcpt_tos:
+            if rcpt in self.flaky:
+                self.flaky.discard(rcpt)
+                return '451 Try again later'
+        self.received.extend(envelope.rcpt_tos)
+        return '250 OK'
+
+
+def make_app(port, path, args, autostart=True):
+    app = Flask(__name__)
+    app.config.update(
+        MAIL_SERVER='127.0.0.1', MAIL_PORT=port, MAIL_USE_TLS=False, MAIL_USE_SSL=False,
+        MAIL_DEFAULT_SENDER='bench@example.com',
+        MAIL_QUEUE_PATH=path, MAIL_QUEUE_BATCH_SIZE=args.batch_size, MAIL_QUEUE_POLL_INTERVAL=0.1,
+        MAIL_QUEUE_RETRY_BASE=0.2, MAIL_QUEUE_AUTOSTART=autostart,
+    )
+    mail.init_app(app)
+    return app, MailQueue(app)
+
+
+def wait_for(sink, recipients, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if recipients <= set(sink.received):
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def main(args):
+    sink = Sink()
+    port = free_port()
+    controller = Controller(sink, hostname='127.0.0.1', port=port)
+    controller.start()
+    failed = []
+
+    def check(name, ok, detail):
+        print(f"{name:<9}{'ok' if ok else 'FAILED':<8}{detail}")
+        if not ok:
+            failed.append(name)
+
+    try:
+        app, queue = make_app(port, os.path.join(tempfile.mkdtemp(prefix='chatmekol_mail_'), 'outbox.sqlite3'), args)
+
+        recipients = {f"user{i}@example.com" for i in range(args.messages)}
+        start = time.perf_counter()
+        for rcpt in sorted(recipients):
+            queue.enqueue('Verify your email', 'Click the link.', rcpt)
+        queued = time.perf_counter() - start
+        ok = wait_for(sink, recipients, args.timeout)
+        delivered = time.perf_counter() - start
+        check('burst', ok, f"{queued / args.messages * 1e6:.0f} us per enqueue, delivered in {delivered:.2f} s "
+                           f"over {len(sink.connections)} connection(s) (batch size {args.batch_size})")
+
+        before = len(sink.received)
+        queued = sum(queue.enqueue('Reset your password', 'Click the link.', 'dup@example.com',
+                                   dedup_key='reset:dup@example.com') for _ in range(5))
+        ok = wait_for(sink, {'dup@example.com'}, args.timeout)
+        time.sleep(0.3)  # a second copy would have arrived by now
+        check('dedup', ok and queued == 1 and len(sink.received) == before + 1,
+              f"{queued} of 5 requests queued, {len(sink.received) - before} delivered")
+
+        sink.flaky.add('flaky@example.com')
+        start = time.perf_counter()
+        queue.enqueue('Verify your email', 'Click the link.', 'flaky@example.com')
+        ok = wait_for(sink, {'flaky@example.com'}, args.timeout)
+        check('retry', ok, f"delivered after a 451 in {time.perf_counter() - start:.2f} s")
+
+        path = os.path.join(tempfile.mkdtemp(prefix='chatmekol_mail_'), 'outbox.sqlite3')
+        _, old = make_app(port, path, args)
+        old._stop.set()  # its worker exits at once, as if the process had been stopped
+        old.enqueue('Verify your email', 'Click the link.', 'leftover@example.com')
+        time.sleep(0.3)
+        left = 'leftover@example.com' not in sink.received
+        make_app(port, path, args)  # the next process: init_app finds the pending row
+        ok = wait_for(sink, {'leftover@example.com'}, args.timeout)
+        check('restart', left and ok, "pending mail delivered by the next process" if left and ok else
+              "left pending" if left else "sent by the stopped process")
+    finally:
+        controller.stop()
+
+    if failed:
+        print(f"[!] failed: {', '.join(failed)}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--messages', type=int, default=500)
+    parser.add_argument('--batch-size', type=int, default=20)
+    parser.add_argument('--timeout', type=float, default=30.0, help='seconds to wait for each delivery')
+    main(parser.parse_args())
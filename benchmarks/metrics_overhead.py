@@ -0,0 +1,59 @@
+"""Request tracing overhead: a trivial route with and without the metrics hooks.
+
+The route does no work, so this is the worst case: any real endpoint spends far longer in
+templates, bcrypt or PostgreSQL, and the relative overhead shrinks accordingly.
+
+    python benchmarks/metrics_overhead.py --requests 20000
+"""
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from flask import Flask
+from werkzeug.test import create_environ
+from app.extensions.metrics import Metrics
+
+
+def make_app(sample_rate=None):
+    app = Flask(__name__)
+
+    @app.route('/')
+    def index():
+        return 'ok'
+
+    if sample_rate is not None:
+        app.config['METRICS_SAMPLE_RATE'] = sample_rate
+        Metrics(app)
+    return app
+
+
+def per_request_us(app, requests):
+    def get():
+        for _ in app(create_environ('/'), lambda status, headers: None):
+            pass
+
+    for _ in range(500):  # warm-up
+        get()
+    start = time.perf_counter()
+    for _ in range(requests):
+        get()
+    return (time.perf_counter() - start) / requests * 1e6
+
+
+def main(args):
+    baseline = min(per_request_us(make_app(), args.requests) for _ in range(args.repeat))
+    print(f"{'no metrics':>16}: {baseline:8.2f} us/request")
+    for rate in (0.1, 1.0):
+        cost = min(per_request_us(make_app(rate), args.requests) for _ in range(args.repeat))
+        print(f"{f'sample_rate={rate}':>16}: {cost:8.2f} us/request  "
+              f"(+{cost - baseline:.2f} us, {(cost - baseline) / baseline * 100:+.1f}%)")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=3)
+    main(parser.parse_args())
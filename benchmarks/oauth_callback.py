@@ -0,0 +1,143 @@
+"""Google OAuth callback cost: per-request Flow/transport vs the cached OAuth registry.
+
+Runs a fake OAuth server on localhost that issues RS256 ID tokens from /token and serves its
+signing certificate from /certs with Cache-Control: max-age. Each iteration does what callback()
+does -- build a Flow, exchange the code, verify the ID token -- first the old way (secrets file
+re-read, new transport, certs re-fetched) and then through OAuthRegistry.
+
+    python benchmarks/oauth_callback.py --iterations 500
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import datetime
+import tempfile
+import threading
+import statistics
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+os.environ['OAUTHLIB_INSECURE_TRANSPORT'] = '1'  # the fake server is plain http
+
+from cryptography import x509
+from cryptography.x509.oid import NameOID
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from flask import Flask
+from google.auth import crypt, jwt
+from google.auth.transport.requests import Request
+from google.oauth2 import id_token
+from google_auth_oauthlib.flow import Flow
+from app.extensions.oauth import OAuthRegistry, SCOPES
+
+CLIENT_ID = 'bench-client.apps.googleusercontent.com'
+KEY_ID = 'bench-key'
+REDIRECT_URI = 'http://127.0.0.1:5000/callback'
+
+
+def make_key_and_cert():
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, 'fake-oauth')])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (x509.CertificateBuilder().subject_name(name).issuer_name(name)
+            .public_key(key.public_key()).serial_number(1)
+            .not_valid_before(now - datetime.timedelta(days=1))
+            .not_valid_after(now + datetime.timedelta(days=1))
+            .sign(key, hashes.SHA256()))
+    key_pem = key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                serialization.NoEncryption()).decode()
+    return key_pem, cert.public_bytes(serialization.Encoding.PEM).decode()
+
+
+def start_fake_server(key_pem, cert_pem):
+    signer = crypt.RSASigner.from_string(key_pem, key_id=KEY_ID)
+    stats = {'token': 0, 'certs': 0}
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'  # keep-alive, so pooled clients can reuse the connection
+        disable_nagle_algorithm = True  # headers and body are separate writes
+
+        def _send(self, payload, headers=()):
+            body = json.dumps(payload).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            for name, value in headers:
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            stats['certs'] += 1
+            self._send({KEY_ID: cert_pem}, [('Cache-Control', 'public, max-age=3600')])
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            stats['token'] += 1
+            now = int(time.time())
+            token = jwt.encode(signer, {
+                'iss': 'https://accounts.google.com', 'aud': CLIENT_ID, 'sub': '1234567890',
+                'email': 'bench@example.com', 'name': 'Bench', 'iat': now, 'exp': now + 3600,
+            }).decode()
+            self._send({'access_token': 'at', 'token_type': 'Bearer', 'expires_in': 3600, 'id_token': token})
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}", stats
+
+
+def timed(fn, iterations):
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return statistics.median(samples), samples[int(len(samples) * 0.99) - 1]
+
+
+def main(args):
+    key_pem, cert_pem = make_key_and_cert()
+    base_url, stats = start_fake_server(key_pem, cert_pem)
+    certs_url = f"{base_url}/certs"
+
+    secrets_dir = tempfile.mkdtemp()
+    secrets_file = os.path.join(secrets_dir, 'client_secret_dev.json')
+    with open(secrets_file, 'w') as f:
+        json.dump({'web': {
+            'client_id': CLIENT_ID, 'client_secret': 'secret', 'project_id': 'bench',
+            'auth_uri': f'{base_url}/auth', 'token_uri': f'{base_url}/token',
+            'redirect_uris': [REDIRECT_URI],
+        }}, f)
+
+    def per_request_callback():
+        flow = Flow.from_client_secrets_file(secrets_file, scopes=SCOPES, redirect_uri=REDIRECT_URI)
+        flow.fetch_token(code='bench-code')
+        id_token.verify_token(flow.credentials.id_token, Request(), audience=CLIENT_ID, certs_url=certs_url)
+
+    app = Flask(__name__)
+    app.config.update(OAUTH_CLIENT_SECRETS_DIR=secrets_dir, GOOGLE_CERTS_URL=certs_url)
+    registry = OAuthRegistry(app)
+
+    def registry_callback():
+        flow = registry.flow('127.0.0.1:5000', REDIRECT_URI)
+        flow.fetch_token(code='bench-code')
+        registry.verify_id_token(flow.credentials.id_token, CLIENT_ID)
+
+    for label, fn in (('per-request', per_request_callback), ('registry', registry_callback)):
+        stats.update(token=0, certs=0)
+        fn()  # warm-up
+        p50, p99 = timed(fn, args.iterations)
+        print(f"{label:>12}: p50={p50:.2f} ms  p99={p99:.2f} ms  "
+              f"token calls={stats['token']}  cert fetches={stats['certs']}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=300)
+    main(parser.parse_args())
@@ -0,0 +1,186 @@
+"""Concurrency check: many simultaneous first logins through the OAuth provisioning upsert.
+
+Creates a scratch schema and applies app/migrations there. Then --threads threads, released together
+by a barrier, each sign in every one of --accounts new Google and Facebook accounts through
+provisioner.provision(). It checks that:
+
+  * no call raised (no unique violations, no deadlocks);
+  * each account has exactly one users row, and every thread got the same id for it;
+  * exactly one call per account reported created=True;
+  * a second round refreshes the name but keeps an uploaded /avatars/ picture.
+
+--legacy runs the old SELECT-then-INSERT callback under the same load, for comparison.
+
+    DATABASE_URL=postgresql://localhost/chatmekol python benchmarks/oauth_provisioning.py --threads 32
+"""
+import os
+import sys
+import time
+import argparse
+import threading
+from collections import defaultdict
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import psycopg2
+from flask import Flask
+from app.extensions.migrations import upgrade
+from app.extensions.profile_cache import profile_cache
+from app.extensions.provisioning import provisioner
+from app.routes.postgresql import init_db_pool, db_connection
+
+
+def legacy_google(subject, name, email, picture):
+    """The callback before the upsert: check, then insert. Returns the id, or None if it only inserted."""
+    with db_connection() as conn, conn.cursor() as cur:
+        cur.execute("SELECT id FROM users WHERE google_id = %s", (subject,))
+        existing = cur.fetchone()
+        if not existing:
+            cur.execute("""
+                INSERT INTO users (username, email_address, google_id, picture, is_verified)
+                VALUES (%s, %s, %s, %s, %s)
+            """, (name, email, subject, picture, True))
+            conn.commit()
+            return None
+        return existing['id']
+
+
+def stampede(app, args, round_no, legacy=False):
+    barrier = threading.Barrier(args.threads)
+    results = defaultdict(list)   # (provider, subject) -> [(id, created)]
+    errors = []
+    latencies = []
+    lock = threading.Lock()
+
+    def worker():
+        mine, mine_errors, mine_latency = [], [], []
+        with app.app_context():
+            barrier.wait()
+            for n in range(args.accounts):
+                for provider in ('google', 'facebook'):
+                    if legacy and provider == 'facebook':
+                        continue
+                    subject = f"{provider[0]}{n}"
+                    name = f"{provider} user {n} v{round_no}"
+                    picture = f"https://example.com/{subject}-v{round_no}.jpg"
+                    start = time.perf_counter()
+                    try:
+                        if legacy:
+                            mine.append(((provider, subject), (legacy_google(subject, name, f"{subject}@example.com",
+                                                                             picture), None)))
+                        else:
+                            user = provisioner.provision(provider, subject, name, f"{subject}@example.com",
+                                                         picture, verified=provider == 'google')
+                            mine.append(((provider, subject), (user['id'], user['created'])))
+                    except psycopg2.Error as e:
+                        mine_errors.append(f"{type(e).__name__}: {e.pgerror or e}".strip())
+                    mine_latency.append(time.perf_counter() - start)
+        with lock:
+            for key, value in mine:
+                results[key].append(value)
+            errors.extend(mine_errors)
+            latencies.extend(mine_latency)
+
+    threads = [threading.Thread(target=worker) for _ in range(args.threads)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    p = lambda q: latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000
+    print(f"round {round_no}: {len(latencies):,} sign-ins in {elapsed:.2f}s  "
+          f"p50={p(0.50):.1f}ms p99={p(0.99):.1f}ms  errors={len(errors)}")
+    for message in sorted(set(errors))[:5]:
+        print(f"    {message.splitlines()[0]}")
+    return results, errors
+
+
+def check(app, results, errors, expect_created):
+    problems = list(errors)
+    for (provider, subject), calls in results.items():
+        ids = {user_id for user_id, _ in calls}
+        if len(ids) != 1:
+            problems.append(f"{provider} {subject}: threads saw ids {sorted(ids)}")
+        created = sum(1 for _, was_created in calls if was_created)
+        if created != (1 if expect_created else 0):
+            problems.append(f"{provider} {subject}: created reported {created} times")
+    with app.app_context(), db_connection() as conn, conn.cursor() as cur:
+        cur.execute("""
+            SELECT COALESCE(google_id, facebook_id) AS subject, count(*) AS n FROM users
+            GROUP BY 1 HAVING count(*) > 1
+        """)
+        problems.extend(f"{row['subject']}: {row['n']} rows" for row in cur.fetchall())
+    return problems
+
+
+def main(args):
+    if not args.dsn:
+        sys.exit("Set DATABASE_URL or pass --dsn")
+    os.environ['DATABASE_URL'] = args.dsn
+    os.environ['PGOPTIONS'] = f"-c search_path={args.schema}"  # every pooled connection uses the scratch schema
+
+    conn = psycopg2.connect(args.dsn)
+    with conn.cursor() as cur:
+        cur.execute(f"DROP SCHEMA IF EXISTS {args.schema} CASCADE")
+        cur.execute(f"CREATE SCHEMA {args.schema}")
+    conn.commit()
+
+    app = Flask(__name__)
+    app.config.update(DB_POOL_MIN=1, DB_POOL_MAX=args.threads)
+    init_db_pool(app)
+    profile_cache.init_app(app)
+    provisioner.init_app(app)
+    try:
+        with conn.cursor() as cur:
+            cur.execute(f"SET search_path TO {args.schema}")
+        upgrade(conn)
+
+        if args.legacy:
+            results, errors = stampede(app, args, 1, legacy=True)
+            with app.app_context(), db_connection() as c, c.cursor() as cur:
+                cur.execute("SELECT count(*) AS n FROM users")
+                print(f"legacy callback: {len(errors)} failed first logins, {cur.fetchone()['n']} rows "
+                      f"for {args.accounts} accounts")
+            return
+
+        results, errors = stampede(app, args, 1)
+        problems = check(app, results, errors, expect_created=True)
+
+        # An uploaded avatar must survive the provider refreshing the profile on the next login
+        with app.app_context(), db_connection() as c, c.cursor() as cur:
+            cur.execute("UPDATE users SET picture = '/avatars/kept' WHERE google_id = 'g0'")
+            c.commit()
+        results, errors = stampede(app, args, 2)
+        problems += check(app, results, errors, expect_created=False)
+        with app.app_context(), db_connection() as c, c.cursor() as cur:
+            cur.execute("SELECT username, picture FROM users WHERE google_id IN ('g0', 'g1') ORDER BY google_id")
+            kept, refreshed = cur.fetchall()
+        if kept['picture'] != '/avatars/kept':
+            problems.append(f"uploaded avatar replaced by {kept['picture']}")
+        if not (refreshed['username'].endswith('v2') and refreshed['picture'].endswith('v2.jpg')):
+            problems.append(f"profile not refreshed: {dict(refreshed)}")
+    finally:
+        app.extensions['db_pool'].closeall()
+        with conn.cursor() as cur:
+            cur.execute(f"DROP SCHEMA IF EXISTS {args.schema} CASCADE")
+        conn.commit()
+        conn.close()
+
+    if problems:
+        print(f"\n{len(problems)} problem(s):")
+        for problem in problems[:20]:
+            print(f"  {problem}")
+        sys.exit(1)
+    print("\nOne row and one id per account; refresh kept uploaded avatars")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--dsn', default=os.getenv('DATABASE_URL'))
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--accounts', type=int, default=200, help='new accounts per provider')
+    parser.add_argument('--schema', default='provisioning_check')
+    parser.add_argument('--legacy', action='store_true', help='run the old SELECT-then-INSERT callback instead')
+    main(parser.parse_args())
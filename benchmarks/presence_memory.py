@@ -0,0 +1,87 @@
+"""Presence index: memory at N tracked users, heartbeat cost, coalescing and contacts lookups.
+
+No database is needed: the flush thread is parked and contacts are put in the cache directly.
+It compares the array index with the obvious dict {user_id: (last_seen, away)} and exits
+non-zero if the index is over --budget-mb.
+
+    python benchmarks/presence_memory.py --users 100000 --heartbeats 1000000 --budget-mb 1
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tracemalloc
+from array import array
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from flask import Flask
+from app.extensions.presence import Presence
+
+
+def measure(build):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    obj = build()
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return obj, used
+
+
+def main(args):
+    app = Flask(__name__)
+    app.config['PRESENCE_FLUSH_INTERVAL'] = 1e9  # never wakes up during the run
+    presence = Presence(app)
+    rng = random.Random(1)
+    now = int(time.time())
+
+    def fill_index():
+        for user_id in range(1, args.users + 1):
+            presence.heartbeat(user_id, away=user_id % 5 == 0, now=now - rng.randrange(600))
+        presence._dirty.clear()  # count the index alone, not the set waiting for the flush
+        return presence
+
+    def fill_dict():
+        index = {}
+        for user_id in range(1, args.users + 1):
+            index[user_id] = (float(now - rng.randrange(600)), user_id % 5 == 0)
+        return index
+
+    _, index_bytes = measure(fill_index)
+    _, dict_bytes = measure(fill_dict)
+    print(f"tracked users          {args.users:>12,}")
+    print(f"array index            {index_bytes / 2 ** 20:>11.2f} MiB  ({index_bytes / args.users:.1f} B/user)")
+    print(f"dict index             {dict_bytes / 2 ** 20:>11.2f} MiB  ({dict_bytes / args.users:.1f} B/user)")
+
+    ids = [rng.randrange(1, args.users + 1) for _ in range(args.heartbeats)]
+    start = time.perf_counter()
+    for user_id in ids:
+        presence.heartbeat(user_id)
+    elapsed = time.perf_counter() - start
+    print(f"heartbeats             {args.heartbeats:>12,}  {elapsed / args.heartbeats * 1e6:.2f} us each")
+    print(f"rows at next flush     {len(presence._dirty):>12,}  ({args.heartbeats / len(presence._dirty):.1f} heartbeats per row)")
+
+    for size in (50, 500, 5000):
+        contacts = array('I', rng.sample(range(1, args.users + 1), size))
+        presence._contacts.set(-size, contacts)
+        start = time.perf_counter()
+        for _ in range(args.lookups):
+            status = presence.contacts_status(-size)
+        per_call = (time.perf_counter() - start) / args.lookups
+        print(f"contacts_status({size:>4})  {per_call * 1e6:>10.1f} us   "
+              f"online={len(status['online'])} away={len(status['away'])}")
+
+    presence._dirty.clear()  # nothing to flush at exit: there is no database
+    if index_bytes > args.budget_mb * 2 ** 20:
+        print(f"[!] index uses {index_bytes / 2 ** 20:.2f} MiB, budget {args.budget_mb} MiB")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--heartbeats', type=int, default=1000000)
+    parser.add_argument('--lookups', type=int, default=200)
+    parser.add_argument('--budget-mb', type=float, default=1.0)
+    main(parser.parse_args())
@@ -0,0 +1,52 @@
+"""Read receipts: cost of mark_read() and how many rows a flush writes for a scrolling workload.
+
+No database is needed: the flush thread is parked. --users readers each scroll through --messages
+messages of one of --rooms conversations and send a receipt per message seen, the worst case for
+a client without its own debounce. It reports the cost per receipt and the rows the next flush
+would write (one per user and room) against one UPDATE per receipt.
+
+    python benchmarks/read_receipts.py --users 2000 --rooms 200 --messages 100
+"""
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from flask import Flask
+from app.extensions.read_state import ReadState
+
+
+def main(args):
+    app = Flask(__name__)
+    app.config['READ_STATE_FLUSH_INTERVAL'] = 1e9  # never wakes up during the run
+    state = ReadState(app)
+    rng = random.Random(1)
+
+    receipts = []
+    for user_id in range(1, args.users + 1):
+        room = rng.randrange(1, args.rooms + 1)
+        start = rng.randrange(1, 10 ** 6)
+        receipts.extend((user_id, room, start + i) for i in range(args.messages))
+    rng.shuffle(receipts)  # readers interleave
+
+    begin = time.perf_counter()
+    for user_id, room, message_id in receipts:
+        state.mark_read(user_id, room, message_id)
+    elapsed = time.perf_counter() - begin
+    pending = state.stats()['pending']
+    print(f"receipts               {len(receipts):>10,}  {elapsed / len(receipts) * 1e6:.2f} us each")
+    print(f"rows at next flush     {pending:>10,}  ({len(receipts) / pending:.0f} receipts per row)")
+    print(f"writes undebounced     {len(receipts):>10,}")
+
+    state._pending.clear()  # nothing to flush at exit: there is no database
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--rooms', type=int, default=200)
+    parser.add_argument('--messages', type=int, default=100, help='messages each user scrolls past')
+    main(parser.parse_args())
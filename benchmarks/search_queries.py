@@ -0,0 +1,200 @@
+"""Search latency over a seeded corpus: username autocomplete (prefix, fuzzy, cached) and message full-text.
+
+Seeds a scratch database (on --dsn, or a throwaway initdb cluster as in load_suite.py) through the
+real migrations. It loads --users verified users with generated names and --conversations
+conversations of 2-8 members. It adds --messages messages whose words are drawn Zipf-style from a
+--vocabulary word list, so a few words are very common and most are rare. It then times the
+queries app/extensions/search.py runs:
+
+  prefix     1-4 character prefixes of real names, database path (no cache)
+  fuzzy      real names with two letters swapped, prefix + pg_trgm top-up
+  cached     autocomplete traffic, Zipf over --hot-queries prefixes, through the LRU
+  msg-common one frequent word (top 50) in a member's conversations
+  msg-rare   one infrequent word
+  msg-two    two words, both must match
+
+Reports p50/p95/p99 per class (--plans adds EXPLAIN ANALYZE of one query per database class).
+Exits 1 if a class's p95 is over --budget-ms.
+
+    python benchmarks/search_queries.py --dsn postgresql://localhost/postgres --messages 1000000 --budget-ms 10
+"""
+import io
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import itertools
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import psycopg2
+from flask import Flask
+from load_suite import Database
+from app.extensions.migrations import upgrade
+
+FIRST = ['ana', 'mark', 'vincent', 'maria', 'jose', 'juan', 'carlo', 'angel', 'john', 'paolo', 'kim',
+         'joy', 'mae', 'rey', 'jay', 'liza', 'nico', 'bea', 'miguel', 'andrea', 'alice', 'alina', 'bryan',
+         'chris', 'diane', 'elena', 'franz', 'gab', 'hazel', 'ivan', 'jessa', 'kyle', 'lance', 'mika']
+LAST = ['santos', 'reyes', 'cruz', 'bautista', 'garcia', 'mendoza', 'torres', 'flores', 'ramos', 'buison',
+        'villanueva', 'dela cruz', 'aquino', 'castillo', 'rivera', 'navarro', 'lim', 'tan', 'gomez']
+
+
+def pct(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def copy_rows(cur, table, columns, rows):
+    buf = io.StringIO()
+    for row in rows:
+        buf.write('\t'.join(str(v).replace('\\', '\\\\').replace('\t', ' ').replace('\n', ' ') for v in row))
+        buf.write('\n')
+    buf.seek(0)
+    cur.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN", buf)
+
+
+#─── corpus ─────────────────────────────────────────────────────────────────────────────────────────────────────────
+def seed(dsn, args, rng):
+    vocabulary = [''.join(rng.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(rng.randint(3, 9)))
+                  for _ in range(args.vocabulary)]
+    weights = list(itertools.accumulate(1 / rank for rank in range(1, args.vocabulary + 1)))
+    names = [f"{rng.choice(FIRST)} {rng.choice(LAST)}{rng.randrange(1000) if rng.random() < 0.6 else ''}".title()
+             for _ in range(args.users)]
+
+    conn = psycopg2.connect(dsn)
+    upgrade(conn)
+    start = time.perf_counter()
+    with conn.cursor() as cur:
+        copy_rows(cur, 'users', ('username', 'is_verified', 'picture'),
+                  ((name, 't', 'background/bp1.png') for name in names))
+        copy_rows(cur, 'conversations', ('name', 'is_group', 'created_by'),
+                  ((f"room {i}", 't', 1) for i in range(args.conversations)))
+        cur.execute("SELECT min(id) FROM conversations")
+        first_room = cur.fetchone()[0]
+        members = {}
+        for room in range(first_room, first_room + args.conversations):
+            members[room] = rng.sample(range(1, args.chat_users + 1), rng.randint(2, 8))
+        copy_rows(cur, 'conversation_members', ('conversation_id', 'user_id'),
+                  ((room, user) for room, users in members.items() for user in users))
+        # Rooms get Zipf-ish traffic too: a few busy group chats, a long tail of quiet ones
+        room_weights = list(itertools.accumulate(1 / (i + 1) ** 0.8 for i in range(args.conversations)))
+
+        def messages():
+            for _ in range(args.messages):
+                room = first_room + rng.choices(range(args.conversations), cum_weights=room_weights)[0]
+                words = rng.choices(vocabulary, cum_weights=weights, k=rng.randint(3, 15))
+                yield room, rng.choice(members[room]), ' '.join(words)
+
+        copy_rows(cur, 'messages', ('conversation_id', 'sender_id', 'body'), messages())
+        cur.execute("ANALYZE")
+    conn.commit()
+    conn.close()
+    print(f"seeded {args.users:,} users, {args.conversations:,} conversations, {args.messages:,} messages "
+          f"in {time.perf_counter() - start:.0f} s")
+    return vocabulary, names, members
+
+
+#─── queries ────────────────────────────────────────────────────────────────────────────────────────────────────────
+def timed(fn, cases):
+    times = []
+    for case in cases:
+        start = time.perf_counter()
+        fn(*case)
+        times.append((time.perf_counter() - start) * 1e3)
+    return times
+
+
+def explain(dsn, sql, params):
+    conn = psycopg2.connect(dsn)
+    with conn.cursor() as cur:
+        cur.execute("EXPLAIN (ANALYZE, BUFFERS, COSTS OFF) " + sql, params)
+        plan = '\n'.join('    ' + row[0] for row in cur.fetchall())
+    conn.close()
+    return plan
+
+
+def main(args):
+    from app.routes.postgresql import init_db_pool
+    from app.extensions.search import Search, PREFIX_SQL, FUZZY_SQL, MESSAGES_SQL, _like_prefix
+
+    rng = random.Random(args.seed)
+    db = Database(args.dsn, tempfile.mkdtemp(prefix='chatmekol_search_'))
+    try:
+        vocabulary, names, members = seed(db.dsn, args, rng)
+        os.environ['DATABASE_URL'] = db.url
+        app = Flask(__name__)
+        app.config['DB_POOL_MAX'] = 2
+        init_db_pool(app)
+        search = Search(app)
+
+        lowered = [n.lower() for n in names]
+        prefixes = [(name[:rng.randint(1, 4)],) for name in rng.sample(lowered, args.queries)]
+        typos = []
+        for name in rng.sample([n for n in lowered if len(n) >= 6], args.queries):
+            i = rng.randrange(1, len(name) - 2)
+            typos.append((name[:i] + name[i + 1] + name[i] + name[i + 2:],))
+        hot = list(dict.fromkeys(name[:rng.randint(1, 3)] for name in lowered[:args.hot_queries * 3]))[:args.hot_queries]
+        hot_weights = list(itertools.accumulate(1 / rank for rank in range(1, len(hot) + 1)))
+        traffic = [(q,) for q in rng.choices(hot, cum_weights=hot_weights, k=args.queries * 5)]
+
+        searchers = rng.choices(sorted({user for users in members.values() for user in users}), k=args.queries)
+        common, rare = vocabulary[:50], vocabulary[len(vocabulary) // 10:]
+        msg_common = [(u, rng.choice(common)) for u in searchers]
+        msg_rare = [(u, rng.choice(rare)) for u in searchers]
+        msg_two = [(u, f"{rng.choice(vocabulary[:500])} {rng.choice(vocabulary[:2000])}") for u in searchers]
+
+        for fn, cases in ((search.find_users, prefixes[:50]), (search.messages, msg_common[:50])):
+            timed(fn, cases)  # warm the buffer cache and the pool
+
+        results = {
+            'prefix': timed(search.find_users, prefixes),
+            'fuzzy': timed(search.find_users, typos),
+            'cached': timed(search.users, traffic),
+            'msg-common': timed(search.messages, msg_common),
+            'msg-rare': timed(search.messages, msg_rare),
+            'msg-two': timed(search.messages, msg_two),
+        }
+        over = []
+        print(f"{'class':<12}{'queries':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+        for name, times in results.items():
+            p95 = pct(times, 0.95)
+            print(f"{name:<12}{len(times):>9}{pct(times, 0.5):>10.2f}{p95:>10.2f}{pct(times, 0.99):>10.2f}"
+                  + ('  <- over budget' if p95 > args.budget_ms else ''))
+            if p95 > args.budget_ms:
+                over.append(name)
+        stats = search.stats()
+        print(f"prefix cache: {stats['prefix_hits'] / max(1, stats['prefix_hits'] + stats['prefix_misses']):.1%} hits, "
+              f"{stats['prefix_cached']} entries")
+
+        if args.plans:
+            q = prefixes[0][0]
+            print("\nprefix plan:\n" + explain(db.dsn, PREFIX_SQL, (_like_prefix(q), 20)))
+            q = typos[0][0]
+            print("\nfuzzy plan:\n" + explain(db.dsn, FUZZY_SQL, (q, _like_prefix(q), q, 20)))
+            user, q = msg_common[0]
+            print("\nmessage plan:\n" + explain(db.dsn, MESSAGES_SQL,
+                                                {'user_id': user, 'room': None, 'q': q, 'before': 2 ** 63 - 1,
+                                                 'limit': 20}))
+        if over:
+            print(f"[!] p95 over {args.budget_ms} ms: {', '.join(over)}")
+            sys.exit(1)
+    finally:
+        db.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--dsn', help='PostgreSQL to create the scratch database on (default: initdb)')
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--chat-users', type=int, default=20000, help='users who are in conversations')
+    parser.add_argument('--conversations', type=int, default=20000)
+    parser.add_argument('--messages', type=int, default=1000000)
+    parser.add_argument('--vocabulary', type=int, default=20000)
+    parser.add_argument('--queries', type=int, default=1000, help='queries per class')
+    parser.add_argument('--hot-queries', type=int, default=200, help='distinct prefixes in the cached traffic')
+    parser.add_argument('--budget-ms', type=float, default=10.0, help='p95 limit per class')
+    parser.add_argument('--plans', action='store_true', help='print EXPLAIN ANALYZE for one query per class')
+    parser.add_argument('--seed', type=int, default=1)
+    main(parser.parse_args())
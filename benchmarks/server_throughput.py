@@ -0,0 +1,142 @@
+"""Throughput of the Werkzeug dev server vs the gunicorn production mode on /, /login and /dashboard.
+
+Starts run.py once per mode (FLASK_ENV=development for the dev server, plain `python run.py` for
+gunicorn) on a free port without TLS, then drives each path from several client processes over
+keep-alive connections and reports requests/s and p50/p99 latency. /dashboard is requested with a
+signed session cookie so the page itself is rendered, not the login redirect. Without a reachable
+PostgreSQL, /login and /dashboard measure their database-error paths.
+
+    python benchmarks/server_throughput.py --duration 10 --clients 4 --threads 8
+"""
+import os
+import sys
+import time
+import socket
+import argparse
+import threading
+import subprocess
+import http.client
+import multiprocessing
+from urllib.parse import urlencode
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from flask import Flask
+from flask.sessions import SecureCookieSessionInterface
+
+SECRET = 'bench-secret'
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def session_cookie():
+    app = Flask(__name__)
+    app.secret_key = SECRET
+    serializer = SecureCookieSessionInterface().get_signing_serializer(app)
+    return serializer.dumps({'google_id': 'bench', 'name': 'Bench', 'email': 'bench@example.com', 'picture': ''})
+
+
+def start_server(mode, port, workers, threads):
+    env = dict(os.environ, PORT=str(port), LOCAL_TLS='false', SECRET_KEY=SECRET, CHAT_ENABLED='false', SESSION_BACKEND='cookie',
+               WEB_CONCURRENCY=str(workers), GUNICORN_THREADS=str(threads), GUNICORN_LOG_LEVEL='warning',
+               MAIL_QUEUE_ASYNC='true', BCRYPT_ROUNDS='10')
+    env['FLASK_ENV'] = 'development' if mode == 'dev' else 'production'
+    proc = subprocess.Popen([sys.executable, 'run.py'], cwd=ROOT, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            conn.request('GET', '/')
+            conn.getresponse().read()
+            return proc
+        except OSError:
+            time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError(f"{mode} server did not come up on port {port}")
+
+
+def client(port, method, path, body, headers, threads, duration, results):
+    latencies = []
+    lock = threading.Lock()
+    stop_at = time.monotonic() + duration
+
+    def loop():
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        local = []
+        while time.monotonic() < stop_at:
+            start = time.perf_counter()
+            try:
+                conn.request(method, path, body=body, headers=headers)
+                response = conn.getresponse()
+                response.read()
+                if response.getheader('Connection', '').lower() == 'close':
+                    conn.close()
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                continue
+            local.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(local)
+
+    workers = [threading.Thread(target=loop) for _ in range(threads)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    results.put(latencies)
+
+
+def drive(port, method, path, body, headers, args):
+    results = multiprocessing.Queue()
+    procs = [multiprocessing.Process(target=client, args=(port, method, path, body, headers,
+                                                          args.threads, args.duration, results))
+             for _ in range(args.clients)]
+    for p in procs:
+        p.start()
+    latencies = []
+    for _ in procs:
+        latencies.extend(results.get())
+    for p in procs:
+        p.join()
+    latencies.sort()
+    if not latencies:
+        return 0.0, 0.0, 0.0
+    pick = lambda q: latencies[min(len(latencies) - 1, int(len(latencies) * q))] * 1000
+    return len(latencies) / args.duration, pick(0.50), pick(0.99)
+
+
+def main(args):
+    cookie = {'Cookie': f'session={session_cookie()}'}
+    form = urlencode({'username': 'benchuser', 'password': 'not-the-password'})
+    cases = [
+        ('/', 'GET', '/', None, {}),
+        ('/login', 'POST', '/login', form, {'Content-Type': 'application/x-www-form-urlencoded'}),
+        ('/dashboard', 'GET', '/dashboard', None, cookie),
+    ]
+    for mode in args.modes:
+        port = free_port()
+        proc = start_server(mode, port, args.workers, args.server_threads)
+        try:
+            for label, method, path, body, headers in cases:
+                rps, p50, p99 = drive(port, method, path, body, headers, args)
+                print(f"{mode:>5} {label:<11} {rps:>9,.0f} req/s  p50={p50:7.2f} ms  p99={p99:7.2f} ms")
+        finally:
+            proc.terminate()
+            proc.wait(15)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--modes', nargs='+', default=['dev', 'prod'], choices=['dev', 'prod'])
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--clients', type=int, default=4, help='client processes')
+    parser.add_argument('--threads', type=int, default=8, help='connections per client process')
+    parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count() * 2 + 1, help='gunicorn workers')
+    parser.add_argument('--server-threads', type=int, default=4, help='gunicorn threads per worker')
+    main(parser.parse_args())
@@ -0,0 +1,129 @@
+"""Session cost per request: signed cookie vs server-side sessions.
+
+Replays a logged-in browser against two routes through the WSGI app:
+
+  /dashboardx  rewrites is_admin, is_verified and email with the values already there (as the real
+               dashboardx does)
+  /chat        only reads the session
+
+It counts the bytes of session state on the wire (Cookie request header plus Set-Cookie response
+header) and how many responses carried a Set-Cookie. It also reports the time per request spent in
+open_session + save_session. The memory backend measures the LRU path; --redis URL adds a
+Redis-compatible store behind it.
+
+    python benchmarks/session_overhead.py --requests 20000 [--redis redis://localhost:6379/0]
+"""
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from flask import Flask, session
+from flask.sessions import SecureCookieSessionInterface
+from werkzeug.test import create_environ
+from app.extensions.sessions import ServerSessions
+
+PROFILE = {
+    'google_id': '109876543210987654321',
+    'name': 'Mark Vincent Buison',
+    'email': 'mark.vincent@example.com',
+    'picture': 'https://lh3.googleusercontent.com/a/ACg8ocKx3Yb2mZp1Qw7Rt9Uv5Xs4Hn6Jk8Lm0Np2Qr4St6Uv8Wx=s96-c',
+    'user_id': 184467,
+    'username': 'markvince',
+    'is_admin': False,
+    'is_verified': True,
+}
+
+
+def make_app(backend, redis_url=None):
+    app = Flask(__name__)
+    app.config.update(SECRET_KEY='bench', SESSION_BACKEND=backend, SESSION_REDIS_URL=redis_url)
+    ServerSessions(app)
+    if backend == 'cookie':
+        app.session_interface = SecureCookieSessionInterface()  # own instance; the class default is shared
+    timings = []
+    interface = app.session_interface
+    open_session, save_session = interface.open_session, interface.save_session
+
+    def timed_open(*args):
+        start = time.perf_counter()
+        try:
+            return open_session(*args)
+        finally:
+            timings.append(time.perf_counter() - start)
+
+    def timed_save(*args):
+        start = time.perf_counter()
+        try:
+            return save_session(*args)
+        finally:
+            timings[-1] += time.perf_counter() - start
+
+    interface.open_session, interface.save_session = timed_open, timed_save
+
+    @app.route('/login')
+    def login():
+        session.update(PROFILE)
+        return 'ok'
+
+    @app.route('/dashboardx')
+    def dashboardx():
+        session['is_admin'] = session['is_admin']
+        session['is_verified'] = session['is_verified']
+        session['email'] = session['email']
+        return 'dashboard'
+
+    @app.route('/chat')
+    def chat():
+        return session['username']
+
+    return app, timings
+
+
+def request(app, path, cookie):
+    headers = {'Cookie': f"session={cookie}"} if cookie else {}
+    environ = create_environ(path, headers=headers)
+    captured = {}
+
+    def start_response(status, response_headers):
+        captured['headers'] = response_headers
+    for _ in app(environ, start_response):
+        pass
+    set_cookie = [v for k, v in captured['headers'] if k == 'Set-Cookie']
+    return set_cookie[0] if set_cookie else None
+
+
+def run(app, timings, n):
+    cookie = request(app, '/login', None).split(';', 1)[0].split('=', 1)[1]
+    del timings[:]
+    wire = set_cookies = 0
+    for i in range(n):
+        wire += len('Cookie: session=') + len(cookie)
+        header = request(app, '/dashboardx' if i % 2 else '/chat', cookie)
+        if header:
+            set_cookies += 1
+            wire += len('Set-Cookie: ') + len(header)
+            cookie = header.split(';', 1)[0].split('=', 1)[1]
+    timings.sort()
+    return wire / n, set_cookies, sum(timings) / n, timings[int(0.99 * (n - 1))]
+
+
+def main(args):
+    backends = [('cookie', None), ('memory', None)]
+    if args.redis:
+        backends.append(('redis', args.redis))
+    print(f"{'backend':<8} {'session bytes/req':>18} {'Set-Cookie':>11} {'mean us':>8} {'p99 us':>8}")
+    for backend, url in backends:
+        app, timings = make_app(backend, url)
+        bytes_per_request, set_cookies, mean, p99 = run(app, timings, args.requests)
+        print(f"{backend:<8} {bytes_per_request:>18.0f} {set_cookies:>5}/{args.requests:<5} "
+              f"{mean * 1e6:>8.1f} {p99 * 1e6:>8.1f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=20000)
+    parser.add_argument('--redis', help='also measure a Redis-compatible store at this URL')
+    main(parser.parse_args())
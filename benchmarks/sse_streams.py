@@ -0,0 +1,179 @@
+"""Notification streams: many idle SSE connections on the asyncio listener, then fan-out, bursts and resume.
+
+The listener runs in this process; a child process opens --streams connections (one user each)
+and reports what it receives. Phases:
+
+  connect   open every stream and read the response headers
+  idle      hold them for --idle seconds: listener CPU and memory per stream
+  fan-out   one event to every user: delivery latency p50/p99
+  burst     --burst events per user for 100 users: events actually delivered per user
+  resume    drop a stream, publish 3 events, reconnect with Last-Event-ID: events replayed
+
+    python benchmarks/sse_streams.py --streams 10000 --idle 30
+"""
+import os
+import sys
+import time
+import json
+import socket
+import asyncio
+import argparse
+import statistics
+import multiprocessing
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from flask import Flask
+from app.extensions.notifications import NotificationHub
+
+
+def rss_mb():
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+#─── client process ─────────────────────────────────────────────────────────────────────────────────────────────────
+async def open_stream(port, user, received, last_event_id=None):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port, limit=2 ** 16)
+    resume = f"Last-Event-ID: {last_event_id}\r\n" if last_event_id else ''
+    writer.write(f"GET /notifications/stream HTTP/1.1\r\nHost: bench\r\nX-User: {user}\r\n{resume}\r\n".encode())
+    head = await reader.readuntil(b'\r\n\r\n')
+    if not head.startswith(b'HTTP/1.1 200'):
+        raise ConnectionError(head.split(b'\r\n')[0].decode())
+    state = {'writer': writer, 'last_id': last_event_id}
+
+    async def read_events():
+        try:
+            while True:
+                block = (await reader.readuntil(b'\n\n')).decode()
+                fields = dict(line.split(': ', 1) for line in block.strip().split('\n') if ': ' in line)
+                if 'event' not in fields:
+                    continue  # retry: / keep-alive comment
+                state['last_id'] = fields.get('id', state['last_id'])
+                data = json.loads(fields['data'])
+                received.append((user, fields['event'], data.get('key'), data.get('count'),
+                                 time.time() - data['ts'] if 'ts' in data else None))
+        except (asyncio.IncompleteReadError, ConnectionError, asyncio.CancelledError):
+            pass
+
+    state['task'] = asyncio.get_running_loop().create_task(read_events())
+    return state
+
+
+async def client(port, streams, pipe):
+    loop = asyncio.get_running_loop()
+    received = []
+    connections = {}
+    gate = asyncio.Semaphore(256)
+
+    async def connect(user):
+        async with gate:
+            connections[user] = await open_stream(port, user, received)
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(connect(user) for user in range(1, streams + 1)), return_exceptions=True)
+    failures = [str(r) for r in results if isinstance(r, Exception)]
+    pipe.send(('connected', time.perf_counter() - start, len(failures), failures[:3]))
+
+    while True:
+        command, *args = await loop.run_in_executor(None, pipe.recv)
+        if command == 'collect':
+            await asyncio.sleep(args[0])
+            pipe.send(list(received))
+            received.clear()
+        elif command == 'drop':
+            state = connections.pop(args[0])
+            state['writer'].close()
+            state['task'].cancel()
+            pipe.send(state['last_id'])
+        elif command == 'resume':
+            user, last_id = args
+            connections[user] = await open_stream(port, user, received, last_event_id=last_id)
+            pipe.send('ok')
+        else:
+            break
+    for state in connections.values():
+        state['writer'].close()
+
+
+def client_main(port, streams, pipe):
+    asyncio.run(client(port, streams, pipe))
+
+
+#─── driver ─────────────────────────────────────────────────────────────────────────────────────────────────────────
+def main(args):
+    app = Flask(__name__)
+    port = free_port()
+    app.config.update(NOTIFY_SSE_HOST='127.0.0.1', NOTIFY_SSE_PORT=port, NOTIFY_KEEPALIVE=args.keepalive,
+                      NOTIFY_COALESCE_DELAY=args.delay, NOTIFY_SSE_AUTOSTART=False)
+    hub = NotificationHub(app)
+    hub.authenticate = lambda headers: int(headers['x-user'])  # no sessions or database here
+    rss_before = rss_mb()
+    hub.start()
+
+    pipe, child_pipe = multiprocessing.Pipe()
+    child = multiprocessing.Process(target=client_main, args=(port, args.streams, child_pipe), daemon=True)
+    child.start()
+    _, connect_s, failures, sample = pipe.recv()
+    print(f"connect   {args.streams - failures:>6} streams open in {connect_s:.1f} s"
+          + (f"  ({failures} failed, e.g. {sample})" if failures else ''))
+
+    time.sleep(1)
+    cpu_before, wall_before = time.process_time(), time.perf_counter()
+    time.sleep(args.idle)
+    cpu = time.process_time() - cpu_before
+    wall = time.perf_counter() - wall_before
+    rss = rss_mb() - rss_before
+    print(f"idle      listener CPU {cpu / wall * 100:.2f}% over {wall:.0f} s, "
+          f"RSS +{rss:.0f} MiB ({rss * 1024 / args.streams:.1f} KiB per stream), streams={hub.stats()['streams']}")
+
+    for user in range(1, args.streams + 1):
+        hub.publish(user, 'message', key='fanout', data={'room': 0})
+    pipe.send(('collect', args.delay + 3))
+    latencies = sorted(r[4] for r in pipe.recv() if r[2] == 'fanout')
+    if latencies:
+        print(f"fan-out   {len(latencies)} delivered, p50={statistics.median(latencies) * 1e3:.0f} ms "
+              f"p99={latencies[int(len(latencies) * 0.99) - 1] * 1e3:.0f} ms (includes the {args.delay} s coalesce delay)")
+
+    for user in range(1, 101):
+        for _ in range(args.burst):
+            hub.publish(user, 'message', key='burst', data={'room': 1})
+    pipe.send(('collect', args.delay + 2))
+    burst = [r for r in pipe.recv() if r[2] == 'burst']
+    counts = [r[3] for r in burst]
+    print(f"burst     {args.burst} events x 100 users -> {len(burst)} delivered "
+          f"({len(burst) / 100:.2f} per user, final count {max(counts) if counts else 0})")
+
+    pipe.send(('drop', 1))
+    last_id = pipe.recv()
+    time.sleep(0.2)
+    for _ in range(3):
+        hub.publish(1, 'message', key='missed', data={'room': 2})
+    pipe.send(('resume', 1, last_id))
+    pipe.recv()
+    pipe.send(('collect', args.delay + 1))
+    replayed = [r for r in pipe.recv() if r[0] == 1]
+    print(f"resume    Last-Event-ID {last_id} -> {len(replayed)} event(s) replayed: "
+          + ', '.join(f"{r[2]} x{r[3]}" for r in replayed))
+
+    pipe.send(('quit',))
+    child.join(10)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--streams', type=int, default=10000)
+    parser.add_argument('--idle', type=float, default=30, help='seconds to hold the streams idle')
+    parser.add_argument('--keepalive', type=float, default=25)
+    parser.add_argument('--delay', type=float, default=0.5, help='NOTIFY_COALESCE_DELAY')
+    parser.add_argument('--burst', type=int, default=5)
+    main(parser.parse_args())
@@ -0,0 +1,101 @@
+"""Cold start: import time of the app and create_app(), against a budget.
+
+Each run is a fresh interpreter, as on a Render spin-up. It reports:
+
+  import      `import app.__bridge__` as measured by python -X importtime (median over --runs)
+  create_app  create_app() itself, with a fixed bcrypt cost and the chat gateway off (median)
+  top         the slowest top-level packages by cumulative import time, from the median run
+
+It exits non-zero if either median is over its budget, or if a module that should only load on
+first use (provider SDKs, requests, dotenv) is imported by create_app().
+
+    python benchmarks/startup_time.py --runs 7 --import-budget-ms 300 --create-budget-ms 150
+"""
+import os
+import re
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+from collections import defaultdict
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+# Loaded by the routes that need them (Google/Facebook login) or by the entry point (.env), never at startup
+LAZY_MODULES = ('requests', 'google.auth', 'google.oauth2', 'google_auth_oauthlib', 'oauthlib',
+                'requests_oauthlib', 'flask_dance', 'dotenv')
+
+PROBE = """
+import sys, time, json
+from app.__bridge__ import create_app
+imported = time.perf_counter()
+create_app()
+done = time.perf_counter()
+print(json.dumps({'create_app': done - imported,
+                  'eager': [m for m in %r if m in sys.modules]}))
+""" % (LAZY_MODULES,)
+
+LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+
+
+def run_once():
+    env = dict(os.environ, BCRYPT_ROUNDS='10', CHAT_ENABLED='false')
+    env.pop('DOTENV_LOADED', None)
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', PROBE], cwd=ROOT, env=env,
+                          capture_output=True, text=True, timeout=120)
+    if proc.returncode:
+        sys.exit(f"probe failed:\n{proc.stderr[-2000:]}")
+    imports = {}
+    packages = defaultdict(int)
+    children = defaultdict(list)  # depth -> modules waiting for their parent (importtime prints parents last)
+    for line in proc.stderr.splitlines():
+        match = LINE.match(line)
+        if not match:
+            continue
+        cumulative, depth, module = int(match.group(2)), (len(match.group(3)) - 1) // 2, match.group(4)
+        imports[module] = cumulative
+        if module.startswith('app.'):
+            # What the app's own modules pull in, grouped by top-level package
+            for child, child_us in children[depth + 1]:
+                if not child.startswith('app.'):
+                    packages[child.split('.')[0]] += child_us
+        children.pop(depth + 1, None)
+        children[depth].append((module, cumulative))
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    return {'import': imports['app.__bridge__'] / 1e6, 'create_app': result['create_app'],
+            'eager': result['eager'], 'packages': packages}
+
+
+def main(args):
+    runs = [run_once() for _ in range(args.runs)]
+    import_s = statistics.median(r['import'] for r in runs)
+    create_s = statistics.median(r['create_app'] for r in runs)
+    typical = min(runs, key=lambda r: abs(r['import'] - import_s))
+
+    print(f"{'import app.__bridge__':<26} {import_s * 1e3:>8.1f} ms   (budget {args.import_budget_ms} ms)")
+    print(f"{'create_app()':<26} {create_s * 1e3:>8.1f} ms   (budget {args.create_budget_ms} ms)")
+    print(f"\nslowest top-level imports (cumulative):")
+    for package, us in sorted(typical['packages'].items(), key=lambda kv: -kv[1])[:args.top]:
+        print(f"  {package:<24} {us / 1e3:>8.1f} ms")
+
+    failures = []
+    if import_s * 1e3 > args.import_budget_ms:
+        failures.append(f"import {import_s * 1e3:.1f} ms > {args.import_budget_ms} ms")
+    if create_s * 1e3 > args.create_budget_ms:
+        failures.append(f"create_app {create_s * 1e3:.1f} ms > {args.create_budget_ms} ms")
+    eager = sorted(set().union(*(r['eager'] for r in runs)))
+    if eager:
+        failures.append(f"imported at startup but should load on first use: {', '.join(eager)}")
+    for failure in failures:
+        print(f"[!] {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=7)
+    parser.add_argument('--top', type=int, default=12, help='top-level packages to list')
+    parser.add_argument('--import-budget-ms', type=float, default=300)
+    parser.add_argument('--create-budget-ms', type=float, default=150)
+    main(parser.parse_args())
@@ -0,0 +1,97 @@
+"""Per-template cost: cold compile with and without the bytecode cache, render with and without fragments.
+
+For each page template it reports:
+
+  compile   parse + compile in a fresh Environment, as a cold worker does on its first request
+  bytecode  the same, loading from a warm FileSystemBytecodeCache instead
+  render    one render in a request context, without the fragment cache and then with it warm
+  size      rendered bytes, and after brotli/gzip at the response-compression settings
+
+    python benchmarks/template_render.py --renders 2000
+"""
+import os
+import sys
+import gzip
+import time
+import shutil
+import argparse
+import tempfile
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+import brotli
+from flask import Flask, render_template
+from jinja2 import Environment, FileSystemBytecodeCache
+from app.routes.routes import routes
+from app.extensions.assets import AssetPipeline
+from app.extensions.templating import Templating, FragmentCache
+
+CONTEXTS = {
+    'index.html': {},
+    'user_dashboard.html': {'name': 'Mark Vincent', 'email': 'mark@example.com', 'is_verified': False,
+                            'picture': 'https://lh3.googleusercontent.com/a/example=s96-c',
+                            'profile_picture': 'background/bp1.png'},
+    'admin_dashboard.html': {'username': 'admin', 'email': 'admin@example.com', 'is_verified': True},
+    'reset_password.html': {'token': 'x' * 80},
+}
+
+
+def make_app(cache_dir):
+    app = Flask(__name__, template_folder=os.path.join(ROOT, 'app', 'templates'),
+                static_folder=os.path.join(ROOT, 'app', 'static'))
+    app.config.update(SECRET_KEY='bench', ASSETS_AUTO_BUILD=False, TEMPLATE_BYTECODE_CACHE=cache_dir)
+    app.register_blueprint(routes)
+    AssetPipeline(app)
+    Templating(app)
+    return app
+
+
+def cold_load(app, name, cache_dir, repeat):
+    """Mean seconds for a fresh Environment to produce the template, optionally from the bytecode cache."""
+    total = 0.0
+    for _ in range(repeat):
+        env = Environment(loader=app.jinja_env.loader, extensions=[FragmentCache],
+                          bytecode_cache=FileSystemBytecodeCache(cache_dir) if cache_dir else None)
+        start = time.perf_counter()
+        env.get_template(name)
+        total += time.perf_counter() - start
+    return total / repeat
+
+
+def render_time(app, name, context, renders):
+    with app.test_request_context('/'):
+        render_template(name, **context)  # warm the fragment cache (if enabled) and url_for
+        start = time.perf_counter()
+        for _ in range(renders):
+            html = render_template(name, **context)
+        return (time.perf_counter() - start) / renders, html.encode()
+
+
+def main(args):
+    cache_dir = tempfile.mkdtemp(prefix='jinja-bytecode-')
+    try:
+        app = make_app(cache_dir)  # preloading fills the bytecode cache
+        fragments = app.jinja_env.fragment_cache
+        print(f"{'template':<22} {'compile ms':>10} {'bytecode ms':>11} {'render us':>10} {'+fragments':>10} "
+              f"{'bytes':>7} {'br':>6} {'gzip':>6}")
+        for name, context in CONTEXTS.items():
+            compile_s = cold_load(app, name, None, args.repeat)
+            bytecode_s = cold_load(app, name, cache_dir, args.repeat)
+            app.jinja_env.fragment_cache = None
+            plain_s, html = render_time(app, name, context, args.renders)
+            app.jinja_env.fragment_cache = fragments
+            cached_s, _ = render_time(app, name, context, args.renders)
+            br = len(brotli.compress(html, quality=app.config['TEMPLATE_BROTLI_QUALITY']))
+            gz = len(gzip.compress(html, compresslevel=app.config['TEMPLATE_GZIP_LEVEL']))
+            print(f"{name:<22} {compile_s * 1e3:>10.2f} {bytecode_s * 1e3:>11.2f} {plain_s * 1e6:>10.1f} "
+                  f"{cached_s * 1e6:>10.1f} {len(html):>7} {br:>6} {gz:>6}")
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--renders', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=20, help='fresh environments per cold-load measurement')
+    main(parser.parse_args())
@@ -0,0 +1,116 @@
+"""EXPLAIN check: no route query may sequentially scan a seeded table of a million users.
+
+Creates a scratch schema, applies app/migrations there, seeds --users rows (a third of them Google
+accounts, a tenth Facebook), runs ANALYZE, then EXPLAINs every users lookup the routes, the profile
+cache and the chat gateway issue. It prints the access path for each and exits 1 if any plan
+contains a Seq Scan on users. UPDATEs and upserts are only EXPLAINed, never executed.
+
+    DATABASE_URL=postgresql://localhost/chatmekol python benchmarks/users_query_plans.py --users 1000000
+"""
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import psycopg2
+from app.extensions.migrations import upgrade
+from app.extensions.profile_cache import PROFILE_COLUMNS
+from app.extensions.provisioning import provisioner
+
+# (label, SQL exactly as issued by the app, sample parameters for a seeded row)
+QUERIES = [
+    ('login', "SELECT id, username, password, is_admin FROM users WHERE username = %s AND password IS NOT NULL",
+     ('user1',)),
+    ('signup exists', "SELECT 1 FROM users WHERE (username = %s AND password IS NOT NULL) OR email_address = %s",
+     ('user1', 'user1@example.com')),
+    ('google upsert', provisioner._statements['google'],
+     {'subject': 'g3', 'name': 'n', 'email': 'e', 'picture': None, 'verified': True}),
+    ('facebook upsert', provisioner._statements['facebook'],
+     {'subject': 'f10', 'name': 'n', 'email': 'e', 'picture': None, 'verified': False}),
+    ('profile by id', f"SELECT {PROFILE_COLUMNS} FROM users WHERE id = %s", (1,)),
+    ('profile by email', f"SELECT {PROFILE_COLUMNS} FROM users WHERE email_address = %s", ('user1@example.com',)),
+    ('forgot password', "SELECT id, email_address, username FROM users WHERE email_address = %s",
+     ('user1@example.com',)),
+    ('verify by id', "UPDATE users SET is_verified = TRUE WHERE id = %s RETURNING id", (1,)),
+    ('verify by email', "UPDATE users SET is_verified = TRUE WHERE email_address = %s RETURNING id",
+     ('user1@example.com',)),
+    ('reset by id', "UPDATE users SET password = %s WHERE id = %s RETURNING id", ('x', 1)),
+    ('reset by email', "UPDATE users SET password = %s WHERE email_address = %s RETURNING id",
+     ('x', 'user1@example.com')),
+    ('set token', "UPDATE users SET verification_token = %s WHERE id = %s", ('t', 1)),
+    ('rehash', "UPDATE users SET password = %s WHERE id = %s", ('x', 1)),
+    ('avatar', "UPDATE users SET picture = %s WHERE id = %s", ('/avatars/x', 1)),
+]
+
+SEED = """
+    INSERT INTO users (username, password, email_address, is_verified, google_id, facebook_id, picture)
+    SELECT 'user' || g,
+           CASE WHEN g %% 3 = 0 THEN NULL ELSE '$2b$12$' || md5(g::text) END,
+           'user' || g || '@example.com',
+           g %% 2 = 0,
+           CASE WHEN g %% 3 = 0 THEN 'g' || g END,
+           CASE WHEN g %% 10 = 0 THEN 'f' || g END,
+           'background/bp1.png'
+    FROM generate_series(1, %s) AS g
+"""
+
+
+def walk(node):
+    yield node
+    for child in node.get('Plans', ()):
+        yield from walk(child)
+
+
+def describe(plan):
+    scans = [n for n in walk(plan) if n.get('Relation Name') == 'users' or 'Index Name' in n]
+    return ', '.join(f"{n['Node Type']}" + (f" using {n['Index Name']}" if 'Index Name' in n else '')
+                     for n in scans) or plan['Node Type']
+
+
+def main(args):
+    conn = psycopg2.connect(args.dsn)
+    with conn.cursor() as cur:
+        cur.execute(f"DROP SCHEMA IF EXISTS {args.schema} CASCADE")
+        cur.execute(f"CREATE SCHEMA {args.schema}")
+        cur.execute(f"SET search_path TO {args.schema}")
+    conn.commit()
+    try:
+        upgrade(conn)
+        start = time.perf_counter()
+        with conn.cursor() as cur:
+            cur.execute(SEED, (args.users,))
+            cur.execute("ANALYZE users")
+        conn.commit()
+        print(f"Seeded {args.users:,} users in {time.perf_counter() - start:.1f}s\n")
+
+        failures = 0
+        with conn.cursor() as cur:
+            for label, sql, params in QUERIES:
+                cur.execute("EXPLAIN (FORMAT JSON) " + sql, params)
+                plan = cur.fetchone()[0][0]['Plan']
+                seq = [n for n in walk(plan) if n['Node Type'] == 'Seq Scan' and n.get('Relation Name') == 'users']
+                failures += bool(seq)
+                print(f"{'FAIL' if seq else 'ok':>4}  {label:<18} {describe(plan):<60} cost={plan['Total Cost']:.1f}")
+        conn.rollback()
+    finally:
+        if not args.keep:
+            with conn.cursor() as cur:
+                cur.execute(f"DROP SCHEMA IF EXISTS {args.schema} CASCADE")
+            conn.commit()
+        conn.close()
+
+    if failures:
+        print(f"\n{failures} quer{'y' if failures == 1 else 'ies'} sequentially scan users")
+        sys.exit(1)
+    print("\nEvery users lookup is served by an index")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--dsn', default=os.getenv('DATABASE_URL'))
+    parser.add_argument('--users', type=int, default=1_000_000)
+    parser.add_argument('--schema', default='explain_check')
+    parser.add_argument('--keep', action='store_true', help='leave the seeded schema in place')
+    main(parser.parse_args())
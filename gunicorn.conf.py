@@ -0,0 +1,72 @@
+import os
+import multiprocessing
+from dotenv import load_dotenv
+
+#───────────────────────────────────────────────────────────────────────────────────────────────────────────────────
+# Production server settings, read by `gunicorn run:app` (picked up from the working directory)
+# and by `python run.py` outside development.
+#
+# The app is preloaded in the master, so imported modules and the calibrated bcrypt cost are
+# shared copy-on-write. Anything that owns a thread, socket or child process is started per
+# worker in post_fork. The chat gateway, mail queue, bcrypt pool and DB pool already check
+# os.getpid() for this.
+#
+# Graceful reloads:
+#   kill -HUP <master>    restart workers with the new config (same preloaded code)
+#   kill -USR2 <master>   start a new master with new code, then `kill -QUIT <old master>`
+#───────────────────────────────────────────────────────────────────────────────────────────────────────────────────
+if not os.environ.get('DOTENV_LOADED'):  # `python run.py` has already read it
+    load_dotenv()
+    os.environ['DOTENV_LOADED'] = '1'
+
+bind = f"0.0.0.0:{os.getenv('PORT', 5000)}"
+workers = int(os.getenv('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+threads = int(os.getenv('GUNICORN_THREADS', 4))
+preload_app = os.getenv('GUNICORN_PRELOAD', 'true').lower() == 'true'
+
+# Keep-alive: long enough to cover a page and its static assets, short enough not to pin threads
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', 5))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', 30))
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 2000))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', 200))
+backlog = int(os.getenv('GUNICORN_BACKLOG', 2048))
+
+accesslog = os.getenv('GUNICORN_ACCESS_LOG')  # unset: no per-request access log line
+errorlog = '-'
+loglevel = os.getenv('GUNICORN_LOG_LEVEL', 'info')
+
+# Render terminates TLS at its proxy. Locally, serve HTTPS with the certs/ pair when it exists.
+_certs = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'certs')
+if os.getenv('RENDER') is None and os.getenv('LOCAL_TLS', 'true').lower() == 'true':
+    if os.path.exists(os.path.join(_certs, 'server.crt')) and os.path.exists(os.path.join(_certs, 'server.key')):
+        certfile = os.path.join(_certs, 'server.crt')
+        keyfile = os.path.join(_certs, 'server.key')
+else:
+    forwarded_allow_ips = os.getenv('FORWARDED_ALLOW_IPS', '*')
+
+# The preloaded master must not bind the chat or notification ports itself; each worker starts its own
+os.environ.setdefault('CHAT_AUTOSTART', 'false' if preload_app else 'true')
+os.environ.setdefault('NOTIFY_SSE_AUTOSTART', 'false' if preload_app else 'true')
+os.environ.setdefault('MAIL_QUEUE_AUTOSTART', 'false' if preload_app else 'true')
+
+
+def post_fork(server, worker):
+    from app.extensions.chat import chat
+    from app.extensions.notifications import notifications
+    from app.extensions.event_bus import event_bus
+    from app.extensions.mail_queue import mail_queue
+    if chat.app is not None and chat.app.config['CHAT_ENABLED']:
+        chat.start()
+    if notifications.app is not None and notifications.app.config['NOTIFY_SSE_ENABLED']:
+        notifications.start()
+    event_bus.start()  # no-op when disabled or nothing subscribed
+    mail_queue.start()  # picks up mail left in the outbox by the previous workers
+
+
+def post_worker_init(worker):
+    # After the worker has the app, preloaded or not: open DB_POOL_MIN connections in the process that uses them
+    pool = getattr(worker.wsgi, 'extensions', {}).get('db_pool')
+    if pool is not None:
+        pool.warm()
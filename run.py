@@ -1,28 +1,42 @@
-from dotenv import load_dotenv
-from app.__bridge__ import create_app
 import os
-
+import sys
 from dotenv import load_dotenv
-load_dotenv()
+
+# .env is read once per process tree: here, or in gunicorn.conf.py when gunicorn is started directly.
+# The app modules never read it themselves.
+if not os.environ.get('DOTENV_LOADED'):
+    load_dotenv()
+    os.environ['DOTENV_LOADED'] = '1'
+
+#───────────────────────────────────────────────────────────────────────────────────────────────────────────────────
+# python run.py                        production: gunicorn with gunicorn.conf.py (workers, preload, TLS)
+# FLASK_ENV=development python run.py  Werkzeug dev server with the debugger and reloader
+# gunicorn run:app                     same as production, for platforms that run gunicorn directly
+#───────────────────────────────────────────────────────────────────────────────────────────────────────────────────
+DEVELOPMENT = os.getenv('FLASK_ENV') == 'development'
+
+if __name__ == "__main__" and not DEVELOPMENT:
+    # Hand over to gunicorn before building an app here; the master imports run:app itself
+    from gunicorn.app.wsgiapp import run as gunicorn
+    sys.argv = [sys.argv[0], '--config', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'gunicorn.conf.py'),
+                'run:app', *sys.argv[1:]]
+    sys.exit(gunicorn())
+
+from app.__bridge__ import create_app
 
 # Create the app
 app = create_app()
 
 
 if __name__ == "__main__":
-    
-    # Check if we're in a production environment on Render
-    if os.getenv('RENDER') is None:  # Not on Render, use SSL locally
-        cert_path = os.path.join(os.getcwd(), 'certs', 'server.crt')
-        key_path = os.path.join(os.getcwd(), 'certs', 'server.key')
-
-        if os.path.exists(cert_path) and os.path.exists(key_path):
-            print("SSL certificates found. Starting app with SSL.")
-            app.run(debug=True, host='0.0.0.0', port=5000, ssl_context=(cert_path, key_path))
-        else:
-            print("SSL certificates not found. Starting app without SSL.")
-            app.run(debug=True, host='0.0.0.0', port=5000)
-    else:  # On Render, don't use SSL manually
-        print("Running on Render. Starting app without SSL.")
-        app.run(debug=True, host='0.0.0.0', port=5000)
-#───────────────────────────────────────────────────────────────────────────────────────────────────────────────────S
\ No newline at end of file
+    port = int(os.getenv('PORT', 5000))
+    cert_path = os.path.join(os.getcwd(), 'certs', 'server.crt')
+    key_path = os.path.join(os.getcwd(), 'certs', 'server.key')
+
+    if os.getenv('LOCAL_TLS', 'true').lower() == 'true' and os.path.exists(cert_path) and os.path.exists(key_path):
+        print("SSL certificates found. Starting dev server with SSL.")
+        app.run(debug=True, host='0.0.0.0', port=port, ssl_context=(cert_path, key_path))
+    else:
+        print("Starting dev server without SSL.")
+        app.run(debug=True, host='0.0.0.0', port=port)
+#───────────────────────────────────────────────────────────────────────────────────────────────────────────────────
@@ -0,0 +1,51 @@
+from datetime import datetime, timedelta, timezone
+from flask import Flask
+from app.extensions.analytics import Analytics
+
+
+class Cursor:
+    def __init__(self, results):
+        self.results = results
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=None):
+        pass
+
+    def fetchall(self):
+        return self.results.pop(0)
+
+
+class Pool:
+    def __init__(self, *results):
+        self.results = list(results)
+
+    def getconn(self):
+        return self
+
+    def putconn(self, conn):
+        pass
+
+    def cursor(self):
+        return Cursor(self.results)
+
+
+def test_rows_after_today_are_skipped():
+    today = datetime.now(timezone.utc).date()
+    row = {'method': 'password', 'signups': 2, 'verifications': 1, 'logins': 5}
+    app = Flask(__name__)
+    app.extensions['db_pool'] = Pool(
+        [dict(row, day=today), dict(row, day=today + timedelta(days=1))],  # database clock ahead
+        [{'method': 'password', 'users': 4, 'verified': 2}],
+    )
+    report = Analytics(app).report(7)
+
+    assert report['days'][-1] == today.isoformat()
+    assert report['signups']['password'][-1] == 2
+    assert sum(report['signups']['password']) == 2
+    assert report['totals']['users'] == 4
+
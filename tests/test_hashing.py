@@ -0,0 +1,28 @@
+import bcrypt
+from flask import Flask
+from app.extensions.hashing import PasswordHasher
+
+
+def make_hasher(rounds):
+    app = Flask(__name__)
+    app.config['BCRYPT_ROUNDS'] = rounds
+    return PasswordHasher(app)
+
+
+def stored(rounds):
+    return bcrypt.hashpw(b'secret', bcrypt.gensalt(rounds)).decode()
+
+
+def test_lower_cost_is_upgraded():
+    assert make_hasher(6).needs_rehash(stored(5))
+
+
+def test_same_or_higher_cost_is_kept():
+    # Workers calibrated to different costs must not rewrite each other's hashes
+    hasher = make_hasher(6)
+    assert not hasher.needs_rehash(stored(6))
+    assert not hasher.needs_rehash(stored(7))
+
+
+def test_non_bcrypt_value_is_left_alone():
+    assert not make_hasher(6).needs_rehash('not-a-hash')
@@ -0,0 +1,36 @@
+import pytest
+from flask import Flask
+from app.extensions.mail_queue import MailQueue
+
+
+def make_queue(path, autostart=False):
+    app = Flask(__name__)
+    app.config.update(MAIL_QUEUE_PATH=str(path), MAIL_QUEUE_AUTOSTART=autostart)
+    return MailQueue(app)
+
+
+@pytest.fixture
+def started(monkeypatch):
+    calls = []
+    monkeypatch.setattr(MailQueue, '_ensure_worker', lambda self: calls.append(self))
+    return calls
+
+
+def test_pending_mail_starts_the_worker_in_the_next_process(tmp_path, started):
+    path = tmp_path / 'outbox.sqlite3'
+    make_queue(path).enqueue('Verify your email', 'Click the link.', 'a@example.com')
+    started.clear()
+
+    queue = make_queue(path, autostart=True)
+    assert started == [queue]
+
+
+def test_empty_outbox_starts_nothing(tmp_path, started):
+    make_queue(tmp_path / 'outbox.sqlite3', autostart=True)
+    assert started == []
+
+
+def test_duplicate_reset_is_queued_once(tmp_path, started):
+    queue = make_queue(tmp_path / 'outbox.sqlite3')
+    sent = [queue.enqueue('Reset', 'Click.', 'a@example.com', dedup_key='reset:a') for _ in range(3)]
+    assert sent == [True, False, False]
@@ -0,0 +1,67 @@
+from flask import Flask, session
+from werkzeug.test import Client
+from app.extensions.sessions import ServerSessions
+
+
+def make_client():
+    app = Flask(__name__)
+    app.secret_key = 'test'
+    app.config['SESSION_BACKEND'] = 'memory'
+    ServerSessions(app)
+
+    @app.route('/visit')
+    def visit():
+        session['theme'] = 'dark'
+        return ''
+
+    @app.route('/login/<int:user_id>')
+    def login(user_id):
+        session['user_id'] = user_id
+        return ''
+
+    @app.route('/logout')
+    def logout():
+        session.clear()
+        return ''
+
+    @app.route('/whoami')
+    def whoami():
+        return str(session.get('user_id'))
+
+    return Client(app)
+
+
+def cookie(client):
+    found = client.get_cookie('session')
+    return found.value if found is not None else None
+
+
+def sid(value):
+    return value.split('.')[0]
+
+
+def test_login_issues_a_new_session_id():
+    client = make_client()
+    client.get('/visit')
+    before = cookie(client)
+    client.get('/login/7')
+    after = cookie(client)
+    assert sid(after) != sid(before)
+    assert client.get('/whoami').get_data(as_text=True) == '7'
+
+
+def test_planted_session_id_stops_working_after_login():
+    victim = make_client()
+    victim.get('/visit')
+    planted = cookie(victim)
+    victim.get('/login/7')
+
+    victim.set_cookie('session', planted)
+    assert victim.get('/whoami').get_data(as_text=True) == 'None'
+
+
+def test_logout_deletes_the_cookie():
+    client = make_client()
+    client.get('/login/7')
+    client.get('/logout')
+    assert cookie(client) is None